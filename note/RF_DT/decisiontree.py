@@ -1,4 +1,5 @@
 # Decision Tree Regressor
+import os
 import numpy as np
 
 class RegressorNode:
@@ -21,81 +22,287 @@ class RegressorNode:
         self.left_child  = left_child
         self.right_child = right_child
 
+class FlatTree:
+    """ 以并列数组表示的决策树（可以包含多棵树，此时预测值为各棵树的平均值）
+
+    第 i 个节点的信息为 feature[i], threshold[i], left[i], right[i], value[i]，
+    feature[i] == -1 表示叶节点。roots 为每棵树根节点的下标。
+    x < threshold 的样本进入左子树，其余（包括 x == threshold）进入右子树，与训练时的划分相同；
+    最初的逐个比较实现中等于阈值的样本不进入任何子树，预测值为 0。
+    """
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+    def __init__(self, feature, threshold, left, right, value, roots=None):
+        self.feature   = feature
+        self.threshold = threshold
+        self.left      = left
+        self.right     = right
+        self.value     = value
+        self.roots     = np.zeros(1, dtype=np.int32) if roots is None else roots
+
+    @classmethod
+    def fromNode(cls, root:RegressorNode):
+        """ 将以 RegressorNode 链接而成的决策树编译为并列数组 """
+        nodes = []
+        stack = [root]
+        while len(stack) > 0:  # 先序遍历，为每个节点分配下标
+            node = stack.pop()
+            nodes.append(node)
+            if node.left_child is not None:
+                stack.append(node.right_child)
+                stack.append(node.left_child)
+        index = {id(node): i for i, node in enumerate(nodes)}
+
+        n = len(nodes)
+        feature   = np.full(n, -1, dtype=np.int32)
+        threshold = np.full(n, np.nan)
+        left      = np.full(n, -1, dtype=np.int32)
+        right     = np.full(n, -1, dtype=np.int32)
+        value     = np.full(n, np.nan)
+        for i, node in enumerate(nodes):
+            if node.left_child is None:  # 叶节点（无样本的叶节点不可能被访问到，值保持为 nan）
+                if node.value is not None:
+                    value[i] = node.value
+            else:
+                feature[i]   = node.feature_idx
+                threshold[i] = node.value
+                left[i]      = index[id(node.left_child)]
+                right[i]     = index[id(node.right_child)]
+
+        return cls(feature, threshold, left, right, value)
+
+    @classmethod
+    def concat(cls, trees:list):
+        """ 将多棵树合并到同一组数组中，用于一次性预测整个森林 """
+        offsets = np.cumsum([0] + [len(tree.feature) for tree in trees])
+        shift   = lambda arr, offset: np.where(arr >= 0, arr + offset, -1).astype(np.int32)
+        return cls(
+            np.concatenate([tree.feature for tree in trees]),
+            np.concatenate([tree.threshold for tree in trees]),
+            np.concatenate([shift(tree.left, offset) for tree, offset in zip(trees, offsets)]),
+            np.concatenate([shift(tree.right, offset) for tree, offset in zip(trees, offsets)]),
+            np.concatenate([tree.value for tree in trees]),
+            np.concatenate([tree.roots + offset for tree, offset in zip(trees, offsets)]).astype(np.int32)
+        )
+
+    def predict(self, x) -> np.ndarray:
+        """ 逐层将整批样本路由到叶节点，每层只需要几次数组运算
+
+        returned value:
+            返回预测结果，一个行向量
+        """
+        x = np.asarray(x, dtype=float)
+        n = x.shape[0]
+        node   = np.repeat(self.roots.astype(np.intp), n)  # 每棵树、每个样本当前所在的节点
+        sample = np.tile(np.arange(n), len(self.roots))
+        active = np.flatnonzero(self.feature[node] >= 0)
+        while len(active) > 0:
+            cur     = node[active]
+            go_left = x[sample[active], self.feature[cur]] < self.threshold[cur]
+            node[active] = np.where(go_left, self.left[cur], self.right[cur])
+            active  = active[self.feature[node[active]] >= 0]
+
+        return self.value[node].reshape(len(self.roots), n).mean(axis=0)
+
+    def save(self, path:str):
+        """ 将各数组分别保存为 path 目录下的 .npy 文件 """
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f'{name}.npy'), getattr(self, name))
+
+    @classmethod
+    def load(cls, path:str, mmap_mode:str='r'):
+        """ 加载 save 保存的决策树，默认以内存映射方式加载，不复制数据 """
+        return cls(*(np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in cls.ARRAYS))
+
 class DecisionTreeRegressor:
     """ 回归决策树 """
 
-    def __init__(self, max_depth:int=None, min_samples_leaf:int=None):
+    def __init__(self, max_depth:int=None, min_samples_leaf:int=None, n_bins:int=None,
+                 max_features=None, random_state=None):
         """ 初始化决策树（设置超参数的值）
 
         parameter:
             1. max_depth        : 决策树最大深度
             2. min_samples_leaf : 叶节点最小样本数
+            3. n_bins           : 分箱数。为 None 时使用精确划分；
+                                  否则先将每个特征量化为至多 n_bins 个箱，再基于直方图寻找划分（适用于样本量很大的情况）
+            4. max_features     : 每次划分时随机选取的特征个数，可以为整数、比例、'sqrt'、'log2'，为 None 时使用全部特征
+            5. random_state     : 随机选取特征时使用的随机数种子
         """
         self.max_depth        = max_depth
         self.min_samples_leaf = min_samples_leaf
+        self.n_bins           = n_bins
+        self.max_features     = max_features
+        self.random_state     = random_state
 
-    def fit(self, x:list, y:list):
+    def fit(self, x:list, y:list, sample_idx:np.ndarray=None, sorted_idx:np.ndarray=None):
         """ 使用训练集拟合回归决策树
 
         parameter:
-            1. x: 训练集数据（二维列表，x[i] 表示第 i 个样本，x[i][j] 表示第 i 个样本的第 j 个特征）
-            2. y: 训练数据像集（y[i] 表示第 i 个样本的像）
+            1. x          : 训练集数据（二维列表，x[i] 表示第 i 个样本，x[i][j] 表示第 i 个样本的第 j 个特征）
+            2. y          : 训练数据像集（y[i] 表示第 i 个样本的像）
+            3. sample_idx : 参与训练的样本下标（可以重复，如自助抽样的结果），为 None 时使用全部样本
+            4. sorted_idx : 全部样本按各特征排序后的下标 np.argsort(x, axis=0).T，
+                            可由多棵树共享，避免每棵树重新排序
         """
-        x = np.array(x)
-        y = np.array(y)
-        self.root = self.buildTree(x, y, 0)
-
-    def buildTree(self, x:list, y:list, depth:int) -> RegressorNode:
-        """ 根据训练数据递归构建回归决策树
-
-        parameter:
-            1. x     : 样本特征
-            2. y     : 样本真值
-            3. depth : 决策树深度
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.rng = np.random.default_rng(self.random_state)
+        self.n_split_features = self.maxFeatures(x.shape[1])
+        if self.n_bins is None:
+            # 每个特征只在根节点排序一次，划分子集时保持各特征的有序性，不再重复排序
+            if sorted_idx is None:
+                sorted_idx = np.argsort(x, axis=0, kind='stable').T
+            if sample_idx is not None:
+                # 按每个样本被抽中的次数重复其下标，得到的各行仍然有序
+                counts     = np.bincount(sample_idx, minlength=len(y))
+                sorted_idx = np.repeat(sorted_idx.ravel(), counts[sorted_idx.ravel()]).reshape(x.shape[1], -1)
+            self.root = self.buildTree(x, y, sorted_idx, 0)
+        else:
+            idx = np.arange(len(y)) if sample_idx is None else np.asarray(sample_idx)
+            self.bin_edges = self.calcBinEdges(x)
+            self.root      = self.buildHistTree(self.binning(x), y, idx, 0)
+        self.tree = FlatTree.fromNode(self.root)
+
+    def maxFeatures(self, n_features:int) -> int:
+        """ 根据 max_features 计算每次划分时使用的特征个数 """
+        if self.max_features is None:
+            return n_features
+        if self.max_features == 'sqrt':
+            return max(1, int(np.sqrt(n_features)))
+        if self.max_features == 'log2':
+            return max(1, int(np.log2(n_features)))
+        if isinstance(self.max_features, float):
+            return max(1, int(self.max_features * n_features))
+        return min(n_features, self.max_features)
+
+    def splitFeatures(self, n_features:int) -> np.ndarray:
+        """ 随机选取一次划分中使用的特征（升序排列，保证均方误差相同时仍取下标最小的特征） """
+        if self.n_split_features >= n_features:
+            return np.arange(n_features)
+        return np.sort(self.rng.choice(n_features, self.n_split_features, replace=False))
+
+    def leafValue(self, y:np.ndarray, depth:int) -> float:
+        """ 判断节点是否应为叶节点，是则返回叶节点的分类值，否则返回 None
 
         Tips:
             在回归决策树中，节点的值被设置为节点所拥有的样本的真值的均值
         """
-        node = RegressorNode()
-        # 递归终止条件
-        if len(y) == 0:  # 当没有样本时直接返回
-            return node  # 最后构建出来的应该是一个满二叉树，所以可能出现无样本的叶节点
-                         # 但是该叶节点不可能被访问到！
         y_unique = np.unique(y)  # 获取所有不同的真值
         if len(y_unique) == 1:   # 只存在一种真值时，令其为分类值
-            node.value = y_unique[0]
-            return node
+            return y_unique[0]
         if self.max_depth is not None and depth >= self.max_depth:
-            node.value = np.average(y)  # 如果节点所在深度大于等于预设的最大值，则令其为叶节点，并设置分类值为所有样本的均值
-            return node
+            return np.average(y)  # 如果节点所在深度大于等于预设的最大值，则令其为叶节点，并设置分类值为所有样本的均值
         if self.min_samples_leaf is not None and len(y) <= self.min_samples_leaf:
-            node.value = np.average(y)  # 如果节点的样本数少于等于预设的最小值，则令其为叶节点，并设置分类值为所有样本的均值
+            return np.average(y)  # 如果节点的样本数少于等于预设的最小值，则令其为叶节点，并设置分类值为所有样本的均值
+        return None
+
+    def buildTree(self, x:np.ndarray, y:np.ndarray, sorted_idx:np.ndarray, depth:int) -> RegressorNode:
+        """ 根据训练数据递归构建回归决策树
+
+        parameter:
+            1. x          : 全部样本特征
+            2. y          : 全部样本真值
+            3. sorted_idx : 当前节点的样本下标，sorted_idx[j] 为按第 j 个特征升序排列的样本下标
+            4. depth      : 决策树深度
+        """
+        node = RegressorNode()
+        # 递归终止条件
+        if sorted_idx.shape[1] == 0:  # 当没有样本时直接返回
+            return node               # 最后构建出来的应该是一个满二叉树，所以可能出现无样本的叶节点
+                                      # 但是该叶节点不可能被访问到！
+        y_node = y[sorted_idx[0]]
+        value  = self.leafValue(y_node, depth)
+        if value is not None:
+            node.value = value
             return node
 
         # 计算中间节点的参数
-        min_mse         = np.inf     # 均方误差最小值
-        min_feature_idx = None       # 使得均方误差最小的特征的索引值
-        min_threshold   = None       # 使得均方误差最小的特征的划分阈值
-        for i in range(x.shape[1]):  # 寻找使得均方误差最小的特征及划分阈值
-            mse, threshold = self.calcMse(x[:, i], y)
-            if min_mse > mse:
-                min_mse         = mse
-                min_feature_idx = i
-                min_threshold   = threshold
+        n_features = sorted_idx.shape[0]
+        features   = self.splitFeatures(n_features)
+        min_mse, min_feature_idx, min_threshold = self.findBestSplit(x, y_node, y, sorted_idx, features)
+        if min_feature_idx is None and len(features) < n_features:  # 随机选出的特征都无法划分时改用全部特征
+            min_mse, min_feature_idx, min_threshold = self.findBestSplit(x, y_node, y, sorted_idx)
+        if min_feature_idx is None:  # 所有特征的取值都相同，无法继续划分
+            node.value = np.average(y_node)
+            return node
 
         node.mse         = min_mse
         node.feature_idx = min_feature_idx
         node.value       = min_threshold
 
-        # print(min_threshold)
-
-        x_lt             = x[:, min_feature_idx] < min_threshold
-        x_gt             = x[:, min_feature_idx] > min_threshold
-        node.left_child  = self.buildTree(x[x_lt,:], y[x_lt], depth + 1)
-        node.right_child = self.buildTree(x[x_gt,:], y[x_gt], depth + 1)
+        # 划分后每个特征的样本下标仍然有序，且每一行落入左子树的样本数相同
+        # 阈值为两个相邻取值的均值，只有两者在浮点数上相邻时才可能与其中一个相等，此时该样本划入右子树
+        x_lt             = x[sorted_idx, min_feature_idx] < min_threshold
+        node.left_child  = self.buildTree(x, y, sorted_idx[x_lt].reshape(n_features, -1), depth + 1)
+        node.right_child = self.buildTree(x, y, sorted_idx[~x_lt].reshape(n_features, -1), depth + 1)
 
         return  node
 
+    def findBestSplit(self, x:np.ndarray, y_node:np.ndarray, y:np.ndarray, sorted_idx:np.ndarray,
+                      features:np.ndarray=None) -> tuple:
+        """ 在 features 中寻找使得均方误差最小的特征及划分阈值（features 为 None 时使用全部特征）
+
+        returned value:
+            tuple(最小均方误差, 特征下标, 划分阈值)，无法划分时特征下标与阈值为 None
+        """
+        if features is None:
+            features = np.arange(sorted_idx.shape[0])
+        rows = sorted_idx[features]
+        xs   = x[rows, features[:, None]]     # 每一行都是升序排列的特征取值
+        ys   = y[rows] - np.average(y_node)  # 先中心化，减小累加和相减时的舍入误差
+        mse  = self.scoreSplits(xs, ys)
+        if not np.isfinite(mse).any():
+            return np.inf, None, None
+
+        # 与逐个比较相同：均方误差相同时取下标最小的特征和最小的阈值
+        row, pos  = self.firstMin(mse, np.sum(ys ** 2))
+        threshold = (xs[row, pos] + xs[row, pos + 1]) / 2
+        return mse[row, pos], int(features[row]), threshold
+
+    @staticmethod
+    def firstMin(mse:np.ndarray, scale:float) -> tuple:
+        """ 按行优先的顺序（先特征、后阈值）返回第一个与最小值相等的位置
+
+        不同特征的累加顺序不同，相同划分的均方误差可能只在最后几位上不同，直接使用 np.argmin 时
+        会随舍入误差选中后面的特征，因此与最小值的差在舍入误差以内（np.isclose）即视为相等。
+
+        parameter:
+            1. mse  : 候选划分的均方误差，np.inf 表示不能划分
+            2. scale: 节点中心化后真值的平方和，作为绝对误差的尺度
+        """
+        close = np.isclose(mse, mse.min(), rtol=1e-9, atol=1e-12 * scale)
+        return np.unravel_index(np.argmax(close), mse.shape)
+
+    @staticmethod
+    def scoreSplits(xs:np.ndarray, ys:np.ndarray) -> np.ndarray:
+        """ 利用累加和一次性计算所有候选划分的均方误差
+
+        parameter:
+            1. xs: 二维数组，每一行是升序排列的某个特征的取值
+            2. ys: 与 xs 对应的样本真值
+
+        returned value:
+            mse[j, k] 表示以第 j 个特征的第 k 与第 k + 1 个取值的均值为阈值划分时的均方误差，
+            相邻取值相同（没有划分阈值）时为 np.inf
+        """
+        n     = xs.shape[1]
+        s     = np.cumsum(ys, axis=1)
+        s2    = np.cumsum(ys ** 2, axis=1)
+        n_lt  = np.arange(1, n)
+        n_gt  = n - n_lt
+        s_lt, s2_lt = s[:, :-1], s2[:, :-1]
+        s_gt, s2_gt = s[:, -1:] - s_lt, s2[:, -1:] - s2_lt
+
+        left_mse  = s2_lt - s_lt ** 2 / n_lt
+        right_mse = s2_gt - s_gt ** 2 / n_gt
+        # 以划分后左右字节点的 MSE 的加权平均作为该节点的 MSE
+        mse = n_lt / n * left_mse + n_gt / n * right_mse
+        mse[xs[:, :-1] == xs[:, 1:]] = np.inf  # 对于相同的两个 x 值不设划分阈值
+        return mse
+
     def calcMiddle(self, x:list) -> list:
         """ 计算连续型特征的俩俩均值
 
@@ -103,22 +310,10 @@ class DecisionTreeRegressor:
             1. x: 一维列表，在测试节点中只测试一个特征的取值，
                   因此我们只需要计算一个特征对应的所有可能取值的中值
                   并用该中值来划分数据集
-
-        Tips: 该函数用于 calcMse 函数中确定连续型随机变量的所有可能的划分阈值
         """
-        x = np.array(x)
-        x = np.sort(x)  # 对 x 进行排序，方便计算相邻两个取值的均值
-        if len(x) == 0:
-            return np.array([])
-
-        middle = np.array([])
-        for i in range(len(x) - 1):  # 能进入该函数计算的 x 的长度一定大于 1
-            if x[i] == x[i + 1]:     # 对于相同的两个 x 值不设划分阈值
-                continue
-            middle = np.append(middle, (x[i] + x[i + 1]) / 2)
-
-        return middle  # 如果 len(np.unique(x)) == 1，则无法用来获取任何信息，
-                       # 此时 middle 为空，符合预期
+        x = np.sort(np.asarray(x))
+        distinct = x[:-1] != x[1:]  # 对于相同的两个 x 值不设划分阈值
+        return (x[:-1][distinct] + x[1:][distinct]) / 2
 
     def calcMse(self, x:list, y:list) -> tuple:
         """ 计算样本的均方误差
@@ -128,25 +323,115 @@ class DecisionTreeRegressor:
             2. y: 样本真值集，一维列表
 
         returned value:
-            返回一个 tuple(float, float)，其中 tuple[0] 为最小的均方误差
+            返回一个 tuple(float, float)，其中 tuple[0] 为最小的均方误差，tuple[1] 为对应的划分阈值
+        """
+        x, y  = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        order = np.argsort(x, kind='stable')
+        xs    = x[order][None, :]
+        ys    = (y[order] - np.average(y))[None, :]
+        mse   = self.scoreSplits(xs, ys)[0]
+        if not np.isfinite(mse).any():
+            return np.inf, np.inf
+
+        pos, = self.firstMin(mse, np.sum(ys ** 2))
+        return mse[pos], (xs[0, pos] + xs[0, pos + 1]) / 2
+
+    def calcBinEdges(self, x:np.ndarray) -> list:
+        """ 计算每个特征的分箱边界
+
+        Tips:
+            不同取值不超过 n_bins 个的特征以相邻取值的均值为边界（与精确划分等价），
+            否则以分位数为边界。第 k 个箱表示 bin_edges[k - 1] <= x < bin_edges[k]
         """
-        middle    = self.calcMiddle(x)
+        bin_edges = []
+        for j in range(x.shape[1]):
+            x_unique = np.unique(x[:, j])
+            if len(x_unique) <= self.n_bins:
+                edges = (x_unique[:-1] + x_unique[1:]) / 2
+            else:
+                edges = np.unique(np.quantile(x[:, j], np.linspace(0, 1, self.n_bins + 1)[1:-1]))
+            bin_edges.append(edges)
+        return bin_edges
+
+    def binning(self, x:np.ndarray) -> np.ndarray:
+        """ 将样本特征量化为箱编号 """
+        codes = np.empty(x.shape, dtype=np.min_scalar_type(self.n_bins - 1))
+        for j, edges in enumerate(self.bin_edges):
+            codes[:, j] = np.searchsorted(edges, x[:, j], side='right')
+        return codes
+
+    def buildHistTree(self, codes:np.ndarray, y:np.ndarray, idx:np.ndarray, depth:int) -> RegressorNode:
+        """ 分箱模式下根据训练数据递归构建回归决策树
+
+        parameter:
+            1. codes : 全部样本的箱编号
+            2. y     : 全部样本真值
+            3. idx   : 当前节点的样本下标
+            4. depth : 决策树深度
+        """
+        node = RegressorNode()
+        if len(idx) == 0:
+            return node
+        y_node = y[idx]
+        value  = self.leafValue(y_node, depth)
+        if value is not None:
+            node.value = value
+            return node
+
+        n_features = codes.shape[1]
+        features   = self.splitFeatures(n_features)
+        min_mse, min_feature_idx, min_bin = self.findBestHistSplit(codes[idx[:, None], features], y_node)
+        if min_feature_idx is None and len(features) < n_features:  # 随机选出的特征都无法划分时改用全部特征
+            features = np.arange(n_features)
+            min_mse, min_feature_idx, min_bin = self.findBestHistSplit(codes[idx], y_node)
+        if min_feature_idx is None:
+            node.value = np.average(y_node)
+            return node
 
-        min_mse   = np.inf
-        threshold = np.inf
-        for i in range(len(middle)):
-            y_lt      = y[x < middle[i]]
-            left_mse  = np.sum((y_lt - np.average(y_lt)) ** 2)
-            y_gt      = y[x > middle[i]]
-            right_mse = np.sum((y_gt - np.average(y_gt)) ** 2)
+        min_feature_idx  = int(features[min_feature_idx])
+        node.mse         = min_mse
+        node.feature_idx = min_feature_idx
+        node.value       = self.bin_edges[min_feature_idx][min_bin]  # 箱编号 <= min_bin 等价于 x < 该边界
+
+        x_lt             = codes[idx, min_feature_idx] <= min_bin
+        node.left_child  = self.buildHistTree(codes, y, idx[x_lt], depth + 1)
+        node.right_child = self.buildHistTree(codes, y, idx[~x_lt], depth + 1)
 
-            # 以划分后左右字节点的 MSE 的加权平均作为该节点的 MSE
-            mse = len(y_lt) / len(y) * left_mse + len(y_gt) / len(y) * right_mse
-            if min_mse > mse:
-                min_mse   = mse
-                threshold = middle[i]
+        return node
 
-        return min_mse, threshold
+    def findBestHistSplit(self, codes:np.ndarray, y:np.ndarray) -> tuple:
+        """ 基于直方图寻找使得均方误差最小的特征及划分的箱
+
+        parameter:
+            1. codes: 当前节点样本的箱编号，二维数组
+            2. y    : 当前节点样本的真值
+
+        returned value:
+            tuple(最小均方误差, 特征下标, 箱编号)，无法划分时特征下标与箱编号为 None
+        """
+        n, n_features = codes.shape
+        n_bins = self.n_bins
+        flat   = (codes.astype(np.intp) + np.arange(n_features) * n_bins).ravel()
+        yc     = np.repeat(y - np.average(y), n_features)
+
+        cnt = np.bincount(flat, minlength=n_features * n_bins).reshape(n_features, n_bins)
+        s   = np.bincount(flat, weights=yc, minlength=n_features * n_bins).reshape(n_features, n_bins)
+        s2  = np.bincount(flat, weights=yc ** 2, minlength=n_features * n_bins).reshape(n_features, n_bins)
+
+        # 箱编号 <= k 的样本划入左子树
+        n_lt, s_lt, s2_lt = (np.cumsum(h, axis=1)[:, :-1] for h in (cnt, s, s2))
+        n_gt  = n - n_lt
+        s_gt  = s.sum(axis=1, keepdims=True) - s_lt
+        s2_gt = s2.sum(axis=1, keepdims=True) - s2_lt
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mse = n_lt / n * (s2_lt - s_lt ** 2 / n_lt) + n_gt / n * (s2_gt - s_gt ** 2 / n_gt)
+        mse[(n_lt == 0) | (n_gt == 0)] = np.inf
+        if not np.isfinite(mse).any():
+            return np.inf, None, None
+
+        feature_idx, bin_idx = self.firstMin(mse, s2[0].sum())
+        return mse[feature_idx, bin_idx], int(feature_idx), int(bin_idx)
 
     def predict(self, x:list) -> list:
         """ 用拟合好的回归决策树进行预测
@@ -157,25 +442,34 @@ class DecisionTreeRegressor:
         returned value:
             返回预测结果，一个行向量
         """
-        y = np.zeros(x.shape[0])
-
-        stack = [(self.root, [i for i in range(len(x))])]
-        while len(stack) > 0:
-            node, x_idx = stack.pop()
-            if node.left_child is None and node.right_child is None:
-                y[x_idx] = node.value
-                continue
-            # 注意决策树是一棵满二叉树！
-            x_lt_idx = [idx for idx in x_idx if x[idx][node.feature_idx] < node.value]
-            x_gt_idx = [idx for idx in x_idx if x[idx][node.feature_idx] > node.value]
-            if len(x_lt_idx) > 0:
-                stack.append((node.left_child, x_lt_idx))
-            if len(x_gt_idx) > 0:
-                stack.append((node.right_child, x_gt_idx))
-
-        return y
+        return self.tree.predict(x)
+
+    def save(self, path:str):
+        """ 保存编译后的决策树 """
+        self.tree.save(path)
+
+    @classmethod
+    def load(cls, path:str, mmap_mode:str='r'):
+        """ 加载 save 保存的决策树（只能用于预测） """
+        model      = cls()
+        model.root = None
+        model.tree = FlatTree.load(path, mmap_mode)
+        return model
 
 if __name__ == "__main__":
+    # 真值只有几种取值时，多个特征可以给出同一个最优划分，它们的均方误差只有舍入误差，
+    # 应当与逐个比较一样选中下标最小的特征
+    for seed in range(50):
+        rng   = np.random.default_rng(seed)
+        y_tie = rng.choice([0.1, 0.2, 1.3], 300)
+        x_tie = np.column_stack([(y_tie > 1) * 4 + rng.integers(0, 4, 300) for _ in range(4)]).astype(float)
+        tie   = DecisionTreeRegressor(max_depth=1)
+        _, feature_idx, threshold = tie.findBestSplit(x_tie, y_tie, y_tie, np.argsort(x_tie, axis=0, kind='stable').T)
+        assert feature_idx == 0 and threshold == tie.calcMse(x_tie[:, 0], y_tie)[1]
+        tie = DecisionTreeRegressor(max_depth=1, n_bins=16)
+        tie.fit(x_tie, y_tie)
+        assert tie.root.feature_idx == 0
+
     from sklearn.datasets import fetch_california_housing
     from sklearn.model_selection import train_test_split
     from sklearn.tree import DecisionTreeRegressor as BenchmarkModel
@@ -207,3 +501,11 @@ if __name__ == "__main__":
     mse    = mean_squared_error(y_test, y_pred)
     print('MSE:', mse)
     print(f"代码执行时间: {time.time() - start}秒")
+
+    start = time.time()
+    model = DecisionTreeRegressor(max_depth=5, n_bins=255)
+    model.fit(x_train, y_train)
+    y_pred = model.predict(x_test)
+    mse    = mean_squared_error(y_test, y_pred)
+    print('MSE (分箱):', mse)
+    print(f"代码执行时间: {time.time() - start}秒")
@@ -0,0 +1,425 @@
+# Histogram Gradient Boosting
+import heapq
+import os
+import numpy as np
+from decisiontree import FlatTree
+
+class HistogramBuilder:
+    """ 将特征一次性量化为 uint8 箱编号，并在箱编号上累加梯度 / 二阶导数直方图 """
+
+    def __init__(self, n_bins:int=255):
+        """
+        parameter:
+            1. n_bins : 箱数（含空值单独占用的最后一个箱），不超过 256，使箱编号可以用 uint8 保存
+        """
+        if not 2 <= n_bins <= 256:
+            raise ValueError("n_bins 需要在 2 到 256 之间")
+        self.n_bins = n_bins
+
+    def fit(self, x:np.ndarray):
+        """ 计算每个特征的分箱边界
+
+        Tips:
+            1. 与 DecisionTreeRegressor.calcBinEdges 相同：不同取值不超过 n_bins - 1 个的特征以相邻取值的均值为边界，
+               否则以分位数为边界。第 k 个箱表示 bin_edges[k - 1] <= x < bin_edges[k]
+            2. 空值（NaN）统一放入最后一个箱，相当于比所有取值都大，预测时 x < 阈值 为 False，同样进入右子树
+        """
+        self.bin_edges = []
+        for j in range(x.shape[1]):
+            values   = x[:, j][~np.isnan(x[:, j])]
+            x_unique = np.unique(values)
+            if len(x_unique) <= self.n_bins - 1:
+                edges = (x_unique[:-1] + x_unique[1:]) / 2
+            else:
+                edges = np.unique(np.quantile(values, np.linspace(0, 1, self.n_bins)[1:-1]))
+            self.bin_edges.append(edges)
+
+        # thresholds[j, k] 为 箱编号 <= k 等价的划分阈值 x < thresholds[j, k]，不存在时为 nan；
+        # k 为最后一个取值箱时阈值为 inf，即只把空值划入右子树
+        self.thresholds = np.full((x.shape[1], self.n_bins - 1), np.nan)
+        for j, edges in enumerate(self.bin_edges):
+            self.thresholds[j, :len(edges)] = edges
+            self.thresholds[j, len(edges)] = np.inf
+        return self
+
+    def binning(self, x:np.ndarray) -> np.ndarray:
+        """ 将样本特征量化为 (样本数, 特征数) 的 uint8 箱编号 """
+        codes = np.empty(x.shape, dtype=np.uint8)
+        for j, edges in enumerate(self.bin_edges):
+            codes[:, j] = np.searchsorted(edges, x[:, j], side='right')
+            codes[np.isnan(x[:, j]), j] = self.n_bins - 1
+        return codes
+
+    def histogram(self, codes:np.ndarray, g:np.ndarray, h:np.ndarray) -> np.ndarray:
+        """ 累加每个 (特征, 箱) 中样本的梯度、二阶导数和样本数
+
+        parameter:
+            1. codes : 节点中样本的箱编号，(样本数, 特征数)
+            2. g, h  : 节点中样本的梯度和二阶导数
+
+        returned value:
+            (3, 特征数, n_bins) 的数组，依次为梯度之和、二阶导数之和、样本数
+        """
+        n_features = codes.shape[1]
+        size = n_features * self.n_bins
+        flat = (codes + np.arange(0, size, self.n_bins, dtype=np.intp)).ravel()  # 所有特征的箱编号连续编号
+        hist = np.empty((3, n_features, self.n_bins))
+        hist[0] = np.bincount(flat, weights=np.repeat(g, n_features), minlength=size).reshape(n_features, -1)
+        hist[1] = np.bincount(flat, weights=np.repeat(h, n_features), minlength=size).reshape(n_features, -1)
+        hist[2] = np.bincount(flat, minlength=size).reshape(n_features, -1)
+        return hist
+
+class _Leaf:
+    """ 生长过程中的叶节点：样本下标、直方图以及最佳划分 """
+
+    def __init__(self, node:int, idx:np.ndarray, hist:np.ndarray, depth:int):
+        self.node  = node
+        self.idx   = idx
+        self.hist  = hist
+        self.depth = depth
+        self.gain  = -np.inf
+
+class GradientBoostingRegressor:
+    """ 基于直方图的梯度提升回归器（平方误差），按叶节点生长（与 LightGBM 相同），每棵树编译为 FlatTree """
+
+    def __init__(self, n_estimators:int=100, learning_rate:float=0.1, max_leaves:int=31, max_depth:int=None,
+                 min_samples_leaf:int=20, reg_lambda:float=0.0, min_split_gain:float=0.0,
+                 subsample:float=1.0, colsample:float=1.0, n_bins:int=255,
+                 early_stopping_rounds:int=None, eval_metric:str=None, random_state=None, verbose:int=0):
+        """ 初始化梯度提升模型（设置超参数的值）
+
+        parameter:
+            1. n_estimators          : 最多的提升轮数（树的棵数），对应 LightGBM 的 num_round
+            2. learning_rate         : 学习率，每棵树的输出乘以该系数
+            3. max_leaves            : 每棵树最多的叶节点数，对应 num_leaves
+            4. max_depth             : 树的最大深度，为 None 时不限制
+            5. min_samples_leaf      : 叶节点最少的样本数，对应 min_data_in_leaf
+            6. reg_lambda            : 叶节点取值的 L2 正则化系数，对应 lambda_l2
+            7. min_split_gain        : 划分所需的最小增益
+            8. subsample             : 每轮随机抽取的样本比例（不放回），对应 bagging_fraction
+            9. colsample             : 每棵树随机抽取的特征比例，对应 feature_fraction
+            10. n_bins               : 分箱数（不超过 256）
+            11. early_stopping_rounds: 给出验证集时，验证集上的指标连续这么多轮没有提升则停止训练
+            12. eval_metric          : 验证集上的指标，None 为损失函数，'auc' 为 ROC AUC（仅分类）
+            13. random_state         : 随机数种子
+            14. verbose              : 每隔 verbose 轮输出一次验证集上的指标，0 表示不输出
+        """
+        self.n_estimators          = n_estimators
+        self.learning_rate         = learning_rate
+        self.max_leaves            = max_leaves
+        self.max_depth             = max_depth
+        self.min_samples_leaf      = min_samples_leaf
+        self.reg_lambda            = reg_lambda
+        self.min_split_gain        = min_split_gain
+        self.subsample             = subsample
+        self.colsample             = colsample
+        self.n_bins                = n_bins
+        self.early_stopping_rounds = early_stopping_rounds
+        self.eval_metric           = eval_metric
+        self.random_state          = random_state
+        self.verbose               = verbose
+        self.trees                 = None
+        self.forest                = None
+
+    # 损失函数：平方误差。分类器中重写以下三个方法
+
+    def initScore(self, y:np.ndarray) -> float:
+        """ 所有样本的初始预测值 """
+        return float(np.mean(y))
+
+    def gradients(self, y:np.ndarray, raw:np.ndarray) -> tuple:
+        """ 损失函数对当前预测值的一阶导数和二阶导数 """
+        return raw - y, np.ones_like(raw)
+
+    def loss(self, y:np.ndarray, raw:np.ndarray) -> float:
+        return float(np.mean((raw - y) ** 2))
+
+    def score(self, y:np.ndarray, raw:np.ndarray) -> float:
+        """ 验证集上的指标，越小越好 """
+        return self.loss(y, raw)
+
+    def fit(self, x:list, y:list, eval_set:tuple=None):
+        """ 训练梯度提升模型
+
+        parameter:
+            1. x        : 训练集数据
+            2. y        : 训练集标签
+            3. eval_set : 验证集 (x_valid, y_valid)，用于提前停止；best_iteration 为验证集上指标最好的轮数，
+                          训练结束后只保留前 best_iteration 棵树
+
+        Tips:
+            1. 特征只在训练开始时量化一次，之后所有的树都在 uint8 箱编号上寻找划分
+            2. 每次划分只对样本较少的子节点累加直方图，另一个子节点的直方图为 父节点 - 兄弟节点
+        """
+        x = np.ascontiguousarray(x, dtype=float)
+        y = np.ascontiguousarray(y, dtype=float)
+        self.rng     = np.random.default_rng(self.random_state)
+        self.builder = HistogramBuilder(self.n_bins).fit(x)
+        codes        = self.builder.binning(x)
+
+        self.init_score = self.initScore(y)
+        raw = np.full(len(y), self.init_score)
+        if eval_set is not None:
+            x_valid   = np.ascontiguousarray(eval_set[0], dtype=float)
+            y_valid   = np.asarray(eval_set[1], dtype=float)
+            raw_valid = np.full(len(y_valid), self.init_score)
+            best_score, self.best_iteration = np.inf, 0
+        self.evals_result = []
+
+        self.trees = []
+        for i in range(self.n_estimators):
+            g, h = self.gradients(y, raw)
+            tree, leaf_values, leaf_idx = self.buildTree(codes, g, h)
+            self.trees.append(tree)
+            if leaf_idx is None:  # 抽样训练时未被抽中的样本同样需要更新预测值
+                raw += tree.predict(x)
+            else:
+                for value, idx in zip(leaf_values, leaf_idx):
+                    raw[idx] += value
+
+            if eval_set is None:
+                continue
+            raw_valid += tree.predict(x_valid)
+            score = self.score(y_valid, raw_valid)
+            self.evals_result.append(score)
+            if self.verbose and (i + 1) % self.verbose == 0:
+                print(f"[{i + 1}] valid: {score:.6f}")
+            if score < best_score:
+                best_score, self.best_iteration = score, i + 1
+            elif self.early_stopping_rounds is not None and i + 1 - self.best_iteration >= self.early_stopping_rounds:
+                break
+
+        if eval_set is not None:
+            self.trees = self.trees[:self.best_iteration]
+        self.forest = FlatTree.concat(self.trees) if self.trees else None
+        return self
+
+    def buildTree(self, codes:np.ndarray, g:np.ndarray, h:np.ndarray) -> tuple:
+        """ 按叶节点生长一棵树：每次划分当前增益最大的叶节点，直到叶节点数达到 max_leaves 或无法继续划分
+
+        returned value:
+            tuple(FlatTree, 各叶节点的输出值, 各叶节点的样本下标)，抽样训练时样本下标为 None
+        """
+        n_samples, n_features = codes.shape
+        idx = np.arange(n_samples)
+        if self.subsample < 1.0:
+            idx = np.sort(self.rng.choice(n_samples, max(1, int(self.subsample * n_samples)), replace=False))
+        features = np.arange(n_features)
+        if self.colsample < 1.0:
+            features = np.sort(self.rng.choice(n_features, max(1, int(self.colsample * n_features)), replace=False))
+        codes = codes[:, features] if len(features) < n_features else codes
+        thresholds = self.builder.thresholds[features]
+
+        # 并列数组表示的树，与 FlatTree 相同
+        feature, threshold, left, right = [-1], [np.nan], [-1], [-1]
+
+        def newLeaf(leaf_idx, hist, depth):
+            leaf = _Leaf(len(feature) - 1, leaf_idx, hist, depth)
+            if self.max_depth is None or depth < self.max_depth:
+                self.findBestSplit(leaf, thresholds)
+            return leaf
+
+        root   = newLeaf(idx, self.builder.histogram(codes[idx], g[idx], h[idx]), 0)
+        leaves = [root]
+        heap   = [(-root.gain, root.node, root)] if root.gain > self.min_split_gain else []
+        while heap and len(leaves) < self.max_leaves:
+            _, _, leaf = heapq.heappop(heap)
+            go_left   = codes[leaf.idx, leaf.feature] <= leaf.bin
+            left_idx  = leaf.idx[go_left]
+            right_idx = leaf.idx[~go_left]
+
+            # 只对样本较少的子节点累加直方图，另一个子节点的直方图由父节点减去兄弟节点得到
+            small_idx = left_idx if len(left_idx) <= len(right_idx) else right_idx
+            small     = self.builder.histogram(codes[small_idx], g[small_idx], h[small_idx])
+            large     = leaf.hist - small
+            left_hist, right_hist = (small, large) if small_idx is left_idx else (large, small)
+            leaf.hist = None
+
+            node = leaf.node
+            feature[node]   = int(features[leaf.feature])
+            threshold[node] = thresholds[leaf.feature, leaf.bin]
+            children = []
+            for child_idx, child_hist in ((left_idx, left_hist), (right_idx, right_hist)):
+                feature.append(-1)
+                threshold.append(np.nan)
+                left.append(-1)
+                right.append(-1)
+                children.append(newLeaf(child_idx, child_hist, leaf.depth + 1))
+            left[node], right[node] = children[0].node, children[1].node
+
+            leaves.remove(leaf)
+            for child in children:
+                leaves.append(child)
+                if child.gain > self.min_split_gain:
+                    heapq.heappush(heap, (-child.gain, child.node, child))
+
+        # 叶节点的输出值为 -G / (H + lambda)，再乘以学习率
+        value = np.full(len(feature), np.nan)
+        leaf_values = []
+        for leaf in leaves:
+            grad, hess = g[leaf.idx].sum(), h[leaf.idx].sum()
+            value[leaf.node] = -self.learning_rate * grad / (hess + self.reg_lambda) if hess + self.reg_lambda > 0 else 0.0
+            leaf_values.append(value[leaf.node])
+
+        tree = FlatTree(np.array(feature, dtype=np.int32), np.array(threshold), np.array(left, dtype=np.int32),
+                        np.array(right, dtype=np.int32), value)
+        if len(idx) < n_samples:
+            return tree, leaf_values, None
+        return tree, leaf_values, [leaf.idx for leaf in leaves]
+
+    def findBestSplit(self, leaf:_Leaf, thresholds:np.ndarray):
+        """ 在叶节点的直方图上寻找增益最大的 (特征, 箱)，结果保存在 leaf.gain / leaf.feature / leaf.bin 中
+
+        Tips:
+            箱编号 <= k 的样本划入左子树，增益为 GL² / (HL + λ) + GR² / (HR + λ) - G² / (H + λ)
+        """
+        grad, hess, count = leaf.hist
+        if count[0].sum() < 2 * self.min_samples_leaf:
+            return
+        g_lt, h_lt, n_lt = (np.cumsum(hist, axis=1)[:, :-1] for hist in (grad, hess, count))
+        g_sum, h_sum, n_sum = grad[0].sum(), hess[0].sum(), count[0].sum()
+        g_gt, h_gt, n_gt = g_sum - g_lt, h_sum - h_lt, n_sum - n_lt
+
+        lam = self.reg_lambda
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = g_lt ** 2 / (h_lt + lam) + g_gt ** 2 / (h_gt + lam) - g_sum ** 2 / (h_sum + lam)
+        valid = (n_lt >= self.min_samples_leaf) & (n_gt >= self.min_samples_leaf) & \
+                (h_lt + lam > 0) & (h_gt + lam > 0) & ~np.isnan(thresholds)
+        gain[~valid] = -np.inf
+        feature_idx, bin_idx = np.unravel_index(np.argmax(gain), gain.shape)
+        if np.isfinite(gain[feature_idx, bin_idx]):
+            leaf.gain, leaf.feature, leaf.bin = float(gain[feature_idx, bin_idx]), int(feature_idx), int(bin_idx)
+
+    def decisionFunction(self, x:list) -> np.ndarray:
+        """ 所有树的输出之和加上初始预测值 """
+        x = np.ascontiguousarray(x, dtype=float)
+        if self.forest is None:
+            return np.full(len(x), self.init_score)
+        # FlatTree.predict 返回各棵树的平均值
+        return self.init_score + self.forest.predict(x) * len(self.forest.roots)
+
+    def predict(self, x:list) -> np.ndarray:
+        return self.decisionFunction(x)
+
+    def save(self, path:str):
+        """ 保存合并后的所有树和初始预测值（没有树时只保存初始预测值） """
+        os.makedirs(path, exist_ok=True)
+        if self.forest is not None:
+            self.forest.save(path)
+        np.save(os.path.join(path, 'init_score.npy'), np.array(self.init_score))
+
+    @classmethod
+    def load(cls, path:str, mmap_mode:str='r'):
+        """ 加载 save 保存的模型（只能用于预测） """
+        model            = cls()
+        has_trees        = os.path.exists(os.path.join(path, 'roots.npy'))
+        model.forest     = FlatTree.load(path, mmap_mode) if has_trees else None
+        model.init_score = float(np.load(os.path.join(path, 'init_score.npy')))
+        return model
+
+def rocAuc(y:np.ndarray, score:np.ndarray) -> float:
+    """ ROC AUC：正样本的平均秩（相同的分数取平均秩）换算得到 """
+    _, inverse, counts = np.unique(score, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2)[inverse]
+    n_pos = np.sum(y == 1)
+    n_neg = len(y) - n_pos
+    return float((ranks[y == 1].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+class GradientBoostingClassifier(GradientBoostingRegressor):
+    """ 基于直方图的梯度提升二分类器（对数损失），标签为 0 / 1 """
+
+    def initScore(self, y:np.ndarray) -> float:
+        p = np.clip(np.mean(y), 1e-15, 1 - 1e-15)
+        return float(np.log(p / (1 - p)))
+
+    def gradients(self, y:np.ndarray, raw:np.ndarray) -> tuple:
+        p = 1 / (1 + np.exp(-raw))
+        return p - y, p * (1 - p)
+
+    def loss(self, y:np.ndarray, raw:np.ndarray) -> float:
+        # log(1 + e^raw) - y * raw，用 logaddexp 避免溢出
+        return float(np.mean(np.logaddexp(0, raw) - y * raw))
+
+    def score(self, y:np.ndarray, raw:np.ndarray) -> float:
+        if self.eval_metric == 'auc':
+            return -rocAuc(y, raw)
+        return self.loss(y, raw)
+
+    def predict_proba(self, x:list) -> np.ndarray:
+        """ 返回 (样本数, 2) 的数组，第 1 列为正类的概率 """
+        p = 1 / (1 + np.exp(-self.decisionFunction(x)))
+        return np.stack([1 - p, p], axis=1)
+
+    def predict(self, x:list) -> np.ndarray:
+        return (self.decisionFunction(x) > 0).astype(int)
+
+if __name__ == "__main__":
+    # 用法：python gradientboosting.py [path/to/Dota_data_v1.0.csv | path/to/matches.jsonl]
+    # 使用 train_lightGBM.ipynb 训练的特征表：datapreproc_p2 合并得到的大表，删除 game_time.1 以及
+    # total_teamfight_time 开始的各列。给出 JSONL 时由 utils.scoring.MatchFeaturizer 直接计算同样的列
+    import sys
+    import time
+    import pandas as pd
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.model_selection import train_test_split
+
+    data_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                   '..', '..', 'src', 'data', 'Dota_data_v1.0.csv')
+    if data_path.endswith('.csv'):
+        df = pd.read_csv(data_path, index_col='match_id_hash').drop(columns=['game_time.1'])
+        y = df.pop('radiant_win').to_numpy(dtype=float)
+        x = df.iloc[:, :df.columns.get_loc('total_teamfight_time')].to_numpy(dtype=float)
+    else:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+        from utils.readjsonl import read_matches
+        from utils.scoring import RAW_COLUMNS, SCORING_PATHS, MatchFeaturizer
+        matches = list(read_matches(data_path, paths=SCORING_PATHS + ['targets.radiant_win']))
+        featurizer = MatchFeaturizer(RAW_COLUMNS[:RAW_COLUMNS.index('total_teamfight_time')]).fit(matches)
+        x = featurizer.batch(matches)
+        y = np.array([match['targets']['radiant_win'] for match in matches], dtype=float)
+
+    x_train, x_test, y_train, y_test = train_test_split(x, y, test_size=0.2, random_state=17)
+    x_fit, x_valid, y_fit, y_valid = train_test_split(x_train, y_train, test_size=0.2, random_state=17)
+    print('训练 / 验证 / 测试:', x_fit.shape, x_valid.shape, x_test.shape)
+
+    # train_lightGBM.ipynb 中调得的参数
+    notebook_params = {
+        'learning_rate': 0.0531121462757666, 'num_leaves': 67, 'max_depth': 6,
+        'feature_fraction': 0.5208432697923645, 'bagging_fraction': 0.8069692225513229, 'num_round': 664,
+    }
+
+    start = time.time()
+    model = GradientBoostingClassifier(n_estimators=notebook_params['num_round'],
+                                       learning_rate=notebook_params['learning_rate'],
+                                       max_leaves=notebook_params['num_leaves'], max_depth=notebook_params['max_depth'],
+                                       colsample=notebook_params['feature_fraction'],
+                                       subsample=notebook_params['bagging_fraction'],
+                                       early_stopping_rounds=50, eval_metric='auc', random_state=17)
+    model.fit(x_fit, y_fit, eval_set=(x_valid, y_valid))
+    print(f"GradientBoostingClassifier: {time.time() - start:.2f}秒, {model.best_iteration} 棵树, "
+          f"AUC {rocAuc(y_test, model.predict_proba(x_test)[:, 1]):.5f}")
+
+    start = time.time()
+    benchmark_model = HistGradientBoostingClassifier(max_iter=notebook_params['num_round'],
+                                                     learning_rate=notebook_params['learning_rate'],
+                                                     max_leaf_nodes=notebook_params['num_leaves'],
+                                                     max_depth=notebook_params['max_depth'],
+                                                     early_stopping=True, validation_fraction=0.2,
+                                                     n_iter_no_change=50, scoring='roc_auc', random_state=17)
+    benchmark_model.fit(x_train, y_train)
+    print(f"sklearn HistGradientBoostingClassifier: {time.time() - start:.2f}秒, {benchmark_model.n_iter_} 棵树, "
+          f"AUC {rocAuc(y_test, benchmark_model.predict_proba(x_test)[:, 1]):.5f}")
+
+    try:
+        import lightgbm as lgb
+    except ImportError:
+        print('未安装 lightgbm，跳过')
+    else:
+        start = time.time()
+        params = {'objective': 'binary', 'metric': 'auc', 'verbosity': -1, 'bagging_freq': 1, 'seed': 17,
+                  **{key: value for key, value in notebook_params.items() if key != 'num_round'}}
+        booster = lgb.train(params, lgb.Dataset(x_fit, label=y_fit), notebook_params['num_round'],
+                            valid_sets=[lgb.Dataset(x_valid, label=y_valid)],
+                            callbacks=[lgb.early_stopping(50, verbose=False)])
+        print(f"LightGBM: {time.time() - start:.2f}秒, {booster.best_iteration} 棵树, "
+              f"AUC {rocAuc(y_test, booster.predict(x_test, num_iteration=booster.best_iteration)):.5f}")
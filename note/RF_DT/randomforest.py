@@ -1,20 +1,86 @@
 # Random Forest Regressor
+import os
 import numpy as np
-from decisiontree import DecisionTreeRegressor
+from multiprocessing import Pool, shared_memory
+from decisiontree import DecisionTreeRegressor, FlatTree
+
+# 每个预测进程至少处理的样本数
+PREDICT_CHUNK_SIZE = 10000
+
+# 工作进程中共享的数据（由 initWorker 在每个工作进程启动时设置）
+_shared = {}
+
+def toSharedMemory(arrays:dict) -> tuple:
+    """ 将数组复制到共享内存中，返回 (共享内存对象列表, 供工作进程挂载的描述信息) """
+    blocks, specs = [], {}
+    for name, arr in arrays.items():
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        blocks.append(shm)
+        specs[name] = (shm.name, arr.shape, arr.dtype.str)
+    return blocks, specs
+
+def initWorker(specs:dict, params:dict):
+    """ 工作进程初始化：挂载共享内存中的数组，不复制数据 """
+    _shared.clear()
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _shared[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        _shared['_' + name] = shm  # 保持引用，防止共享内存被提前关闭
+    _shared['params'] = params
+
+def fitTree(task:tuple) -> FlatTree:
+    """ 在工作进程中用一组自助抽样下标训练一棵决策树 """
+    sample_idx, seed = task
+    dt = DecisionTreeRegressor(random_state=seed, **_shared['params'])
+    dt.fit(_shared['x'], _shared['y'], sample_idx, _shared.get('sorted_idx'))
+    return dt.tree
+
+def predictRows(x:np.ndarray) -> np.ndarray:
+    """ 在工作进程中用共享内存中的森林预测一块样本 """
+    if 'forest' not in _shared:
+        _shared['forest'] = FlatTree(*(_shared[name] for name in FlatTree.ARRAYS))
+    return _shared['forest'].predict(x)
+
+def runInPool(n_jobs:int, arrays:dict, params:dict, func, tasks:list) -> list:
+    """ 将 arrays 放入共享内存，在进程池中对每个任务调用 func，按任务顺序返回结果 """
+    blocks, specs = toSharedMemory(arrays)
+    try:
+        with Pool(n_jobs, initializer=initWorker, initargs=(specs, params)) as pool:
+            return pool.map(func, tasks)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
 
 class RandomForestRegressor:
     """ 随机森林回归器 """
-    def __init__(self, n_estimators=10, max_depth=10):
+    def __init__(self, n_estimators=10, max_depth=10, max_features=None, n_bins=None,
+                 n_jobs=-1, random_state=None):
         """ 初始化随机森林回归器
 
         parameter:
             1. n_estimators : 估计器个数
             2. max_depth    : 决策树最大深度
-            3. max_features : 每次划分时使用的特征个数（未给出的话则为总特征数开方取整）
+            3. max_features : 每次划分时随机选取的特征个数，可以为整数、比例、'sqrt'、'log2'，为 None 时使用全部特征
+            4. n_bins       : 决策树的分箱数，为 None 时使用精确划分
+            5. n_jobs       : 并行训练 / 预测使用的进程数，-1 表示使用全部 CPU，1 表示在当前进程中顺序执行
+            6. random_state : 随机数种子，给定后每棵树的自助抽样和特征选取都可以复现
         """
         self.n_estimators = n_estimators
         self.max_depth    = max_depth
-        self.trees        = None  # 森林中的决策树
+        self.max_features = max_features
+        self.n_bins       = n_bins
+        self.n_jobs       = n_jobs
+        self.random_state = random_state
+        self.trees        = None  # 森林中的决策树（FlatTree）
+        self.forest       = None  # 合并为并列数组的所有决策树
+        self._pool        = None  # 并行预测的 (进程数, 进程池, 森林所在的共享内存)
+
+    def nJobs(self, n_tasks:int) -> int:
+        """ 实际使用的进程数（不超过任务数） """
+        n_jobs = (os.cpu_count() or 1) if self.n_jobs is None or self.n_jobs < 0 else self.n_jobs
+        return max(1, min(n_jobs, n_tasks))
 
     def fit(self, x:list, y:list):
         """ 使用训练数据拟合随机森林模型
@@ -22,30 +88,54 @@ class RandomForestRegressor:
         parameter:
             1. x: 训练集数据
             2. y: 训练集标签
+
+        Tips:
+            训练数据只在共享内存中保存一份，每棵树只接收自助抽样得到的下标数组；
+            精确划分时各特征的排序结果也只计算一次，由所有树共享
         """
-        x = np.array(x)
-        y = np.array(y)
-        dts = []  # 决策树数组
-        for _ in range(self.n_estimators):
-            x_train, y_train = self.bootstrap(x, y)
-            dt = DecisionTreeRegressor(max_depth=self.max_depth)
-            dt.fit(x_train, y_train)
-            dts.append(dt)
-        self.trees = dts
-
-    def bootstrap(self, x:list, y:list):
+        x = np.ascontiguousarray(x, dtype=float)
+        y = np.ascontiguousarray(y, dtype=float)
+
+        # 每棵树使用独立的随机数种子，结果与进程数和执行顺序无关
+        seeds = np.random.SeedSequence(self.random_state).spawn(self.n_estimators)
+        tasks = [(self.bootstrap(len(y), np.random.default_rng(seed)), seed.spawn(1)[0]) for seed in seeds]
+
+        arrays = {'x': x, 'y': y}
+        if self.n_bins is None:
+            arrays['sorted_idx'] = np.argsort(x, axis=0, kind='stable').T.copy()
+        params = {
+            'max_depth':    self.max_depth,
+            'n_bins':       self.n_bins,
+            'max_features': self.max_features,
+        }
+
+        n_jobs = self.nJobs(self.n_estimators)
+        if n_jobs == 1:
+            initWorker({}, params)
+            _shared.update(arrays)
+            dts = [fitTree(task) for task in tasks]
+            _shared.clear()
+        else:
+            dts = runInPool(n_jobs, arrays, params, fitTree, tasks)
+
+        self.close()  # 之前的进程池中是旧的森林
+        self.trees  = dts
+        self.forest = FlatTree.concat(dts)  # 将所有决策树合并，一次性预测
+
+    def bootstrap(self, n_samples:int, rng:np.random.Generator) -> np.ndarray:
         """ 自助抽样
 
         parameter:
-            1. x: 数据集
-            2. y: 标签集
+            1. n_samples: 数据集大小
+            2. rng      : 随机数生成器
+
+        returned value:
+            抽中的样本下标（不复制数据本身）
 
         Tips:
             在随机森林中，对于一个大小为 N 的数据集，需要有放回的随机抽样 N 次，以生成用于训练的数据集
         """
-        n_samples   = x.shape[0]
-        sample_idx  = np.random.choice(n_samples, n_samples, replace=True)
-        return x[sample_idx], y[sample_idx]
+        return rng.integers(0, n_samples, n_samples)
 
     def predict(self, x) -> list:
         """ 使用训练好的模型进行预测
@@ -56,15 +146,58 @@ class RandomForestRegressor:
         returned value:
             预测结果
         """
-        # 预测结果
-        y_predict = np.zeros(x.shape[0])
+        x = np.ascontiguousarray(x, dtype=float)
+        n_jobs = self.nJobs(-(-len(x) // PREDICT_CHUNK_SIZE))  # 样本较少时直接在当前进程中预测
+        if n_jobs == 1:
+            return self.forest.predict(x)
 
-        for i in range(self.n_estimators):
-            dt = self.trees[i]
-            y_predict += dt.predict(x)
+        return np.concatenate(self.predictPool(n_jobs).map(predictRows, np.array_split(x, n_jobs)))
 
-        y_predict /= self.n_estimators
-        return y_predict
+    def predictPool(self, n_jobs:int):
+        """ 并行预测使用的进程池
+
+        Tips:
+            森林只在第一次并行预测时放入共享内存，之后的每次预测都复用同一个进程池，
+            只需要向工作进程发送样本；不再使用时调用 close 释放进程池和共享内存
+        """
+        if self._pool is None or self._pool[0] != n_jobs:
+            self.close()
+            blocks, specs = toSharedMemory({name: getattr(self.forest, name) for name in FlatTree.ARRAYS})
+            self._pool = (n_jobs, Pool(n_jobs, initializer=initWorker, initargs=(specs, {})), blocks)
+        return self._pool[1]
+
+    def close(self):
+        """ 关闭并行预测的进程池，释放共享内存 """
+        if self._pool is None:
+            return
+        _, pool, blocks = self._pool
+        self._pool = None
+        pool.terminate()
+        pool.join()
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    def __del__(self):
+        self.close()
+
+    def __getstate__(self):
+        # 进程池不能序列化，反序列化后在需要时重新创建
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def save(self, path:str):
+        """ 保存合并后的所有决策树 """
+        self.forest.save(path)
+
+    @classmethod
+    def load(cls, path:str, mmap_mode:str='r'):
+        """ 加载 save 保存的随机森林（只能用于预测），默认以内存映射方式加载 """
+        model              = cls()
+        model.forest       = FlatTree.load(path, mmap_mode)
+        model.n_estimators = len(model.forest.roots)
+        return model
 
 if __name__ == "__main__":
     from sklearn.datasets import fetch_california_housing
@@ -82,7 +215,7 @@ if __name__ == "__main__":
     import time
     start = time.time()
 
-    benchmark_model = BenchmarkModel()
+    benchmark_model = BenchmarkModel(n_jobs=-1)
     benchmark_model.fit(x_train, y_train)
     y_pred_benchmark = benchmark_model.predict(x_test)
     mse_benchmark    = mean_squared_error(y_test, y_pred_benchmark)
@@ -90,7 +223,7 @@ if __name__ == "__main__":
     print(f"代码执行时间: {time.time() - start}秒")
 
     start = time.time()
-    model = RandomForestRegressor()
+    model = RandomForestRegressor(n_jobs=-1, random_state=42)
     model.fit(x_train, y_train)
     y_pred = model.predict(x_test)
     print(y_pred)
@@ -0,0 +1,272 @@
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import ujson as json
+
+from .extractdata import (TABLE_PATHS, extract_batches, extract_main, extract_objectives, extract_players,
+                          extract_tables, extract_targets, extract_teamfights)
+from .compressed import compress
+from .getfeaturetree import get_keys_relation
+from .heroes import hero_matrix
+from .instrument import peak_rss_bytes, reset_peak_rss, rss_bytes
+from .objectives import aggregate_objectives
+from .playerfeatures import player_features
+from .readjsonl import read_matches
+from .synthetic import write_matches
+from .teamfights import teamfight_rollups
+
+RF_DT_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'note', 'RF_DT')
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'synthetic')
+
+class Inputs:
+    """ 一个数据文件上各个基准测试共用的输入，按需计算并缓存
+
+    在父进程中准备好之后再 fork 出测试进程，准备输入的时间和内存不计入测试结果。
+    """
+
+    def __init__(self, path):
+        self.path   = path
+        self._cache = {}
+
+    def _cached(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def tables(self):
+        return self._cached('tables', lambda: extract_tables(self.path, ['main', 'targets', 'players',
+                                                                         'objectives', 'teamfights_long']))
+
+    @property
+    def xy(self):
+        """ 决策树 / 随机森林使用的 (特征矩阵, 标签)：清洗后的 players 特征，标签为 Radiant 是否获胜 """
+        def build():
+            x = player_features(self.tables['players']).to_numpy(dtype='float64')
+            y = self.tables['targets']['radiant_win'].to_numpy(dtype='float64')
+            return x, y
+        return self._cached('xy', build)
+
+    def compressed(self, kind):
+        """ 压缩后的数据文件，与原文件放在一起，只生成一次 """
+        path = f"{self.path}.{COMPRESSED_SUFFIXES[kind]}"
+        if not os.path.exists(path):
+            compress(self.path, path + '.tmp', kind)
+            os.replace(path + '.tmp', path)
+        return path
+
+    def model(self, name, build):
+        """ 预测测试使用的已训练模型 """
+        return self._cached(f'model-{name}', build)
+
+COMPRESSED_SUFFIXES = {'gzip': 'gz', 'bz2': 'bz2', 'xz': 'xz'}
+
+def _tree_classes():
+    if RF_DT_DIR not in sys.path:
+        sys.path.insert(0, RF_DT_DIR)
+    from decisiontree import DecisionTreeRegressor
+    from gradientboosting import GradientBoostingClassifier
+    from randomforest import RandomForestRegressor
+    return DecisionTreeRegressor, RandomForestRegressor, GradientBoostingClassifier
+
+def _fit_tree(x, y, n_bins=None):
+    DecisionTreeRegressor, _, _ = _tree_classes()
+    tree = DecisionTreeRegressor(max_depth=10, n_bins=n_bins)
+    tree.fit(x, y)
+    return tree
+
+def _fit_forest(x, y):
+    # 单进程训练，结果不受机器核数影响
+    _, RandomForestRegressor, _ = _tree_classes()
+    forest = RandomForestRegressor(n_estimators=10, max_depth=10, n_bins=64, n_jobs=1, random_state=0)
+    forest.fit(x, y)
+    return forest
+
+def _fit_gbm(x, y):
+    _, _, GradientBoostingClassifier = _tree_classes()
+    return GradientBoostingClassifier(n_estimators=50, max_leaves=31, random_state=0).fit(x, y)
+
+def _count(matches):
+    return sum(1 for _ in matches)
+
+# 基准测试名 -> (由 Inputs 准备参数的函数, 被测函数)
+BENCHMARKS = {
+    'read_matches':           (lambda inputs: (inputs.path,), lambda path: _count(read_matches(path))),
+    'read_matches_projected': (lambda inputs: (inputs.path,),
+                               lambda path: _count(read_matches(path, paths=TABLE_PATHS['players']))),
+    # 与 read_matches / extract_tables 比较，即可得到读取压缩文件的额外开销
+    'read_matches_gzip':      (lambda inputs: (inputs.compressed('gzip'),), lambda path: _count(read_matches(path))),
+    'read_matches_bz2':       (lambda inputs: (inputs.compressed('bz2'),), lambda path: _count(read_matches(path))),
+    'read_matches_xz':        (lambda inputs: (inputs.compressed('xz'),), lambda path: _count(read_matches(path))),
+    'extract_main':           (lambda inputs: (inputs.path,), extract_main),
+    'extract_objectives':     (lambda inputs: (inputs.path,), extract_objectives),
+    'extract_targets':        (lambda inputs: (inputs.path,), extract_targets),
+    'extract_teamfights':     (lambda inputs: (inputs.path,), extract_teamfights),
+    'extract_players':        (lambda inputs: (inputs.path,), extract_players),
+    'extract_tables':         (lambda inputs: (inputs.path,), extract_tables),
+    'extract_tables_gzip':    (lambda inputs: (inputs.compressed('gzip'),), extract_tables),
+    'extract_batches':        (lambda inputs: (inputs.path,), lambda path: _count(extract_batches(path))),
+    'get_keys_relation':      (lambda inputs: (inputs.path,), get_keys_relation),
+    'hero_matrix':            (lambda inputs: (inputs.path,), hero_matrix),
+    'player_features':        (lambda inputs: (inputs.tables['players'],), player_features),
+    'aggregate_objectives':   (lambda inputs: (inputs.tables['objectives'],), aggregate_objectives),
+    'teamfight_rollups':      (lambda inputs: (inputs.tables['teamfights_long'], len(inputs.tables['main'])),
+                               teamfight_rollups),
+    'tree_fit':               (lambda inputs: inputs.xy, _fit_tree),
+    'tree_fit_hist':          (lambda inputs: inputs.xy + (64,), _fit_tree),
+    'tree_predict':           (lambda inputs: (inputs.model('tree', lambda: _fit_tree(*inputs.xy)), inputs.xy[0]),
+                               lambda tree, x: tree.predict(x)),
+    'forest_fit':             (lambda inputs: inputs.xy, _fit_forest),
+    'forest_predict':         (lambda inputs: (inputs.model('forest', lambda: _fit_forest(*inputs.xy)), inputs.xy[0]),
+                               lambda forest, x: forest.predict(x)),
+    'gbm_fit':                (lambda inputs: inputs.xy, _fit_gbm),
+    'gbm_predict':            (lambda inputs: (inputs.model('gbm', lambda: _fit_gbm(*inputs.xy)), inputs.xy[0]),
+                               lambda model, x: model.predict_proba(x)),
+}
+
+def _measure(run, args):
+    """ 执行一次 run(*args)，返回 (秒数, 执行期间 RSS 峰值相对执行前的增量字节数) """
+    reset = reset_peak_rss()
+    baseline = rss_bytes()
+    start = time.perf_counter()
+    run(*args)
+    elapsed = time.perf_counter() - start
+
+    peak = peak_rss_bytes() if reset else None
+    if peak is None or baseline is None:
+        # 无法重置峰值时退化为进程生命周期内的峰值（Linux 上 ru_maxrss 以 kB 为单位）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        baseline = baseline or 0
+    return elapsed, max(0, peak - baseline)
+
+def _measure_in_child(conn, run, args):
+    try:
+        conn.send(_measure(run, args))
+    except BaseException as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+def measure(run, args):
+    """ 在 fork 出的子进程中测量，各个测试的内存峰值和缓存互不影响；不支持 fork 的平台上在当前进程中测量 """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return _measure(run, args)
+
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_in_child, args=(sender, run, args))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    if isinstance(result, BaseException):
+        raise result
+    return result
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(sizes, names=None, data_dir=DEFAULT_DATA_DIR, seed=0, repeat=1):
+    """ 在不同规模的合成数据上运行基准测试
+
+    parameter:
+        1. sizes    : 合成比赛的局数列表，如 [10000, 100000]
+        2. names    : 要运行的测试名（BENCHMARKS 的键，也可以是前缀，如 'extract'），默认运行全部
+        3. data_dir : 合成数据的缓存目录，同样参数的数据只生成一次
+        4. seed     : 合成数据的随机数种子
+        5. repeat   : 每个测试重复的次数，取最短的时间和最小的内存峰值
+
+    returned value:
+        每个 (测试, 规模) 一条记录的列表
+    """
+    selected = [name for name in BENCHMARKS
+                if names is None or any(name == prefix or name.startswith(prefix) for prefix in names)]
+    commit = _git_commit()
+    results = []
+    for n in sizes:
+        path = write_matches(os.path.join(data_dir, f'synthetic_{n}_{seed}.jsonl'), n, seed)
+        inputs = Inputs(path)
+        for name in selected:
+            setup, run = BENCHMARKS[name]
+            args = setup(inputs)
+            measurements = [measure(run, args) for _ in range(repeat)]
+            seconds = min(elapsed for elapsed, _ in measurements)
+            peak = min(peak for _, peak in measurements)
+            result = {
+                'benchmark':       name,
+                'n_matches':       n,
+                'seconds':         round(seconds, 4),
+                'matches_per_sec': round(n / seconds, 1) if seconds > 0 else None,
+                'peak_mb':         round(peak / 2 ** 20, 1),
+                'commit':          commit,
+                'timestamp':       time.strftime('%Y-%m-%dT%H:%M:%S'),
+            }
+            print(f"{name:<24} n={n:<8} {seconds:9.3f}秒 {result['matches_per_sec'] or 0:12.1f} 局/秒 "
+                  f"{result['peak_mb']:9.1f}MB", file=sys.stderr)
+            results.append(result)
+    return results
+
+def load_history(path):
+    """ 读取以 JSONL 格式保存的历史结果 """
+    if not os.path.exists(path):
+        return []
+    with open(path) as fin:
+        return [json.loads(line) for line in fin if line.strip()]
+
+def append_history(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a') as fout:
+        for result in results:
+            fout.write(json.dumps(result) + '\n')
+
+def find_regressions(results, baseline, tolerance=0.2, min_seconds=0.05, min_mb=5.0):
+    """ 与基线比较，返回执行时间或内存峰值超过基线 (1 + tolerance) 倍的记录
+
+    基线中同一 (测试, 规模) 有多条记录时取最后一条；时间和内存的增量分别小于 min_seconds / min_mb 时视为噪声。
+    """
+    latest = {(record['benchmark'], record['n_matches']): record for record in baseline}
+    regressions = []
+    for result in results:
+        base = latest.get((result['benchmark'], result['n_matches']))
+        if base is None:
+            continue
+        for key, slack in (('seconds', min_seconds), ('peak_mb', min_mb)):
+            if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] > slack:
+                regressions.append((result['benchmark'], result['n_matches'], key, base[key], result[key]))
+    return regressions
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：
+    #   python -m utils.benchmark --sizes 10000 100000 --only extract tree --history ../data/synthetic/history.jsonl
+    #   python -m utils.benchmark --sizes 10000 --baseline ../data/synthetic/history.jsonl  # 有回退时返回值为 1
+    import argparse
+
+    parser = argparse.ArgumentParser(description='在合成比赛数据上运行基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000], help='合成比赛的局数')
+    parser.add_argument('--only', nargs='+', default=None, help='只运行这些测试（可以是前缀）：' + ', '.join(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, help='合成数据的缓存目录')
+    parser.add_argument('--history', default=None, help='将结果追加到该 JSONL 文件')
+    parser.add_argument('--baseline', default=None, help='与该 JSONL 文件中的结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline = load_history(args.baseline) if args.baseline else []
+    results = run_benchmarks(args.sizes, args.only, args.data_dir, args.seed, args.repeat)
+    if args.history:
+        append_history(args.history, results)
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for name, n, key, before, after in regressions:
+        print(f"回退: {name} n={n} {key} {before} -> {after}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
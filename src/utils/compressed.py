@@ -0,0 +1,146 @@
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+
+# 按文件开头的魔数识别压缩格式，与文件扩展名无关
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'bz2':  b'BZh',
+    'xz':   b'\xfd7zXZ\x00',
+}
+_OPENERS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+
+CHUNK_SIZE = 1 << 20
+QUEUE_CHUNKS = 8
+BATCH_LINES = 256
+
+def compression(matches_file):
+    """ 文件的压缩格式：'gzip' / 'bz2' / 'xz'，未压缩时为 None """
+    with open(matches_file, 'rb') as fin:
+        head = fin.read(6)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+class PipelinedReader:
+    """ 在后台线程中解压并按行切分，主线程像普通文件一样逐行读取
+
+    gzip / bz2 / lzma 在解压时会释放 GIL，因此解压与主线程中的 JSON 解析可以同时进行。
+    队列中最多缓存 max_chunks 块解压后的数据，主线程处理不过来时后台线程会等待。
+    """
+
+    def __init__(self, fin, chunk_size=CHUNK_SIZE, max_chunks=QUEUE_CHUNKS):
+        self.fin        = fin
+        self.chunk_size = chunk_size
+        self.queue      = queue.Queue(max_chunks)
+        self.stopped    = threading.Event()
+        self.lines      = []
+        self.pos        = 0
+        self.finished   = False
+        self.thread     = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _put(self, item):
+        # 主线程提前关闭时不再阻塞在已满的队列上
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        tail = b''
+        try:
+            while not self.stopped.is_set():
+                chunk = self.fin.read(self.chunk_size)
+                if not chunk:
+                    break
+                data = tail + chunk
+                cut = data.rfind(b'\n') + 1
+                tail = data[cut:]
+                if cut and not self._put(data[:cut].splitlines(keepends=True)):
+                    return
+            if tail:
+                self._put([tail])
+        except BaseException as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def readline(self):
+        while self.pos >= len(self.lines):
+            if self.finished:
+                return b''
+            item = self.queue.get()
+            if item is None:
+                self.finished = True
+                return b''
+            if isinstance(item, BaseException):
+                self.finished = True
+                raise item
+            self.lines, self.pos = item, 0
+        line = self.lines[self.pos]
+        self.pos += 1
+        return line
+
+    def read_batch(self, n_lines):
+        """ 读取至多 n_lines 行，读完时返回空列表 """
+        batch = []
+        while len(batch) < n_lines:
+            if self.pos >= len(self.lines):
+                # readline 会取出下一块数据并返回其中的第一行
+                line = self.readline()
+                if not line:
+                    break
+                batch.append(line)
+                continue
+            take = self.lines[self.pos:self.pos + n_lines - len(batch)]
+            self.pos += len(take)
+            batch.extend(take)
+        return batch
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+def open_matches(matches_file):
+    """ 以二进制模式打开比赛数据：压缩文件返回后台解压的 PipelinedReader，否则返回普通文件对象 """
+    kind = compression(matches_file)
+    if kind is None:
+        return open(matches_file, 'rb')
+    return PipelinedReader(_OPENERS[kind](matches_file, 'rb'))
+
+def line_batches(matches_file, n_lines=BATCH_LINES):
+    """ 生成器函数，依次返回压缩文件中每 n_lines 行组成的列表 """
+    with open_matches(matches_file) as fin:
+        while True:
+            batch = fin.read_batch(n_lines)
+            if not batch:
+                return
+            yield batch
+
+def compress(matches_file, output_file, kind='gzip'):
+    """ 将 JSONL 文件压缩为 gzip / bz2 / xz 格式 """
+    with open(matches_file, 'rb') as fin, _OPENERS[kind](output_file, 'wb') as fout:
+        while True:
+            chunk = fin.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fout.write(chunk)
+    return output_file
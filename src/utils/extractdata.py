@@ -1,182 +1,560 @@
+import os
+from array import array
+from functools import partial
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
 import pandas as pd
+import ujson as json
+
+from . import instrument
+from .readjsonl import _byte_range, _effective_n_jobs, read_matches, map_matches
+from .objectives import objective_stats_row, objective_stats_columns
+from .playerfeatures import compact_dtype
 
-from .readjsonl import read_matches
+# 提取逻辑（以及缓存中表的存储格式）的版本号，修改任意表的行/列构造方式后需要递增，以使旧的缓存失效
+EXTRACTOR_VERSION = 6
 
 # 1. 提取一级标签 —— main table
-def extract_main(matches_file):
-    """
-    从JSON对象中提取所有不含嵌套属性的一级属性。
-    并对包含嵌套属性的一级属性统计其内部的数据数量。
-    """
-    key_name = ['game_time', 'match_id_hash', 'teamfights_number',
+MAIN_COLUMNS = ['game_time', 'match_id_hash', 'teamfights_number',
                 'chat_number', 'game_mode', 'lobby_type']
 
-    data = []
-    for match in read_matches(matches_file):
-        data.append([
-            match['game_time'],
-            match['match_id_hash'],
-            len(match['teamfights']),
-            len(match['chat']),
-            match['game_mode'],
-            match['lobby_type']
-        ])
+def _main_row(match):
+    return [
+        match['game_time'],
+        match['match_id_hash'],
+        len(match['teamfights']),
+        len(match['chat']),
+        match['game_mode'],
+        match['lobby_type']
+    ]
 
-    return pd.DataFrame(data, columns=key_name)
+def _main_columns(max_len=None):
+    return MAIN_COLUMNS
 
 # 2. 提取 objectives table
-def extract_objectives(matches_file):
-    """
-    从 json 对象中提取 objectives 数据，将每个 objective 展开成单独的列。
-    如果没有那么多 objectives，则保留空值。
-    """
-    # 找出 objectives 列表的最大长度
-    max_len = 0
-    for match in read_matches(matches_file):
-        max_len = max(max_len, len(match['objectives']))
+# 第 2 版起每个 objective 除 type / player_slot / key / slot 外还有 team 和 time 两列，
+# 即每个 objective 由 4 列变为 6 列（最多 16 个 objective 时由 64 列变为 96 列）
+OBJECTIVE_KEYS = ['type', 'player_slot', 'key', 'slot', 'team', 'time']
+
+def _objectives_row(match):
+    row = []
+    for objective in match['objectives']:
+        for key in OBJECTIVE_KEYS:
+            row.append(objective[key] if key in objective else None)
+    return row
 
-    # 生成列名
+def _objectives_columns(max_len):
     key_name = []
     for i in range(max_len):
-        key_name.append(f'objective-{i + 1}-type')
-        key_name.append(f'objective-{i + 1}-player_slot')
-        key_name.append(f'objective-{i + 1}-key')
-        key_name.append(f'objective-{i + 1}-slot')
-
-    # 提取数据
-    data = []
-    needed_keys = ['type', 'player_slot', 'key', 'slot']
-    for match in read_matches(matches_file):
-        row = []
-        for i in range(max_len):
-            if i < len(match['objectives']):
-                objective = match['objectives'][i]
-                for key in needed_keys:
-                    row.append(objective[key] if key in objective else None)
-            else:
-                row.extend([None, None, None, None])
-        data.append(row)
-
-    # 将数据转换为 DataFrame
-    return pd.DataFrame(data, columns=key_name)
+        for key in OBJECTIVE_KEYS:
+            key_name.append(f'objective-{i + 1}-{key}')
+    return key_name
 
 # 3. 提取 targets table
-def extract_targets(matches_file):
-    """
-    从 json 对象中提取 radiant_win 属性。
-    """
-    key_name = ['radiant_win']
+TARGETS_COLUMNS = ['radiant_win']
 
-    data = []
-    for match in read_matches(matches_file):
-        data.append([match['targets']['radiant_win']])
+def _targets_row(match):
+    return [match['targets']['radiant_win']]
 
-    return pd.DataFrame(data, columns=key_name)
+def _targets_columns(max_len=None):
+    return TARGETS_COLUMNS
 
 # 4. 提取 teamfights table
-def extract_teamfights(matches_file):
-    """
-    从JSON对象中提取teamfights数据，将每个teamfight和其下的player属性展开成单独的列。
-    删除players中的ability_uses, deaths, deaths_pos, item_uses, 和killed字段。
-    """
-    # 找出 teamfights 列表的最大长度
-    max_len = 0
-    for match in read_matches(matches_file):
-        max_len = max(max_len, len(match['teamfights']))
+TEAMFIGHT_KEYS = ['end', 'start', 'deaths', 'last_death']
+TEAMFIGHT_PLAYER_KEYS = ['xp_delta', 'damage', 'gold_delta', 'healing', 'buybacks']
+TEAMFIGHT_WIDTH = len(TEAMFIGHT_KEYS) + 10 * len(TEAMFIGHT_PLAYER_KEYS)
 
-    # 生成列名
-    key_name = []
-    for i in range(max_len):
+def _teamfights_row(match):
+    row = []
+    for teamfight in match['teamfights']:
         # teamfight 的顶层字段
-        key_name.append(f'teamfights-{i + 1}-end')
-        key_name.append(f'teamfights-{i + 1}-start')
-        key_name.append(f'teamfights-{i + 1}-deaths')
-        key_name.append(f'teamfights-{i + 1}-last_death')
+        row.extend([teamfight.get(key) for key in TEAMFIGHT_KEYS])
 
         # player 相关字段
         for j in range(10):
-            key_name.append(f'teamfights-{i + 1}-player-{j + 1}-xp_delta')
-            key_name.append(f'teamfights-{i + 1}-player-{j + 1}-damage')
-            key_name.append(f'teamfights-{i + 1}-player-{j + 1}-gold_delta')
-            key_name.append(f'teamfights-{i + 1}-player-{j + 1}-healing')
-            key_name.append(f'teamfights-{i + 1}-player-{j + 1}-buybacks')
-
-    # 提取数据
-    data = []
-    for match in read_matches(matches_file):
-        row = []
-        for i in range(max_len):
-            if i < len(match['teamfights']):
-                teamfight = match['teamfights'][i]
-                row.extend([
-                    teamfight.get('end'),
-                    teamfight.get('start'),
-                    teamfight.get('deaths'),
-                    teamfight.get('last_death')
-                ])
-
-                for j in range(10):
-                    if j < len(teamfight['players']):
-                        player = teamfight['players'][j]
-                        row.extend([
-                            player.get('xp_delta'),
-                            player.get('damage'),
-                            player.get('gold_delta'),
-                            player.get('healing'),
-                            player.get('buybacks')
-                        ])
-                    else:
-                        row.extend([None, None, None, None, None])
+            if j < len(teamfight['players']):
+                player = teamfight['players'][j]
+                row.extend([player.get(key) for key in TEAMFIGHT_PLAYER_KEYS])
             else:
-                row.extend([None, None, None, None])
-                row.extend([None, None, None, None, None] * 10)
+                row.extend([None] * len(TEAMFIGHT_PLAYER_KEYS))
+    return row
 
-        data.append(row)
+def _teamfights_columns(max_len):
+    key_name = []
+    for i in range(max_len):
+        for key in TEAMFIGHT_KEYS:
+            key_name.append(f'teamfights-{i + 1}-{key}')
+        for j in range(10):
+            for key in TEAMFIGHT_PLAYER_KEYS:
+                key_name.append(f'teamfights-{i + 1}-player-{j + 1}-{key}')
+    return key_name
 
-    # 将数据转换为 DataFrame
-    return pd.DataFrame(data, columns=key_name)
+# 4.1 提取长格式的 teamfights table：每个 (比赛, 团战, 玩家) 一行，行数只与实际的团战次数有关
+TEAMFIGHT_LONG_COLUMNS = ['match', 'teamfight', 'player'] + TEAMFIGHT_KEYS + TEAMFIGHT_PLAYER_KEYS
+# 没有玩家数据的团战也占一行，player 为 NO_PLAYER、玩家字段为空值，这样团战次数和团战时间与宽表一致
+NO_PLAYER = -1
+
+def _teamfights_long_rows(match):
+    rows = []
+    for i, teamfight in enumerate(match['teamfights']):
+        fight = [teamfight.get(key) for key in TEAMFIGHT_KEYS]
+        players = teamfight.get('players') or ()
+        for j, player in enumerate(players[:10]):
+            rows.append([i, j] + fight + [player.get(key) for key in TEAMFIGHT_PLAYER_KEYS])
+        if not players:
+            rows.append([i, NO_PLAYER] + fight + [None] * len(TEAMFIGHT_PLAYER_KEYS))
+    return rows
+
+def _teamfights_long_columns(max_len=None):
+    return TEAMFIGHT_LONG_COLUMNS
 
 # 5. 提取 players table
-def extract_players(matches_file):
-    """
-    从 json 对象中提取 players 数据，将每个 player 和其下的多级属性展开成单独的列。
-    删除指定字段，保留需要展开的字段，并处理多级嵌套。
-    """
-    # 生成列名
+PLAYER_KEYS = [
+    "assists", "camps_stacked", "creeps_stacked", "deaths", "denies", "gold", "health",
+    "hero_id", "kills", "level", "lh", "max_health", "max_hero_hit", "max_mana",
+    "nearby_creep_death_count", "obs_left_log", "obs_log", "observers_placed",
+    "randomed", "rune_pickups", "sen_left_log", "sen_log", "sen_placed",
+    "stuns", "teamfight_participation", "towers_killed", "xp_reasons"
+]
+
+def _players_row(match):
+    row = []
+    for player in match['players']:
+        for key in PLAYER_KEYS:
+            if key in player:
+                if key == 'xp_reasons':
+                    # "xp_reasons": { "0": x, "1": x, "2": x, "3": x }
+                    for sub_key in ['0', '1', '2', '3']:
+                        row.append(player[key][sub_key] if sub_key in player[key] else None)
+                elif key == 'max_hero_hit':
+                    row.append(player[key]['value'])
+                else:
+                    row.append(player[key])
+            else:
+                row.append(None)
+    return row
+
+def _players_columns(max_len=None):
     key_name = []
-    needed_key = [
-        "assists", "camps_stacked", "creeps_stacked", "deaths", "denies", "gold", "health",
-        "hero_id", "kills", "level", "lh", "max_health", "max_hero_hit", "max_mana",
-        "nearby_creep_death_count", "obs_left_log", "obs_log", "observers_placed",
-        "randomed", "rune_pickups", "sen_left_log", "sen_log", "sen_placed",
-        "stuns", "teamfight_participation", "towers_killed", "xp_reasons"
-    ]
     for i in range(1, 11):
-        for key in needed_key:
+        for key in PLAYER_KEYS:
             if key == 'xp_reasons':
                 for j in range(0, 4):
                     key_name.append(f'players-{i}-{key}-{j}')
             else:
                 key_name.append(f'players-{i}-{key}')
+    return key_name
+
+# 长格式表的标记：行构造函数返回多行，每行前面再加上比赛的序号，并使用紧凑的数值类型
+LONG = 'long'
+
+# 表名 -> (行构造函数, 列名生成函数, 变长表中每个元素展开后的列数；定长表为 None，长格式表为 LONG)
+TABLES = {
+    'main':       (_main_row,       _main_columns,       None),
+    'objectives': (_objectives_row, _objectives_columns, len(OBJECTIVE_KEYS)),
+    'targets':    (_targets_row,    _targets_columns,    None),
+    'teamfights': (_teamfights_row, _teamfights_columns, TEAMFIGHT_WIDTH),
+    'players':    (_players_row,    _players_columns,    None),
+    # 团战的长格式表，见 utils.teamfights
+    'teamfights_long': (_teamfights_long_rows, _teamfights_long_columns, LONG),
+    # 每支队伍各类事件的次数和首次发生时间，见 utils.objectives
+    'objective_stats': (objective_stats_row, objective_stats_columns, None),
+}
+
+# 表名 -> 行构造函数读取的 JSON 路径，提取时只解码这些路径（见 utils.projection）。
+# main 表只需要 teamfights / chat 的长度，取其中一个小字段即可保留列表长度
+TABLE_PATHS = {
+    'main':       ['game_time', 'match_id_hash', 'teamfights.start', 'chat.time', 'game_mode', 'lobby_type'],
+    'objectives': [f'objectives.{key}' for key in OBJECTIVE_KEYS],
+    'targets':    ['targets.radiant_win'],
+    'teamfights': [f'teamfights.{key}' for key in TEAMFIGHT_KEYS] +
+                  [f'teamfights.players.{key}' for key in TEAMFIGHT_PLAYER_KEYS],
+    'players':    [f'players.{key}' for key in PLAYER_KEYS],
+    'teamfights_long': [f'teamfights.{key}' for key in TEAMFIGHT_KEYS] +
+                       [f'teamfights.players.{key}' for key in TEAMFIGHT_PLAYER_KEYS],
+    'objective_stats': ['objectives.type', 'objectives.player_slot', 'objectives.team', 'objectives.time'],
+}
+
+def _build_rows(tables, match):
+    return [TABLES[name][0](match) for name in tables]
+
+def _long_column(column):
+    # 含空值的列由 compact_dtype 选择 float32 或 float64
+    return column.astype(compact_dtype(column))
+
+def _long_frame(rows_per_match, columns):
+    """ 将每局比赛的多行数据拼接为一张表，第一列为比赛的序号，每列使用能无损保存其取值的最小类型 """
+    lengths = np.fromiter(map(len, rows_per_match), dtype='int64', count=len(rows_per_match))
+    values = np.array(list(chain.from_iterable(rows_per_match)), dtype='float64').reshape(-1, len(columns) - 1)
+
+    data = {columns[0]: np.repeat(np.arange(len(rows_per_match), dtype='int32'), lengths)}
+    for col, column in zip(columns[1:], values.T):
+        data[col] = _long_column(column)
+    return pd.DataFrame(data, columns=columns)
+
+def _rows_iter(matches_file, tables, n_jobs, projected, byte_range, n_shards=None):
+    """ 逐局比赛返回 tables 中每张表的行 """
+    build_rows = partial(_build_rows, tables)
+    paths = sorted(set().union(*(TABLE_PATHS[name] for name in tables))) if projected else None
+    if n_jobs == 1:
+        return map(instrument.timed('build_rows', build_rows),
+                   read_matches(matches_file, paths=paths, byte_range=byte_range))
+    return map_matches(build_rows, matches_file, n_jobs=n_jobs, n_shards=n_shards, paths=paths,
+                       byte_range=byte_range)
+
+def extract_tables(matches_file, tables=tuple(TABLES), n_jobs=1, projected=True, byte_range=None):
+    """
+    单次遍历比赛数据，同时提取 tables 中列出的所有表，返回 {表名: DataFrame}。
+    每局比赛只解码一次；objectives / teamfights 这类变长表在遍历过程中记录最大长度，
+    遍历结束后再统一补齐空值，不需要为求 max_len 额外扫描一遍文件。
+    n_jobs 不为 1 时在进程池中按分片并行解码并构造行，行的顺序与文件顺序一致。
+    projected 为 True 时只解码 TABLE_PATHS 中这些表需要的路径。
+    byte_range 为 (start, end) 时只提取该字节区间内的比赛，见 read_matches。
+    在 utils.instrument.Instrument 中调用时记录 read / decode / build_rows（或并行时的 shards）的累计时间，
+    以及遍历（extract_rows）和构造 DataFrame（dataframe）两个阶段的时间和内存峰值。
+    """
+    tables = tuple(tables)
+    rows_iter = _rows_iter(matches_file, tables, n_jobs, projected, byte_range)
+    data = {name: [] for name in tables}
+    max_len = {name: 0 for name in tables}
+    widths = [TABLES[name][2] for name in tables]
+
+    with instrument.stage('extract_rows'):
+        for rows in rows_iter:
+            for name, width, row in zip(tables, widths, rows):
+                data[name].append(row)
+                if width is not None and width != LONG:
+                    max_len[name] = max(max_len[name], len(row) // width)
+
+    result = {}
+    with instrument.stage('dataframe'):
+        for name, width in zip(tables, widths):
+            rows = data.pop(name)
+            if width == LONG:
+                result[name] = _long_frame(rows, TABLES[name][1]())
+                continue
+            if width is not None:
+                # 如果没有那么多 objectives / teamfights，则保留空值
+                n_cols = max_len[name] * width
+                for row in rows:
+                    row.extend([None] * (n_cols - len(row)))
+            result[name] = pd.DataFrame(rows, columns=TABLES[name][1](max_len[name]))
+
+    return result
+
+def extract_main(matches_file, n_jobs=1):
+    """
+    从JSON对象中提取所有不含嵌套属性的一级属性。
+    并对包含嵌套属性的一级属性统计其内部的数据数量。
+    """
+    return extract_tables(matches_file, ['main'], n_jobs=n_jobs)['main']
+
+def extract_objectives(matches_file, n_jobs=1):
+    """
+    从 json 对象中提取 objectives 数据，将每个 objective 展开成单独的列。
+    如果没有那么多 objectives，则保留空值。
+
+    每个 objective 对应 objective-{i}-type / player_slot / key / slot / team / time 六列。
+    旧版本的宽表没有 team 和 time 列，由其统计的事件次数中不包括只有 team、没有 player_slot 的事件
+    （如推塔、击杀 Roshan），由新宽表统计的次数会比旧的多，见 utils.objectives.aggregate_objectives。
+    """
+    return extract_tables(matches_file, ['objectives'], n_jobs=n_jobs)['objectives']
+
+def extract_targets(matches_file, n_jobs=1):
+    """
+    从 json 对象中提取 radiant_win 属性。
+    """
+    return extract_tables(matches_file, ['targets'], n_jobs=n_jobs)['targets']
+
+def extract_teamfights(matches_file, n_jobs=1):
+    """
+    从JSON对象中提取teamfights数据，将每个teamfight和其下的player属性展开成单独的列。
+    删除players中的ability_uses, deaths, deaths_pos, item_uses, 和killed字段。
+    """
+    return extract_tables(matches_file, ['teamfights'], n_jobs=n_jobs)['teamfights']
+
+def extract_teamfights_long(matches_file, n_jobs=1):
+    """
+    以长格式提取teamfights数据：每个 (比赛, 团战, 玩家) 一行，match 为比赛在文件中的序号。
+    不需要按最多的团战次数补齐空值，各列使用紧凑的数值类型。
+    没有玩家数据的团战占一行，player 为 -1（NO_PLAYER），玩家字段为空值。
+    """
+    return extract_tables(matches_file, ['teamfights_long'], n_jobs=n_jobs)['teamfights_long']
+
+def extract_players(matches_file, n_jobs=1):
+    """
+    从 json 对象中提取 players 数据，将每个 player 和其下的多级属性展开成单独的列。
+    删除指定字段，保留需要展开的字段，并处理多级嵌套。
+    """
+    return extract_tables(matches_file, ['players'], n_jobs=n_jobs)['players']
+
+# 分批提取：每批 batch_size 局比赛，行直接写入预先分配的数组，内存占用只与批次大小有关，与文件大小无关。
+# 数值写入 float64 数组（None 为 NaN），字符串 / 列表写入 object 数组，每批结束后再转换为紧凑的类型。
+
+BATCH_SIZE = 4096
+# 并行分批提取时每个分片的字节数上限，分片越小，主进程中等待的分片结果占用的内存越少
+BATCH_SHARD_BYTES = 64 << 20
+
+# 表名 -> 取值为字符串或列表的字段，其余字段均为数值
+OBJECT_KEYS = {
+    'main':       ['match_id_hash'],
+    'objectives': ['type', 'key'],
+    'players':    ['obs_left_log', 'obs_log', 'sen_left_log', 'sen_log'],
+}
+# 表名 -> 取值为布尔值的字段
+BOOL_KEYS = {
+    'targets': ['radiant_win'],
+    'players': ['randomed'],
+}
+
+def _getter(indices):
+    """ 返回从行中按 indices 取出元组的函数（itemgetter 只有一个下标时不返回元组） """
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda row: (row[index],)
+    return itemgetter(*indices)
+
+def _batch_column(values, is_bool):
+    """ 将一批数据中的一列数值转换为无损的紧凑类型：不含空值的整数取 compact_dtype，布尔值取 bool，其余为 float64 """
+    isnan = np.isnan(values)
+    if is_bool:
+        if isnan.any():
+            return pd.arrays.BooleanArray(np.where(isnan, 0, values).astype(bool), isnan)
+        return values.astype(bool)
+    if isnan.any():
+        return values.copy()
+    dtype = compact_dtype(values)
+    return values.astype('float64' if dtype.kind == 'f' else dtype)
+
+class _TableBuffer:
+    """ 一张表在一批比赛中的预分配缓冲区，在各批之间复用
+
+    变长表按出现过的最大长度扩展列，长格式表按行数扩展，扩展时容量加倍；批次中的列数为本批的最大长度。
+    """
 
-    # 提取数据
-    data = []
-    for match in read_matches(matches_file):
-        row = []
-        for player in match['players']:
-            for key in needed_key:
-                if key in player:
-                    if key == 'xp_reasons':
-                        # "xp_reasons": { "0": x, "1": x, "2": x, "3": x }
-                        for sub_key in ['0', '1', '2', '3']:
-                            row.append(player[key][sub_key] if sub_key in player[key] else None)
-                    elif key == 'max_hero_hit':
-                        row.append(player[key]['value'])
-                    else:
-                        row.append(player[key])
+    def __init__(self, name, batch_size):
+        self.name = name
+        _, self.columns_fn, self.width = TABLES[name]
+        if self.width == LONG:
+            unit = self.columns_fn()[1:]
+        else:
+            unit = self.columns_fn(1 if self.width is not None else 0)
+        # 一个单元为定长表的一整行、变长表的一个元素或长格式表除比赛序号以外的一行
+        object_keys = set(OBJECT_KEYS.get(name, ()))
+        bool_keys = set(BOOL_KEYS.get(name, ()))
+        self.unit_object = [col.rsplit('-', 1)[-1] in object_keys for col in unit]
+        self.unit_bool = [col.rsplit('-', 1)[-1] in bool_keys for col in unit]
+        self.unit_num = [i for i, is_object in enumerate(self.unit_object) if not is_object]
+        self.unit_obj = [i for i, is_object in enumerate(self.unit_object) if is_object]
+        self.getters = {}
+
+        self.n_units = 1
+        self.n_rows = 0
+        self.max_len = 0
+        self.capacity = batch_size
+        n_num = len(self.unit_num) + (self.width == LONG)
+        self.num = np.full((self.capacity, n_num), np.nan)
+        self.obj = np.full((self.capacity, len(self.unit_obj)), None, dtype=object)
+
+    def _resize(self, capacity, n_units):
+        """ 将缓冲区扩展到 capacity 行、n_units 个单元，已有数据保持不变（数组的列按单元依次排列） """
+        n_extra = self.width == LONG
+        num = np.full((capacity, n_units * len(self.unit_num) + n_extra), np.nan)
+        num[:self.capacity, :self.num.shape[1]] = self.num
+        obj = np.full((capacity, n_units * len(self.unit_obj)), None, dtype=object)
+        obj[:self.capacity, :self.obj.shape[1]] = self.obj
+        self.num, self.obj = num, obj
+        self.capacity, self.n_units = capacity, n_units
+
+    def _getters(self, n_units):
+        """ 前 n_units 个单元中数值 / 对象字段的取值函数 """
+        if n_units not in self.getters:
+            unit_len = len(self.unit_object)
+            num = [u * unit_len + i for u in range(n_units) for i in self.unit_num]
+            obj = [u * unit_len + i for u in range(n_units) for i in self.unit_obj]
+            self.getters[n_units] = (_getter(num), len(num), _getter(obj), len(obj))
+        return self.getters[n_units]
+
+    def append(self, row, match):
+        """ 写入一局比赛的行，长格式表的 row 为多行，match 为比赛的序号 """
+        i = self.n_rows
+        if self.width == LONG:
+            n = len(row)
+            if i + n > self.capacity:
+                self._resize(max(i + n, 2 * self.capacity), 1)
+            if n:
+                self.num[i:i + n, 0] = match
+                self.num[i:i + n, 1:] = row
+            self.n_rows += n
+            return
+
+        n_units = 1 if self.width is None else len(row) // self.width
+        if n_units > self.n_units:
+            self._resize(self.capacity, max(n_units, 2 * self.n_units))
+        self.max_len = max(self.max_len, n_units)
+        if not self.unit_obj:
+            self.num[i, :len(row)] = row
+        elif n_units:
+            get_num, n_num, get_obj, n_obj = self._getters(n_units)
+            self.num[i, :n_num] = get_num(row)
+            self.obj[i, :n_obj] = get_obj(row)
+        self.n_rows += 1
+
+    def frame(self) -> pd.DataFrame:
+        """ 将缓冲区中的数据转换为 DataFrame（复制数据），然后清空缓冲区 """
+        n = self.n_rows
+        data = {}
+        if self.width == LONG:
+            columns = self.columns_fn()
+            data[columns[0]] = self.num[:n, 0].astype('int32')
+            # 与 extract_tables 中的长格式表使用相同的类型
+            for i, col in enumerate(columns[1:]):
+                data[col] = _long_column(self.num[:n, i + 1])
+        else:
+            columns = self.columns_fn(self.max_len)
+            unit_len = len(self.unit_object)
+            # 字段在单元内数值 / 对象字段中的位置
+            rank = {i: k for fields in (self.unit_num, self.unit_obj) for k, i in enumerate(fields)}
+            for j, col in enumerate(columns):
+                unit, i = divmod(j, unit_len)
+                if self.unit_object[i]:
+                    data[col] = self.obj[:n, unit * len(self.unit_obj) + rank[i]].copy()
                 else:
-                    row.append(None)
-        data.append(row)
+                    data[col] = _batch_column(self.num[:n, unit * len(self.unit_num) + rank[i]], self.unit_bool[i])
+        df = pd.DataFrame(data, columns=columns)
+
+        self.num[:n] = np.nan
+        self.obj[:n] = None
+        self.n_rows = 0
+        self.max_len = 0
+        return df
+
+def extract_batches(matches_file, tables=tuple(TABLES), batch_size=BATCH_SIZE, n_jobs=1, projected=True,
+                    byte_range=None):
+    """ 生成器函数，分批提取 tables 中列出的所有表，每次返回 batch_size 局比赛的 {表名: DataFrame}
+
+    与 extract_tables 不同，行直接写入预先分配并在各批之间复用的数组，不会为整个文件保存逐个单元格的 Python 对象，
+    内存占用的上限只取决于 batch_size（以及变长表中最多的元素个数），可以处理任意大小的文件。
+
+    parameter:
+        1. matches_file : JSONL 文件路径
+        2. tables       : 需要提取的表名
+        3. batch_size   : 每批的比赛数，最后一批可能不足
+        4. n_jobs       : 进程数；并行时每个分片不超过 BATCH_SHARD_BYTES 字节，主进程中同时等待的分片数有上限
+        5. projected    : 同 extract_tables
+        6. byte_range   : 同 extract_tables
+
+    Tips:
+        1. 每批的 DataFrame 索引从 0 开始；长格式表的比赛序号在整个文件（或 byte_range）中连续编号
+        2. 变长表每批的列数为本批中的最大长度，拼接时需要 reindex 到所有批次中的最大长度，
+           utils.incremental.IncrementalStore 将每批保存为一个分段，加载时自动处理
+        3. 不含空值的整数列使用 compact_dtype，布尔列为 bool（含空值时为 boolean），其余数值列为 float64
+    """
+    tables = tuple(tables)
+    n_shards = None
+    if n_jobs != 1:
+        start, end = _byte_range(matches_file, byte_range)
+        n_shards = max(_effective_n_jobs(n_jobs) * 4, -(-(end - start) // BATCH_SHARD_BYTES))
+    rows_iter = _rows_iter(matches_file, tables, n_jobs, projected, byte_range, n_shards)
+
+    buffers = [_TableBuffer(name, batch_size) for name in tables]
+    frames = instrument.timed('batch_frames', lambda: {buffer.name: buffer.frame() for buffer in buffers})
+    n_matches = n_batch = 0
+    for rows in rows_iter:
+        for buffer, row in zip(buffers, rows):
+            buffer.append(row, n_matches)
+        n_matches += 1
+        n_batch += 1
+        if n_batch == batch_size:
+            yield frames()
+            n_batch = 0
+    if n_batch:
+        yield frames()
+
+
+# 6. 提取 players 的时序数据
+PLAYER_SERIES = ['times', 'gold_t', 'lh_t', 'xp_t', 'dn_t']
+PLAYER_SERIES_PATHS = ['match_id_hash'] + [f'players.{key}' for key in PLAYER_SERIES]
+
+def _player_series(match):
+    return match['match_id_hash'], [[player[key] for key in PLAYER_SERIES] for player in match['players']]
+
+def extract_player_series(matches_file, output_dir, n_jobs=1):
+    """
+    提取每局比赛中 10 名玩家的 times / gold_t / lh_t / xp_t / dn_t 时序数据，
+    以 CSR 格式保存到 output_dir 中，可通过 utils.timeseries.PlayerSeries 内存映射加载：
+        values.npy    : (len(PLAYER_SERIES), 总长度) 的 int32 数组，每行是一种时序数据首尾相接的结果
+        offsets.npy   : 第 i 局比赛第 j 名玩家的数据位于 values[:, offsets[10 * i + j]:offsets[10 * i + j + 1]]
+        match_ids.npy : 每局比赛的 match_id_hash
+    """
+    if n_jobs == 1:
+        series_iter = map(_player_series, read_matches(matches_file, paths=PLAYER_SERIES_PATHS))
+    else:
+        series_iter = map_matches(_player_series, matches_file, n_jobs=n_jobs, paths=PLAYER_SERIES_PATHS)
+
+    # 使用 array 作为缓冲区，避免为每个数值创建 Python 对象列表
+    buffers = [array('i') for _ in PLAYER_SERIES]
+    lengths = array('q')
+    match_ids = []
+    with instrument.stage('extract_rows'):
+        for match_id, players in series_iter:
+            match_ids.append(match_id)
+            for series in players:
+                lengths.append(len(series[0]))
+                for buf, values in zip(buffers, series):
+                    buf.extend(values)
+
+    offsets = np.zeros(len(lengths) + 1, dtype='int64')
+    np.cumsum(np.frombuffer(lengths, dtype='int64'), out=offsets[1:])
+
+    os.makedirs(output_dir, exist_ok=True)
+    with instrument.stage('save'):
+        np.save(os.path.join(output_dir, 'values.npy'),
+                np.stack([np.frombuffer(buf, dtype=np.intc) for buf in buffers]).astype('int32', copy=False))
+        np.save(os.path.join(output_dir, 'offsets.npy'), offsets)
+        np.save(os.path.join(output_dir, 'match_ids.npy'), np.array(match_ids, dtype='S'))
+        with open(os.path.join(output_dir, 'meta.json'), 'w') as fout:
+            json.dump({'series': PLAYER_SERIES, 'players': 10}, fout)
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.extractdata [path/to/matches.jsonl]
+    import sys
+    import time
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    # 原来的逐表提取：每张表单独完整解码一遍文件，objectives / teamfights 还要先多遍历一遍求最大长度。
+    # 行构造函数与 extract_tables 相同，只有遍历方式不同，因此结果可以直接比较
+    def multi_pass(name):
+        row_fn, columns_fn, width = TABLES[name]
+        max_len = 0
+        if width is not None:
+            for match in read_matches(matches_file):
+                max_len = max(max_len, len(match[name]))
+        rows = []
+        for match in read_matches(matches_file):
+            row = row_fn(match)
+            if width is not None:
+                row.extend([None] * (max_len * width - len(row)))
+            rows.append(row)
+        return pd.DataFrame(rows, columns=columns_fn(max_len))
+
+    baseline_tables = ['main', 'objectives', 'targets', 'teamfights', 'players']
+
+    start = time.time()
+    per_table = {name: multi_pass(name) for name in baseline_tables}
+    print(f"逐表多次遍历提取执行时间: {time.time() - start}秒")
+
+    start = time.time()
+    single_pass = extract_tables(matches_file, baseline_tables)
+    print(f"单次遍历提取执行时间: {time.time() - start}秒")
+
+    start = time.time()
+    parallel = extract_tables(matches_file, baseline_tables, n_jobs=-1)
+    print(f"并行单次遍历提取执行时间: {time.time() - start}秒")
 
-    # 将数据转换为 DataFrame
-    return pd.DataFrame(data, columns=key_name)
+    for name, df in per_table.items():
+        pd.testing.assert_frame_equal(df, single_pass[name])
+        pd.testing.assert_frame_equal(df, parallel[name])
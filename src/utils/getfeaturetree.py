@@ -1,5 +1,10 @@
-import pandas as pd
-from .readjsonl import read_matches
+import multiprocessing
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+from .compressed import compression
+from .readjsonl import read_matches, read_shard, map_shards, split_shards, _effective_n_jobs
 
 def extract_keys(data, parent_key=None, res=None):
     """ 递归提取 JSON 对象中的键及其父子关系 """
@@ -18,35 +23,115 @@ def extract_keys(data, parent_key=None, res=None):
 
     return res
 
-def get_keys_relation(path_to_data):
-    keys_rel_set = set()
-
-    for match in read_matches(path_to_data):
-        keys_rel_set.update(extract_keys(match))
-
-    keys_rel_df = pd.DataFrame(keys_rel_set, columns=["parent", "child"])
-
-    keys_rel_df.fillna("NULL", inplace=True)
-
-    # 去除 child 为数字的行
-    keys_rel_df = keys_rel_df[~keys_rel_df["child"].str.isnumeric()]
-
-    # 去除 parent 最后一个单元为数字的行
-    keys_rel_df = keys_rel_df[~keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]).str.isnumeric()]
+# 不需要展开的子树：保留这些键本身，但不再遍历其内部
+EXCLUDED_KEYS = frozenset([
+    'ability_uses', 'item_uses', 'damage_inflictor', 'hero_hits', 'damage_inflictor_received', 'purchase'
+])
 
-    # 去除不重要的键
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "ability_uses"]
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "item_uses"]
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "damage_inflictor"]
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "hero_hits"]
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "damage_inflictor_received"]
-    keys_rel_df = keys_rel_df[keys_rel_df["parent"].str.split(".").apply(lambda x: x[-1]) != "purchase"]
+# 前缀树中被跳过的键所对应的节点
+_SKIPPED = ((), {})
 
-    # 去除所有含有 "npc_dota" 的行
-    keys_rel_df = keys_rel_df[~keys_rel_df["parent"].str.contains("npc_dota")]
-    keys_rel_df = keys_rel_df[~keys_rel_df["child"].str.contains("npc_dota")]
+def _collect_schema(data, node, exclude):
+    """ 递归统计 JSON 对象中每个键的出现次数及取值类型，遍历时直接跳过不需要的子树
 
-    return keys_rel_df.apply(lambda x: tuple(x), axis=1).values
+    统计结果以前缀树保存：node = ({取值类型: 出现次数}, {子键: 子节点})，
+    遍历时只需按键查找子节点，不需要为每个键拼接完整路径。
+    """
+    if isinstance(data, dict):
+        children = node[1]
+        for key, val in data.items():
+            child = children.get(key)
+            if child is None:
+                # 以数字为键（如 xp_reasons 的 "0"）或含有 "npc_dota" 的键都是具体取值而非特征名
+                child = children[key] = _SKIPPED if key.isnumeric() or 'npc_dota' in key else ({}, {})
+            if child is _SKIPPED:
+                continue
+            types = child[0]
+            val_type = type(val)
+            types[val_type] = types.get(val_type, 0) + 1
+            if (val_type is dict or val_type is list) and key not in exclude:
+                _collect_schema(val, child, exclude)
+    elif isinstance(data, list):
+        for item in data:
+            # 列表中的数值（如 gold_t）没有键，不需要逐个遍历
+            if isinstance(item, (dict, list)):
+                _collect_schema(item, node, exclude)
+
+def _flatten_schema(node, parent_key, schema):
+    """ 将前缀树展开为 {键路径: {类型名: 出现次数}} """
+    for key, child in node[1].items():
+        if child is _SKIPPED:
+            continue
+        current_key = f"{parent_key}.{key}" if parent_key else key
+        schema[current_key] = {val_type.__name__: count for val_type, count in child[0].items()}
+        _flatten_schema(child, current_key, schema)
+    return schema
+
+def _schema_of_matches(exclude, limit, matches):
+    root = ({}, {})
+    for match in islice(matches, limit):
+        _collect_schema(match, root, exclude)
+    return _flatten_schema(root, None, {})
+
+def _schema_of_shard(exclude, matches_file, shard_limit):
+    (start, end), limit = shard_limit
+    return _schema_of_matches(exclude, limit, read_shard(matches_file, start, end))
+
+def _merge_schema(schema, other):
+    for path, types in other.items():
+        merged = schema.setdefault(path, {})
+        for type_name, count in types.items():
+            merged[type_name] = merged.get(type_name, 0) + count
+    return schema
+
+def discover_schema(path_to_data, n_jobs=1, sample=None, exclude=EXCLUDED_KEYS):
+    """ 统计数据集中每个键路径（如 players.kills）的出现次数及取值类型
+
+    parameter:
+        1. path_to_data : JSONL 文件路径
+        2. n_jobs       : 进程数，不为 1 时按分片并行统计后合并
+        3. sample       : 最多统计的比赛数，为 None 时统计全部比赛；并行时平均分配到各个分片，
+                          压缩文件无法按字节分片，统计最前面的 sample 局比赛
+        4. exclude      : 不需要展开的键
+
+    returned value:
+        {键路径: Counter({类型名: 出现次数})}
+    """
+    if n_jobs == 1:
+        schema = _schema_of_matches(exclude, sample, read_matches(path_to_data))
+    elif sample is None:
+        schema = {}
+        for partial_schema in map_shards(partial(_schema_of_matches, exclude, None), path_to_data,
+                                         n_jobs=n_jobs, ordered=False):
+            _merge_schema(schema, partial_schema)
+    elif compression(path_to_data) is not None:
+        schema = _schema_of_matches(exclude, sample, read_matches(path_to_data, n_jobs=n_jobs))
+    else:
+        n_jobs = _effective_n_jobs(n_jobs)
+        shards = split_shards(path_to_data, n_jobs * 4)
+        if not shards:
+            return {}
+        # 前 sample % 分片数 个分片各统计 sample // 分片数 + 1 局，其余统计 sample // 分片数 局，合计恰好为 sample
+        quotient, remainder = divmod(sample, len(shards))
+        limits = [quotient + 1] * remainder + [quotient] * (len(shards) - remainder)
+        schema = {}
+        with multiprocessing.Pool(min(n_jobs, len(shards))) as pool:
+            for partial_schema in pool.imap_unordered(partial(_schema_of_shard, exclude, path_to_data),
+                                                      zip(shards, limits)):
+                _merge_schema(schema, partial_schema)
+
+    return {path: Counter(types) for path, types in schema.items()}
+
+def schema_relations(schema):
+    """ 将键路径转换为 (parent, child) 关系，顶层键的 parent 为 "NULL" """
+    relations = []
+    for path in schema:
+        parent, _, child = path.rpartition('.')
+        relations.append((parent or "NULL", child))
+    return sorted(relations)
+
+def get_keys_relation(path_to_data, n_jobs=1, sample=None):
+    return schema_relations(discover_schema(path_to_data, n_jobs=n_jobs, sample=sample))
 
 def build_tree(tuples):
     """ 根据父子关系列表构建树结构 """
@@ -73,9 +158,18 @@ def build_tree(tuples):
 
     return tree
 
-def print_tree(tree, depth=0, file=None):
-    """ 将树格式化打印到 .txt 文件中 """
+def print_tree(tree, depth=0, file=None, schema=None, path=None):
+    """ 将树格式化打印到 .txt 文件中
+
+    给出 discover_schema 的统计结果 schema 时，在每个键后附上其出现次数和取值类型。
+    """
 
     for key, val in tree.items():
-        print(f"{'    ' * depth}{key}", file=file)
-        print_tree(val, depth + 1, file)
+        current_path = key if path is None or path == "NULL" else f"{path}.{key}"
+        line = f"{'    ' * depth}{key}"
+        if schema is not None and current_path in schema:
+            counter = schema[current_path]
+            types = ", ".join(f"{name}: {count}" for name, count in counter.most_common())
+            line += f"  [{sum(counter.values())}; {types}]"
+        print(line, file=file)
+        print_tree(val, depth + 1, file, schema, current_path)
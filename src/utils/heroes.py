@@ -0,0 +1,185 @@
+import os
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+import ujson as json
+
+from .readjsonl import map_matches, read_matches
+
+# 英雄阵容的稀疏特征：
+#   hero_{a}       : a 在 Radiant 中为 +1，在 Dire 中为 -1
+#   team_{a}_{b}   : 同队的英雄对（a < b），同在 Radiant 中为 +1，同在 Dire 中为 -1
+#   vs_{a}_{b}     : 对阵的英雄对（a < b），a 在 Radiant、b 在 Dire 时为 +1，反之为 -1
+# 交换两队时所有特征都只改变符号。每局比赛固定有 10 + 20 + 25 个非零值，
+# 因此矩阵的大小与比赛数成正比，不会像稠密的 one-hot 那样随英雄对的数量平方增长。
+
+HERO_PATHS = ['players.hero_id']
+PAIR_KINDS = ('team', 'vs')
+
+_TEAM_PAIRS = np.array([(i, j) for i in range(5) for j in range(i + 1, 5)])
+_TEAM_PAIRS = np.concatenate([_TEAM_PAIRS, _TEAM_PAIRS + 5])
+_VS_PAIRS = np.array([(i, j) for i in range(5) for j in range(5, 10)])
+
+def _hero_ids(match):
+    return [player['hero_id'] for player in match['players']]
+
+def read_hero_ids(matches_file, n_jobs=1) -> np.ndarray:
+    """ 读取每局比赛 10 名玩家的 hero_id，返回 (比赛数, 10) 的 int16 数组，前 5 列为 Radiant """
+    if n_jobs == 1:
+        ids_iter = map(_hero_ids, read_matches(matches_file, paths=HERO_PATHS))
+    else:
+        ids_iter = map_matches(_hero_ids, matches_file, n_jobs=n_jobs, paths=HERO_PATHS)
+
+    buffer = array('h')
+    for ids in ids_iter:
+        buffer.extend(ids)
+    return np.frombuffer(buffer, dtype='int16').reshape(-1, 10)
+
+def _pair_index(a, b, n):
+    """ 0 <= a < b < n 的无序对在所有 n * (n - 1) / 2 个对中的序号 """
+    return a * n - a * (a + 1) // 2 + (b - a - 1)
+
+class HeroVocabulary:
+    """ hero_id 到列号的映射，按 hero_id 排序，保存后在测试集 / 线上评分时复用，保证列的含义不变 """
+
+    def __init__(self, heroes, pairs=PAIR_KINDS):
+        """
+        parameter:
+            1. heroes : 出现过的 hero_id
+            2. pairs  : 需要的英雄对特征，'team'（同队）/ 'vs'（对阵）的子集
+        """
+        self.heroes = sorted({int(hero) for hero in heroes})
+        self.pairs  = [kind for kind in PAIR_KINDS if kind in pairs]
+        self.lookup = np.full(max(self.heroes, default=0) + 1, -1, dtype='int64')
+        self.lookup[self.heroes] = np.arange(len(self.heroes))
+
+    @classmethod
+    def fit(cls, hero_ids, pairs=PAIR_KINDS):
+        """ 由训练集的 (比赛数, 10) hero_id 数组建立词表 """
+        hero_ids = np.asarray(hero_ids)
+        return cls(np.unique(hero_ids[hero_ids > 0]), pairs)
+
+    def save(self, path):
+        with open(path, 'w') as fout:
+            json.dump({'heroes': self.heroes, 'pairs': self.pairs}, fout)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as fin:
+            meta = json.load(fin)
+        return cls(meta['heroes'], meta['pairs'])
+
+    @property
+    def n_heroes(self):
+        return len(self.heroes)
+
+    @property
+    def n_pairs(self):
+        return self.n_heroes * (self.n_heroes - 1) // 2
+
+    def n_features(self):
+        return self.n_heroes + len(self.pairs) * self.n_pairs
+
+    def feature_names(self) -> list:
+        names = [f'hero_{hero}' for hero in self.heroes]
+        for kind in self.pairs:
+            names += [f'{kind}_{a}_{b}' for i, a in enumerate(self.heroes) for b in self.heroes[i + 1:]]
+        return names
+
+    def index(self, hero_ids) -> np.ndarray:
+        """ 将 hero_id 转换为词表中的序号，词表中没有的英雄为 -1 """
+        hero_ids = np.asarray(hero_ids, dtype='int64')
+        known = (hero_ids >= 0) & (hero_ids < len(self.lookup))
+        return np.where(known, self.lookup[np.where(known, hero_ids, 0)], -1)
+
+    def transform(self, hero_ids) -> sp.csr_matrix:
+        """ 将 (比赛数, 10) 的 hero_id 数组转换为 (比赛数, n_features()) 的 CSR 矩阵
+
+        词表中没有的英雄（如新英雄）以及包含它的英雄对都被忽略。
+        """
+        heroes = self.index(np.asarray(hero_ids).reshape(-1, 10))
+        n_matches = len(heroes)
+        sign = np.repeat([[1, -1]], 5, axis=0).T.ravel()  # Radiant 为 +1，Dire 为 -1
+
+        cols = [heroes]
+        data = [np.broadcast_to(sign, heroes.shape)]
+        base = self.n_heroes
+        for kind in self.pairs:
+            pairs = _TEAM_PAIRS if kind == 'team' else _VS_PAIRS
+            a, b = heroes[:, pairs[:, 0]], heroes[:, pairs[:, 1]]
+            low, high = np.minimum(a, b), np.maximum(a, b)
+            col = np.where((a < 0) | (b < 0) | (a == b), -1, base + _pair_index(low, high, self.n_heroes))
+            if kind == 'team':
+                value = np.broadcast_to(sign[pairs[:, 0]], col.shape)
+            else:
+                # Radiant 一方的英雄序号较小时为 +1
+                value = np.where(a < b, 1, -1)
+            cols.append(col)
+            data.append(value)
+            base += self.n_pairs
+
+        cols = np.concatenate(cols, axis=1)
+        data = np.concatenate(data, axis=1).astype('float32')
+        valid = cols >= 0
+        indptr = np.zeros(n_matches + 1, dtype='int64')
+        np.cumsum(valid.sum(axis=1), out=indptr[1:])
+        matrix = sp.csr_matrix((data[valid], cols[valid], indptr), shape=(n_matches, self.n_features()))
+        matrix.sort_indices()
+        return matrix
+
+def hero_matrix(matches_file, vocabulary=None, pairs=PAIR_KINDS, n_jobs=1):
+    """ 从比赛数据中构建英雄阵容的稀疏矩阵
+
+    parameter:
+        1. matches_file : JSONL 文件路径
+        2. vocabulary   : HeroVocabulary 或其保存路径；为 None 时由本文件中出现的英雄建立（训练集）
+        3. pairs        : 建立词表时需要的英雄对特征，见 HeroVocabulary
+        4. n_jobs       : 读取数据的进程数
+
+    returned value:
+        (CSR 矩阵, HeroVocabulary)
+
+    Tips:
+        1. 训练集上得到的词表需要用 vocabulary.save 保存，测试集和线上评分时传入同一个词表
+        2. 矩阵可以直接传给 RandomForestClassifier / lightgbm，或用 scipy.sparse.hstack 与其他特征拼接
+    """
+    hero_ids = read_hero_ids(matches_file, n_jobs=n_jobs)
+    if vocabulary is None:
+        vocabulary = HeroVocabulary.fit(hero_ids, pairs)
+    elif isinstance(vocabulary, (str, os.PathLike)):
+        vocabulary = HeroVocabulary.load(vocabulary)
+    return vocabulary.transform(hero_ids), vocabulary
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.heroes [path/to/matches.jsonl]
+    import sys
+    import time
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    start = time.time()
+    hero_ids = read_hero_ids(matches_file)
+    print(f"读取 {len(hero_ids)} 局比赛的英雄: {time.time() - start:.2f}秒")
+
+    vocabulary = HeroVocabulary.fit(hero_ids)
+    start = time.time()
+    matrix = vocabulary.transform(hero_ids)
+    print(f"构建 {matrix.shape} 的矩阵（{matrix.nnz} 个非零值）: {time.time() - start:.3f}秒, "
+          f"{(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20:.2f}MB")
+
+    # 与逐局比赛、逐个英雄对的 Python 循环对比
+    names = {name: i for i, name in enumerate(vocabulary.feature_names())}
+    for row, ids in enumerate(hero_ids[:200]):
+        expected = {}
+        for i, hero in enumerate(ids):
+            expected[names[f'hero_{hero}']] = 1 if i < 5 else -1
+        for i in range(10):
+            for j in range(i + 1, 10):
+                a, b = sorted((ids[i], ids[j]))
+                if (i < 5) == (j < 5):
+                    expected[names[f'team_{a}_{b}']] = 1 if i < 5 else -1
+                else:
+                    expected[names[f'vs_{a}_{b}']] = 1 if ids[i] == a else -1
+        dense = matrix[row].toarray().ravel()
+        assert dict(zip(np.flatnonzero(dense), dense[dense != 0])) == expected
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import shutil
+
+import pandas as pd
+import ujson as json
+
+from .extractdata import BATCH_SIZE, EXTRACTOR_VERSION, LONG, TABLES, extract_batches, extract_tables
+from .tablecache import load_table, save_table
+
+# 存储目录结构：
+#   store_dir/manifest.json              已处理的源文件水位线、每张表的分段列表和当前的最大长度
+#   store_dir/<表名>/<分段号>/...        每次增量提取的每一批新行，以 tablecache.save_table 的格式保存
+# 每次 update 只读取源文件中新追加的行，每 batch_size 局比赛写入一个新的分段，耗时与新数据量成正比；
+# objectives / teamfights 这类变长表的列数取决于全局的最大长度，旧分段中没有的列在加载时补为空值。
+
+FINGERPRINT_WINDOW = 1 << 20
+
+def fingerprint(matches_file, offset, window=FINGERPRINT_WINDOW):
+    """ 文件前 offset 字节的指纹：开头和结尾各 window 字节的 blake2b 哈希
+
+    只追加新行时指纹不变；文件被改写或截断时指纹（或文件大小）会变化。
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(offset).encode())
+    with open(matches_file, 'rb') as fin:
+        digest.update(fin.read(min(window, offset)))
+        if offset > window:
+            fin.seek(max(window, offset - window))
+            digest.update(fin.read(offset - fin.tell()))
+    return digest.hexdigest()
+
+def complete_lines_end(matches_file):
+    """ 文件中最后一个完整行（以换行符结尾）之后的字节位置，正在写入的最后一行不会被处理 """
+    size = os.path.getsize(matches_file)
+    with open(matches_file, 'rb') as fin:
+        pos = size
+        while pos > 0:
+            start = max(0, pos - 65536)
+            fin.seek(start)
+            chunk = fin.read(pos - start)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            pos = start
+    return 0
+
+class IncrementalStore:
+    """ 增量提取的表存储：记录每个源文件已经处理到的位置，之后只提取新追加的比赛 """
+
+    def __init__(self, store_dir, tables=tuple(TABLES)):
+        """
+        parameter:
+            1. store_dir : 存储目录，不存在时自动创建
+            2. tables    : 需要维护的表名；与已有存储中的表不一致时报错
+        """
+        self.store_dir = store_dir
+        self.manifest_path = os.path.join(store_dir, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as fin:
+                self.manifest = json.load(fin)
+            if self.manifest['version'] != EXTRACTOR_VERSION:
+                raise ValueError(f"存储由第 {self.manifest['version']} 版提取器生成，"
+                                 f"当前为第 {EXTRACTOR_VERSION} 版，需要调用 reset 后重新提取")
+            if list(tables) != self.manifest['tables']:
+                raise ValueError(f"存储中的表为 {self.manifest['tables']}，与请求的 {list(tables)} 不一致")
+        else:
+            self.manifest = self._empty_manifest(tables)
+
+    @staticmethod
+    def _empty_manifest(tables):
+        return {
+            'version':   EXTRACTOR_VERSION,
+            'tables':    list(tables),
+            'n_matches': 0,
+            'sources':   {},
+            'segments':  [],
+            'next_segment': 0,
+            'max_len':   {name: 0 for name in tables},
+        }
+
+    def _save_manifest(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as fout:
+            json.dump(self.manifest, fout)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _new_segment(self):
+        """ 分配一个新的分段名：编号只增不减，不会与磁盘上已有的分段（包括合并后的分段）重名 """
+        if 'next_segment' not in self.manifest:
+            # 旧版本的清单中没有计数器，从已有分段的最大编号之后开始
+            self.manifest['next_segment'] = max((int(segment['name']) + 1 for segment in self.manifest['segments']),
+                                                default=0)
+        name = f"{self.manifest['next_segment']:06d}"
+        self.manifest['next_segment'] += 1
+        return name
+
+    def reset(self):
+        """ 删除已经提取的所有数据 """
+        tables = self.manifest['tables']
+        if os.path.exists(self.store_dir):
+            shutil.rmtree(self.store_dir)
+        self.manifest = self._empty_manifest(tables)
+
+    def watermark(self, matches_file):
+        """ 源文件的水位线 {'offset', 'fingerprint', 'n_matches'}，未处理过时为 None """
+        return self.manifest['sources'].get(os.path.abspath(matches_file))
+
+    def pending_range(self, matches_file):
+        """ 源文件中尚未处理的字节区间 (start, end)
+
+        文件在水位线之前的内容被修改过（指纹不一致或文件变短）时报错，此时需要 reset 后重新提取。
+        """
+        mark = self.watermark(matches_file)
+        start = 0
+        if mark is not None:
+            start = mark['offset']
+            if os.path.getsize(matches_file) < start or fingerprint(matches_file, start) != mark['fingerprint']:
+                raise ValueError(f"{matches_file} 在已处理的部分发生了变化，需要调用 reset 后重新提取")
+        return start, complete_lines_end(matches_file)
+
+    def update(self, matches_file, n_jobs=1, batch_size=BATCH_SIZE) -> int:
+        """ 分批提取源文件中新追加的比赛，每批写入一个新的分段，返回新增的比赛数
+
+        提取使用 extract_batches，内存占用只与 batch_size 有关，与新追加的数据量无关。
+        """
+        start, end = self.pending_range(matches_file)
+        if end <= start:
+            return 0
+
+        tables = self.manifest['tables']
+        key = os.path.abspath(matches_file)
+        base = self.manifest['n_matches']
+        # 用一张每局比赛一行的表统计每批的比赛数
+        counter = next((name for name in tables if TABLES[name][2] != LONG), tables[0])
+        segments = []
+        for frames in extract_batches(matches_file, tables, batch_size=batch_size, n_jobs=n_jobs,
+                                      byte_range=(start, end)):
+            segment = self._new_segment()
+            for name, df in frames.items():
+                width = TABLES[name][2]
+                if width == LONG:
+                    # 长格式表中的比赛序号接在已有的比赛之后
+                    df[df.columns[0]] += base
+                elif width is not None:
+                    n_wide = len(df.columns) - len(TABLES[name][1](0))
+                    self.manifest['max_len'][name] = max(self.manifest['max_len'][name], n_wide // width)
+                save_table(df, os.path.join(self.store_dir, name, segment))
+            segments.append({'name': segment, 'source': key, 'range': [start, end],
+                             'n_matches': len(frames[counter])})
+        n_new = sum(segment['n_matches'] for segment in segments)
+
+        # 分段写完之后再更新清单，中途中断时未登记的分段会在下次 update 时被覆盖
+        previous = self.manifest['sources'].get(key, {'n_matches': 0})
+        self.manifest['sources'][key] = {
+            'offset':      end,
+            'fingerprint': fingerprint(matches_file, end),
+            'n_matches':   previous['n_matches'] + n_new,
+        }
+        self.manifest['segments'].extend(segments)
+        self.manifest['n_matches'] += n_new
+        self._save_manifest()
+        return n_new
+
+    def columns(self, name):
+        """ 表当前的全部列名，变长表按所有分段中的最大长度展开 """
+        return TABLES[name][1](self.manifest['max_len'][name])
+
+    def load(self, name, columns=None) -> pd.DataFrame:
+        """ 加载一张表的所有分段，旧分段中没有的列补为空值
+
+        parameter:
+            1. name    : 表名
+            2. columns : 需要的列名，默认为全部列
+        """
+        columns = self.columns(name) if columns is None else list(columns)
+        frames = []
+        for segment in self.manifest['segments']:
+            table_dir = os.path.join(self.store_dir, name, segment['name'])
+            with open(os.path.join(table_dir, 'meta.json')) as fin:
+                present = set(json.load(fin)['columns'])
+            frame = load_table(table_dir, [col for col in columns if col in present], mmap_mode=None)
+            frames.append(frame.reindex(columns=columns))
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def compact(self):
+        """ 将每张表的所有分段合并为一个分段（之后加载时不需要逐个分段拼接） """
+        if len(self.manifest['segments']) <= 1:
+            return
+        merged = self._new_segment()
+        for name in self.manifest['tables']:
+            save_table(self.load(name), os.path.join(self.store_dir, name, merged))
+        old = self.manifest['segments']
+        self.manifest['segments'] = [{'name': merged, 'source': None, 'range': None,
+                                      'n_matches': self.manifest['n_matches']}]
+        self._save_manifest()
+        for name in self.manifest['tables']:
+            for segment in old:
+                shutil.rmtree(os.path.join(self.store_dir, name, segment['name']), ignore_errors=True)
+
+def incremental_extract(matches_file, store_dir, tables=tuple(TABLES), n_jobs=1):
+    """ 增量地提取 matches_file 中新追加的比赛，返回 {表名: 包含全部比赛的 DataFrame} """
+    store = IncrementalStore(store_dir, tables)
+    store.update(matches_file, n_jobs=n_jobs)
+    return {name: store.load(name) for name in tables}
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.incremental [path/to/matches.jsonl] [store_dir]
+    import sys
+    import tempfile
+    import time
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+    store_dir = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+
+    # 先处理前 90% 的比赛，再模拟追加剩余 10% 的比赛
+    with open(matches_file, 'rb') as fin:
+        lines = fin.readlines()
+    head = len(lines) * 9 // 10
+    growing = os.path.join(store_dir, 'growing.jsonl')
+    os.makedirs(store_dir, exist_ok=True)
+    with open(growing, 'wb') as fout:
+        fout.writelines(lines[:head])
+
+    store = IncrementalStore(os.path.join(store_dir, 'tables'))
+    store.reset()
+    start = time.time()
+    store.update(growing, batch_size=max(head // 3, 1))
+    print(f"首次提取 {head} 局: {time.time() - start:.2f}秒")
+
+    # 合并 -> 追加 -> 追加 -> 合并：合并后的分段不能被之后的 update 覆盖，再次合并时也不能删掉自己
+    store.compact()
+    middle = (head + len(lines)) // 2
+    start = time.time()
+    n_new = 0
+    for part in (lines[head:middle], lines[middle:]):
+        with open(growing, 'ab') as fout:
+            fout.writelines(part)
+        n_new += store.update(growing, batch_size=max(len(part) // 2, 1))
+    print(f"增量提取 {n_new} 局: {time.time() - start:.2f}秒")
+    names = [segment['name'] for segment in store.manifest['segments']]
+    assert len(set(names)) == len(names)
+    store.compact()
+    assert len(store.manifest['segments']) == 1
+    assert store.manifest['segments'][0]['name'] not in names
+
+    full_dir = os.path.join(store_dir, 'full')
+    # extract_batches 的整数列使用紧凑类型、空值为 NaN，extract_tables 中全为空的列为 None，只比较取值
+    def normalized(df):
+        return df.astype(object).where(df.notna(), None)
+
+    for name, df in extract_tables(growing).items():
+        save_table(df, os.path.join(full_dir, name))
+        pd.testing.assert_frame_equal(normalized(store.load(name)),
+                                      normalized(load_table(os.path.join(full_dir, name), mmap_mode=None)))
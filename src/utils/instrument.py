@@ -0,0 +1,325 @@
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import ujson as json
+
+# 当前生效的 Instrument（可以嵌套，栈顶生效）。没有生效的 Instrument 时，
+# 各个钩子函数直接返回原对象 / 空的上下文管理器，数据流水线不做任何额外的工作。
+_active = []
+
+def current():
+    """ 当前生效的 Instrument，没有时返回 None """
+    return _active[-1] if _active else None
+
+def _proc_status(field):
+    """ 读取 /proc/self/status 中以 kB 为单位的字段，返回字节数；不可用时返回 None """
+    try:
+        with open('/proc/self/status') as fin:
+            for line in fin:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def rss_bytes():
+    """ 本进程当前的 RSS，不可用时返回 None """
+    return _proc_status('VmRSS')
+
+def peak_rss_bytes():
+    """ 本进程的 RSS 峰值（VmHWM），不可用时返回 None """
+    return _proc_status('VmHWM')
+
+def reset_peak_rss():
+    """ 将本进程的 RSS 峰值重置为当前值（Linux 4.0 及以上），成功时返回 True
+
+    会影响进程中所有读取 VmHWM 的代码，只应在单独的进程中使用（如 utils.benchmark 中 fork 出的子进程）。
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fout:
+            fout.write('5')
+        return True
+    except OSError:
+        return False
+
+class _RssSampler:
+    """ 有阶段正在执行时，在后台线程中每隔 interval 秒读取一次 RSS，记录每个阶段执行期间 RSS 的最大值 """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peaks    = {}
+        self.lock     = threading.Lock()
+        self.thread   = None
+        self.next_id  = 0
+
+    def open(self, rss):
+        """ 开始记录一个阶段，rss 为阶段开始时的 RSS，返回 close 时使用的编号 """
+        with self.lock:
+            token = self.next_id
+            self.next_id += 1
+            self.peaks[token] = rss
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return token
+
+    def close(self, token):
+        """ 结束记录，返回阶段执行期间采样到的 RSS 最大值 """
+        self._sample()
+        with self.lock:
+            return self.peaks.pop(token)
+
+    def _sample(self):
+        rss = rss_bytes() or 0
+        with self.lock:
+            for token, peak in self.peaks.items():
+                if rss > peak:
+                    self.peaks[token] = rss
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.peaks:
+                    self.thread = None
+                    return
+            self._sample()
+            time.sleep(self.interval)
+
+def _mb(n_bytes):
+    return None if n_bytes is None else round(n_bytes / 2 ** 20, 3)
+
+class ProgressBar:
+    """ 以读取的字节数显示进度的钩子（每次开始读取一个文件时新建一个进度条） """
+
+    def __init__(self, **tqdm_kwargs):
+        self.kwargs = tqdm_kwargs
+        self.bar    = None
+
+    def on_start(self, name, total_bytes):
+        from tqdm import tqdm
+        self.on_close(None)
+        self.bar = tqdm(total=total_bytes, desc=name, unit='B', unit_scale=True, unit_divisor=1024, **self.kwargs)
+
+    def on_progress(self, n_bytes):
+        if self.bar is not None:
+            self.bar.update(n_bytes)
+
+    def on_close(self, instrument):
+        if self.bar is not None:
+            self.bar.close()
+            self.bar = None
+
+class Instrument:
+    """ 记录数据流水线各阶段的执行时间、读取字节数、处理的比赛数和内存峰值
+
+    用法：
+        with Instrument(trace_memory=True, hooks=[ProgressBar()]) as inst:
+            tables = extract_tables(path)
+        inst.save('report.json')
+
+    流水线中的阶段分为两类：
+        1. 累加的阶段（read / decode / build_rows 等）：在循环中逐次累加时间、字节数和调用次数，不统计内存；
+        2. 整体的阶段（stage 上下文管理器，如 extract_rows / dataframe）：另外记录该阶段的 tracemalloc / RSS 峰值。
+    报告中的 peak_rss_mb 为进程的 RSS 峰值（VmHWM），不会被阶段的统计重置。
+    钩子是带有 on_start(name, total_bytes) / on_progress(n_bytes) / on_stage(name, record) / on_close(instrument)
+    中任意几个方法的对象，如 ProgressBar。
+    """
+
+    def __init__(self, hooks=(), trace_memory=False):
+        """
+        parameter:
+            1. hooks        : 钩子对象列表
+            2. trace_memory : 为 True 时用 tracemalloc 统计 Python 对象（含 numpy 数组）的内存峰值，会拖慢纯 Python 代码
+        """
+        self.hooks        = list(hooks)
+        self.trace_memory = trace_memory
+        self.stages       = {}
+        self.wall_seconds = None
+        self._tracing     = False
+        self._sampler     = _RssSampler()
+        self._callbacks   = {}
+        for method in ('on_start', 'on_progress', 'on_stage', 'on_close'):
+            self._callbacks[method] = [getattr(hook, method) for hook in self.hooks if hasattr(hook, method)]
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._start = time.perf_counter()
+        _active.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.remove(self)
+        self.wall_seconds = time.perf_counter() - self._start
+        self.peak_rss = peak_rss_bytes()
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        for callback in self._callbacks['on_close']:
+            callback(self)
+        return False
+
+    def _record(self, name):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {'seconds': 0.0, 'calls': 0, 'bytes': 0}
+        return record
+
+    def add(self, name, seconds=0.0, calls=1, n_bytes=0):
+        """ 累加一个阶段的时间、调用次数和字节数 """
+        record = self._record(name)
+        record['seconds'] += seconds
+        record['calls'] += calls
+        record['bytes'] += n_bytes
+
+    def start(self, name, total_bytes):
+        """ 开始读取一个 total_bytes 字节的输入 """
+        for callback in self._callbacks['on_start']:
+            callback(name, total_bytes)
+
+    def progress(self, n_bytes):
+        for callback in self._callbacks['on_progress']:
+            callback(n_bytes)
+
+    @contextmanager
+    def stage(self, name):
+        """ 记录一个整体阶段的时间，以及该阶段中 tracemalloc / RSS 相对开始时的峰值增量
+
+        RSS 峰值不重置进程的 VmHWM：阶段中 VmHWM 增大时即为该阶段的精确峰值，
+        否则取后台线程每 10 毫秒采样得到的最大值（更短暂的峰值可能被漏掉）。
+        """
+        record = self._record(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            traced_base = tracemalloc.get_traced_memory()[0]
+        rss_base = rss_bytes()
+        hwm_base = peak_rss_bytes()
+        token = None if rss_base is None else self._sampler.open(rss_base)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] += time.perf_counter() - start
+            record['calls'] += 1
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - traced_base
+                record['tracemalloc_peak'] = max(record.get('tracemalloc_peak', 0), peak)
+            if token is not None:
+                peak = self._sampler.close(token)
+                hwm = peak_rss_bytes()
+                if hwm is not None and hwm_base is not None and hwm > hwm_base:
+                    peak = max(peak, hwm)
+                record['rss_peak'] = max(record.get('rss_peak', 0), peak - rss_base)
+            for callback in self._callbacks['on_stage']:
+                callback(name, record)
+
+    def timed(self, name, func):
+        """ 返回 func 的包装函数，每次调用的时间累加到 name 阶段 """
+        record = self._record(name)
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            start = clock()
+            result = func(*args)
+            record['seconds'] += clock() - start
+            record['calls'] += 1
+            return result
+        return wrapper
+
+    def read_lines(self, fin, name='read', total_bytes=None):
+        """ 逐行读取 fin，读取时间和字节数累加到 name 阶段，并通知钩子读取的进度 """
+        self.start(name, total_bytes)
+        record = self._record(name)
+        clock = time.perf_counter
+        readline = fin.readline
+        while True:
+            start = clock()
+            line = readline()
+            record['seconds'] += clock() - start
+            if not line:
+                return
+            record['calls'] += 1
+            record['bytes'] += len(line)
+            if self._callbacks['on_progress']:
+                self.progress(len(line))
+            yield line
+
+    def report(self) -> dict:
+        """ 本次运行的报告：总时间、RSS 峰值以及每个阶段的时间、调用次数、字节数、吞吐量和内存峰值（MB） """
+        stages = {}
+        for name, record in self.stages.items():
+            seconds = record['seconds']
+            stage = {'seconds': round(seconds, 6), 'calls': record['calls'], 'mb': _mb(record['bytes'])}
+            if seconds > 0:
+                stage['calls_per_sec'] = round(record['calls'] / seconds, 1)
+                if record['bytes']:
+                    stage['mb_per_sec'] = round(record['bytes'] / 2 ** 20 / seconds, 3)
+            for key in ('tracemalloc_peak', 'rss_peak'):
+                if key in record:
+                    stage[key + '_mb'] = _mb(record[key])
+            stages[name] = stage
+        return {
+            'wall_seconds': None if self.wall_seconds is None else round(self.wall_seconds, 6),
+            'peak_rss_mb':  _mb(getattr(self, 'peak_rss', None)),
+            'pid':          os.getpid(),
+            'stages':       stages,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as fout:
+            json.dump(self.report(), fout, indent=2)
+
+# 数据流水线中使用的钩子函数：没有生效的 Instrument 时没有任何额外开销
+
+def stage(name):
+    inst = current()
+    return nullcontext() if inst is None else inst.stage(name)
+
+def timed(name, func):
+    inst = current()
+    return func if inst is None else inst.timed(name, func)
+
+def read_lines(fin, name='read', total_bytes=None):
+    inst = current()
+    return fin if inst is None else inst.read_lines(fin, name, total_bytes)
+
+def start(name, total_bytes):
+    inst = current()
+    if inst is not None:
+        inst.start(name, total_bytes)
+
+def add(name, seconds=0.0, calls=1, n_bytes=0, progress=False):
+    """ 累加一个阶段的统计，progress 为 True 时同时通知钩子读取了 n_bytes 字节 """
+    inst = current()
+    if inst is not None:
+        inst.add(name, seconds, calls, n_bytes)
+        if progress:
+            inst.progress(n_bytes)
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.instrument [path/to/matches.jsonl] [report.json]
+    import sys
+
+    from .extractdata import extract_tables
+    # 以 -m 运行时本文件是 __main__ 模块，需要使用流水线中导入的同一个 utils.instrument 模块
+    from .instrument import Instrument, ProgressBar
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    start_time = time.time()
+    extract_tables(matches_file)
+    print(f"不记录时的执行时间: {time.time() - start_time:.2f}秒")
+
+    with Instrument(hooks=[ProgressBar()]) as inst:
+        extract_tables(matches_file)
+    print(f"记录时间时的执行时间: {inst.wall_seconds:.2f}秒")
+
+    with Instrument(trace_memory=True) as inst:
+        extract_tables(matches_file)
+    print(json.dumps(inst.report(), indent=2))
+    if len(sys.argv) > 2:
+        inst.save(sys.argv[2])
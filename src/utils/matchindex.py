@@ -0,0 +1,104 @@
+import os
+import re
+
+import numpy as np
+import ujson as json
+
+from . import instrument
+
+# match_id_hash 位于每行开头附近，只在行首的一小段中查找即可，找不到时再完整解析该行
+MATCH_ID_PATTERN = re.compile(rb'"match_id_hash"\s*:\s*"([^"]+)"')
+MATCH_ID_SEARCH_BYTES = 4096
+
+def index_path(matches_file):
+    """ 索引文件与原始文件放在一起：train_matches.jsonl -> train_matches.jsonl.idx.npz """
+    return matches_file + '.idx.npz'
+
+def _match_id(line):
+    found = MATCH_ID_PATTERN.search(line, 0, MATCH_ID_SEARCH_BYTES)
+    if found is None:
+        return json.loads(line)['match_id_hash'].encode()
+    return found.group(1)
+
+def build_index(matches_file, index_file=None):
+    """ 遍历一次文件，记录每局比赛的 match_id_hash、字节偏移和行长度，并保存为索引文件 """
+    ids, offsets, lengths = [], [], []
+    pos = 0
+    with open(matches_file, 'rb') as fin:
+        for line in instrument.read_lines(fin, 'index', os.path.getsize(matches_file)):
+            ids.append(_match_id(line))
+            offsets.append(pos)
+            lengths.append(len(line))
+            pos += len(line)
+
+    stat = os.stat(matches_file)
+    np.savez(index_file or index_path(matches_file),
+             ids=np.array(ids, dtype='S'),
+             offsets=np.array(offsets, dtype='int64'),
+             lengths=np.array(lengths, dtype='int64'),
+             source=np.array([stat.st_size, stat.st_mtime_ns], dtype='int64'))
+
+class MatchIndex:
+    """ 比赛文件的字节偏移索引，支持按 match_id_hash 或行号随机读取比赛数据 """
+
+    def __init__(self, matches_file, index_file=None):
+        """ 加载索引；索引不存在或原始文件已被修改时重新构建
+
+        parameter:
+            1. matches_file : 原始 JSONL 文件路径
+            2. index_file   : 索引文件路径，默认为 index_path(matches_file)
+        """
+        self.matches_file = matches_file
+        index_file = index_file or index_path(matches_file)
+
+        stat = os.stat(matches_file)
+        if not self._load(index_file, [stat.st_size, stat.st_mtime_ns]):
+            build_index(matches_file, index_file)
+            self._load(index_file, None)
+
+        # 按 id 排序后用二分查找，一次查询大量 id 时无需逐个查字典
+        self._order      = np.argsort(self.ids, kind='stable')
+        self._sorted_ids = self.ids[self._order]
+
+    def _load(self, index_file, source):
+        if not os.path.exists(index_file):
+            return False
+        with np.load(index_file) as index:
+            if source is not None and index['source'].tolist() != source:
+                return False
+            self.ids     = index['ids']
+            self.offsets = index['offsets']
+            self.lengths = index['lengths']
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, match_ids) -> np.ndarray:
+        """ 将 match_id_hash 列表转换为行号，不存在的 id 会抛出 KeyError """
+        # 按查询 id 本身的长度构造数组：转换为索引的定长类型会截断更长的 id，使其误匹配到前缀相同的 id
+        query = np.asarray([m.encode() if isinstance(m, str) else m for m in match_ids], dtype='S')
+        found = np.searchsorted(self._sorted_ids, query).clip(max=len(self) - 1)
+        missing = self._sorted_ids[found] != query
+        if missing.any():
+            raise KeyError(f'match_id_hash not found: {[m.decode(errors="replace") for m in query[missing][:5]]}')
+        return self._order[found]
+
+    def read_at(self, positions):
+        """ 生成器函数，按给定顺序读取指定行号的比赛数据 """
+        with open(self.matches_file, 'rb') as fin:
+            for pos in positions:
+                fin.seek(self.offsets[pos])
+                yield json.loads(fin.read(self.lengths[pos]))
+
+    def read_by_id(self, match_ids):
+        """ 生成器函数，按给定顺序读取指定 match_id_hash 的比赛数据 """
+        yield from self.read_at(self.positions(match_ids))
+
+def read_matches_at(matches_file, positions):
+    """ 与 read_matches 用法相同，但只读取指定行号（从 0 开始）的比赛 """
+    yield from MatchIndex(matches_file).read_at(positions)
+
+def read_matches_by_id(matches_file, match_ids):
+    """ 与 read_matches 用法相同，但只读取指定 match_id_hash 的比赛 """
+    yield from MatchIndex(matches_file).read_by_id(match_ids)
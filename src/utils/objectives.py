@@ -0,0 +1,132 @@
+import math
+import re
+
+import numpy as np
+import pandas as pd
+
+# 统计的八种事件类型
+EVENT_TYPES = [
+    'CHAT_MESSAGE_BARRACKS_KILL',
+    'CHAT_MESSAGE_FIRSTBLOOD',
+    'CHAT_MESSAGE_DENIED_AEGIS',
+    'CHAT_MESSAGE_TOWER_KILL',
+    'CHAT_MESSAGE_AEGIS',
+    'CHAT_MESSAGE_ROSHAN_KILL',
+    'CHAT_MESSAGE_TOWER_DENY',
+    'CHAT_MESSAGE_AEGIS_STOLEN'
+]
+TEAMS = ['radiant', 'dire']
+
+# 每支队伍每种事件的次数，以及第一次发生的时间（未发生时为空值）
+COUNT_COLUMNS = [f'{team}_{event}' for team in TEAMS for event in EVENT_TYPES]
+FIRST_TIME_COLUMNS = [f'{team}_{event}_first_time' for team in TEAMS for event in EVENT_TYPES]
+OBJECTIVE_STATS_COLUMNS = COUNT_COLUMNS + FIRST_TIME_COLUMNS
+
+_EVENT_INDEX = {event: i for i, event in enumerate(EVENT_TYPES)}
+_WIDE_COLUMN = re.compile(r'objective-(\d+)-type')
+
+def objective_team(player_slot, team):
+    """ 判断事件所属的队伍：0 为 Radiant，1 为 Dire，无法判断时为 None
+
+    有 player_slot 时按 player_slot 判断（0~4 为 Radiant，128~132 为 Dire），否则按 team 判断（2 为 Radiant，3 为 Dire）
+    """
+    if player_slot is not None:
+        if 0 <= player_slot <= 4:
+            return 0
+        if 128 <= player_slot <= 132:
+            return 1
+        return None
+    if team == 2:
+        return 0
+    if team == 3:
+        return 1
+    return None
+
+def objective_stats_row(match):
+    """ 在提取过程中直接由解码后的 objectives 统计一局比赛的事件次数和首次发生时间 """
+    counts = [0] * len(COUNT_COLUMNS)
+    first_times = [math.nan] * len(FIRST_TIME_COLUMNS)
+    for objective in match['objectives']:
+        event = _EVENT_INDEX.get(objective.get('type'))
+        if event is None:
+            continue
+        side = objective_team(objective.get('player_slot'), objective.get('team'))
+        if side is None:
+            continue
+
+        i = side * len(EVENT_TYPES) + event
+        counts[i] += 1
+        time = objective.get('time')
+        if time is not None and (math.isnan(first_times[i]) or time < first_times[i]):
+            first_times[i] = time
+    return counts + first_times
+
+def objective_stats_columns(max_len=None):
+    return OBJECTIVE_STATS_COLUMNS
+
+def _wide_values(df, key, indices):
+    """ 将 objective-{i}-{key} 这些列取出为 (行数, 事件数) 的浮点数组，列不存在时为空值 """
+    columns = [f'objective-{i}-{key}' for i in indices]
+    if not all(col in df.columns for col in columns):
+        return np.full((len(df), len(indices)), np.nan)
+    return df[columns].to_numpy(dtype='float64', na_value=np.nan)
+
+def aggregate_objectives(df):
+    """ 由 extract_objectives 生成的宽表向量化地统计每支队伍每种事件的次数和首次发生时间
+
+    parameter:
+        1. df : 包含 objective-{i}-type / player_slot / team / time 列的宽表，
+                缺少 team 列时只按 player_slot 判断队伍，缺少 time 列时首次发生时间均为空值
+
+    Tips:
+        第 1 版提取器生成的宽表没有 team 列，只有 team、没有 player_slot 的事件不会被统计；
+        第 2 版起宽表包含 team 列，这些事件按 team 计入对应的队伍，因此次数与由旧宽表得到的结果不同
+
+    returned value:
+        与 df 行数相同、列为 OBJECTIVE_STATS_COLUMNS 的 DataFrame
+    """
+    indices = sorted(int(found.group(1)) for found in map(_WIDE_COLUMN.fullmatch, df.columns) if found)
+    n_rows, n_events = len(df), len(EVENT_TYPES)
+
+    types = df[[f'objective-{i}-type' for i in indices]].to_numpy(dtype=object).ravel()
+    events = pd.Series(types).map(_EVENT_INDEX).to_numpy(dtype='float64', na_value=np.nan)
+    slots = _wide_values(df, 'player_slot', indices).ravel()
+    teams = _wide_values(df, 'team', indices).ravel()
+    times = _wide_values(df, 'time', indices).ravel()
+
+    # 与 objective_team 的规则相同：有 player_slot 时只看 player_slot，否则看 team
+    has_slot = ~np.isnan(slots)
+    radiant = np.where(has_slot, (slots >= 0) & (slots <= 4), teams == 2)
+    dire = np.where(has_slot, (slots >= 128) & (slots <= 132), teams == 3)
+    valid = ~np.isnan(events) & (radiant | dire)
+
+    rows = np.repeat(np.arange(n_rows), len(indices))[valid]
+    cells = rows * 2 * n_events + dire[valid] * n_events + events[valid].astype(np.int64)
+
+    counts = np.bincount(cells, minlength=n_rows * 2 * n_events).reshape(n_rows, -1)
+    first_times = np.full(n_rows * 2 * n_events, np.inf)
+    np.minimum.at(first_times, cells, np.where(np.isnan(times[valid]), np.inf, times[valid]))
+    first_times[np.isinf(first_times)] = np.nan
+
+    result = pd.DataFrame(counts, columns=COUNT_COLUMNS, index=df.index)
+    result[FIRST_TIME_COLUMNS] = first_times.reshape(n_rows, -1)
+    return result
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.objectives [path/to/matches.jsonl]
+    import sys
+    import time
+
+    from .extractdata import extract_tables
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    start = time.time()
+    tables = extract_tables(matches_file, ['objectives', 'objective_stats'])
+    print(f"提取 objectives 宽表并在提取过程中统计: {time.time() - start:.2f}秒")
+
+    start = time.time()
+    stats = aggregate_objectives(tables['objectives'])
+    print(f"由宽表向量化统计: {time.time() - start:.2f}秒")
+
+    pd.testing.assert_frame_equal(stats, tables['objective_stats'], check_dtype=False)
@@ -1,32 +1,233 @@
-# # 使用网格搜索进行超参数调优
-
-# param_grid = {
-#     'n_estimators': [10, 50, 100, 200],
-#     'max_depth': [None, 10, 15, 20, 30, 40, 50],
-#     'min_samples_split': [20, 25, 30, 35, 40, 45, 50],
-#     'min_samples_leaf': [20, 25, 30, 35, 40, 45, 50],
-# }
-
-# # 统计训练时间
-# from datetime import datetime
-# start_time = datetime.now()
-# grid_search = GridSearchCV(rf, param_grid, cv=cv, scoring='roc_auc', n_jobs=-1)
-# grid_search.fit(X_train, y_train)
-# end_time = datetime.now()
-
-# print('Training took: ', end_time - start_time)
-# print('Best params & Best score', grid_search.best_params_, grid_search.best_score_)
-
-# # 使用随机搜索进行超参数调优
-# param_dist = {
-#     'n_estimators': sp_randint(50, 200),
-#     'max_depth': [None] + list(sp_randint(10, 20).rvs(10)),
-#     'min_samples_leaf': sp_randint(1, 5)
-# }
-
-
-# random_search = RandomizedSearchCV(rf, param_distributions=param_dist, n_iter=20,
-#                                       cv=cv, scoring='roc_auc', n_jobs=-1, random_state=17)
-# random_search.fit(X_train, y_train)
-
-# print(random_search.best_params_, random_search.best_score_)
\ No newline at end of file
+import hashlib
+import math
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import ujson as json
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
+from sklearn.model_selection import ParameterGrid
+
+# 超参数搜索的结果按 (配置, 预算, 折) 保存在 sqlite 数据库中：
+#   配置由估计器类型、固定参数、候选参数、数据指纹、交叉验证划分方式和评分方式共同确定，
+#   任何一项改变都会得到新的配置，不会误用旧的结果。
+# 每完成一折就立即写入，搜索中断（如重启 notebook）后再次运行时跳过已经完成的折。
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return repr(value)
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, default=_default)
+
+def data_fingerprint(X, y):
+    """ 训练数据的指纹：形状、类型和内容的 blake2b 哈希 """
+    digest = hashlib.blake2b(digest_size=16)
+    for arr in (X, y):
+        arr = np.ascontiguousarray(arr)
+        digest.update(f'{arr.shape}{arr.dtype}'.encode())
+        digest.update(arr.view(np.uint8) if arr.dtype != object else _dumps(arr.tolist()).encode())
+    return digest.hexdigest()
+
+class SearchStore:
+    """ 保存每个 (配置, 预算, 折) 评分的 sqlite 数据库 """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS scores (
+                config      TEXT    NOT NULL,
+                params      TEXT    NOT NULL,
+                budget      INTEGER NOT NULL,
+                fold        INTEGER NOT NULL,
+                score       REAL    NOT NULL,
+                fit_seconds REAL    NOT NULL,
+                PRIMARY KEY (config, budget, fold)
+            )''')
+        self.conn.commit()
+
+    def get(self, config, budget, fold):
+        row = self.conn.execute('SELECT score FROM scores WHERE config = ? AND budget = ? AND fold = ?',
+                                (config, budget, fold)).fetchone()
+        return None if row is None else row[0]
+
+    def put(self, config, params, budget, fold, score, fit_seconds):
+        self.conn.execute('INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)',
+                          (config, params, budget, fold, score, fit_seconds))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class _Evaluator:
+    """ 在缓存的基础上计算某个参数组合在某个预算下各折的评分 """
+
+    def __init__(self, estimator, X, y, cv, scoring, store, resource, random_state=0):
+        self.estimator = estimator
+        self.X, self.y = X, y
+        self.folds     = list(cv.split(X, y))
+        if resource == 'n_samples':
+            # KFold 等划分器返回的训练折下标是升序的，先按固定的种子打乱，各轮取前 budget 个即为嵌套的随机子集
+            rng = np.random.default_rng(random_state)
+            self.folds = [(rng.permutation(train), test) for train, test in self.folds]
+        self.scorer    = get_scorer(scoring)
+        self.store     = store
+        self.resource  = resource
+        # 预算参数由 budget 单独记录，不影响配置，因此改变 max_resource 后已有各轮的结果仍然可用
+        fixed = {key: value for key, value in estimator.get_params(deep=False).items() if key != resource}
+        self.base      = _dumps([type(estimator).__name__, fixed, data_fingerprint(X, y),
+                                 repr(cv), repr(scoring), resource, random_state])
+        self.n_fits    = 0
+        self.n_cached  = 0
+
+    def config(self, params):
+        return hashlib.blake2b(_dumps([self.base, params]).encode(), digest_size=16).hexdigest()
+
+    def _fit_score(self, params, budget, train, test):
+        estimator = clone(self.estimator).set_params(**params)
+        if self.resource == 'n_samples':
+            # 按数据量分配预算时只使用（已打乱的）训练折中的前 budget 个样本
+            train = train[:budget]
+        elif self.resource is not None:
+            estimator.set_params(**{self.resource: budget})
+        estimator.fit(self.X[train], self.y[train])
+        return self.scorer(estimator, self.X[test], self.y[test])
+
+    def scores(self, params, budget) -> np.ndarray:
+        config = self.config(params)
+        params_json = _dumps(params)
+        result = []
+        for fold, (train, test) in enumerate(self.folds):
+            score = self.store.get(config, budget, fold)
+            if score is None:
+                start = time.perf_counter()
+                score = float(self._fit_score(params, budget, train, test))
+                self.store.put(config, params_json, budget, fold, score, time.perf_counter() - start)
+                self.n_fits += 1
+            else:
+                self.n_cached += 1
+            result.append(score)
+        return np.array(result)
+
+def _budgets(min_resource, max_resource, factor):
+    """ 各轮的预算：最后一轮为 max_resource，之前每轮依次除以 factor，且不小于 min_resource """
+    n_rungs = int(math.floor(math.log(max_resource / min_resource, factor) + 1e-9)) + 1
+    return [max(min_resource, int(round(max_resource / factor ** (n_rungs - 1 - i)))) for i in range(n_rungs)]
+
+class SearchResult:
+    """ 搜索结果：best_params / best_score 以及每轮每个参数组合的评分表 results """
+
+    def __init__(self, results, n_fits, n_cached, seconds):
+        self.results  = results
+        self.n_fits   = n_fits
+        self.n_cached = n_cached
+        self.seconds  = seconds
+        final = results[results['budget'] == results['budget'].max()]
+        best = final.loc[final['mean_test_score'].idxmax()]
+        self.best_params = best['params']
+        self.best_score  = best['mean_test_score']
+
+def halving_search(estimator, param_grid, X, y, cv, store, scoring='roc_auc', resource='n_estimators',
+                   min_resource=None, max_resource=None, factor=3, random_state=0, verbose=True) -> SearchResult:
+    """ 可以中断后继续的逐次减半超参数搜索
+
+    第一轮用最小的预算（如 n_estimators=max_resource/factor^k 棵树）评估所有参数组合，
+    每轮只保留交叉验证平均分最高的 1/factor，并将预算乘以 factor，最后一轮的预算为 max_resource。
+    每一折的评分都保存在 store 中，重复运行或中断后再次运行时已经完成的折直接读取缓存。
+
+    parameter:
+        1. estimator    : sklearn 估计器，如 RandomForestClassifier(n_jobs=-1, random_state=17)
+        2. param_grid   : 参数网格（dict，同 GridSearchCV），或参数组合的列表（如 ParameterSampler 的结果）
+        3. X, y         : 训练数据（numpy 数组）
+        4. cv           : 交叉验证划分器，需要给定 random_state 以保证各次运行的划分相同
+        5. store        : SearchStore 或 sqlite 数据库路径
+        6. scoring      : sklearn 评分名，越大越好
+        7. resource     : 逐轮增加的预算：估计器参数名（如 'n_estimators'），或 'n_samples' 表示训练样本数
+        8. min_resource : 第一轮的最小预算，默认为 max_resource / factor^2
+        9. max_resource : 最后一轮的预算，默认为 estimator 中该参数的取值（n_samples 时为最小训练折的大小）
+        10. factor      : 每轮保留 1/factor 的参数组合，预算乘以 factor
+        11. random_state: resource 为 'n_samples' 时打乱训练折的随机种子，各轮使用的样本为同一个排列的前 budget 个
+
+    returned value:
+        SearchResult
+    """
+    start = time.perf_counter()
+    X, y = np.asarray(X), np.asarray(y)
+    store = SearchStore(store) if isinstance(store, str) else store
+    evaluator = _Evaluator(estimator, X, y, cv, scoring, store, resource, random_state)
+
+    if max_resource is None:
+        if resource == 'n_samples':
+            max_resource = min(len(train) for train, _ in evaluator.folds)
+        else:
+            max_resource = estimator.get_params()[resource]
+    if min_resource is None:
+        min_resource = max(1, max_resource // factor ** 2)
+    if factor <= 1:
+        raise ValueError(f"factor 应大于 1，实际为 {factor}")
+    if not 1 <= min_resource <= max_resource:
+        raise ValueError(f"预算应满足 1 <= min_resource <= max_resource，实际为 {min_resource} 和 {max_resource}")
+
+    candidates = list(ParameterGrid(param_grid)) if isinstance(param_grid, dict) else [dict(p) for p in param_grid]
+    if not candidates:
+        raise ValueError("param_grid 中没有参数组合")
+
+    rows = []
+    for rung, budget in enumerate(_budgets(min_resource, max_resource, factor)):
+        scored = []
+        for params in candidates:
+            scores = evaluator.scores(params, budget)
+            scored.append((scores.mean(), params))
+            rows.append({'rung': rung, 'budget': budget, 'params': params, 'mean_test_score': scores.mean(),
+                         'std_test_score': scores.std(), **{f'split{i}_test_score': s for i, s in enumerate(scores)}})
+        if verbose:
+            print(f"第 {rung} 轮: 预算 {budget}, {len(candidates)} 个参数组合, "
+                  f"最高分 {max(score for score, _ in scored):.5f}, 已训练 {evaluator.n_fits} 次, 缓存 {evaluator.n_cached} 次")
+
+        # 保留平均分最高的 1/factor（排序稳定，分数相同时保持原来的顺序）
+        n_keep = max(1, math.ceil(len(candidates) / factor))
+        order = sorted(range(len(scored)), key=lambda i: -scored[i][0])
+        candidates = [scored[i][1] for i in sorted(order[:n_keep])]
+
+    results = pd.DataFrame(rows)
+    return SearchResult(results, evaluator.n_fits, evaluator.n_cached, time.perf_counter() - start)
+
+def cached_cross_val_score(estimator, X, y, cv, store, scoring='roc_auc') -> np.ndarray:
+    """ 带缓存的 cross_val_score：同样的估计器参数、数据和划分只计算一次 """
+    X, y = np.asarray(X), np.asarray(y)
+    store = SearchStore(store) if isinstance(store, str) else store
+    return _Evaluator(estimator, X, y, cv, scoring, store, None).scores({}, 0)
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.optimize [store.sqlite]
+    import os
+    import sys
+    import tempfile
+
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+
+    store_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.mkdtemp(), 'search.sqlite')
+    X, y = make_classification(n_samples=4000, n_features=40, n_informative=10, random_state=17)
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=17)
+    rf = RandomForestClassifier(n_estimators=180, n_jobs=-1, random_state=17, class_weight='balanced')
+    param_grid = {
+        'max_depth': [None, 10, 20],
+        'min_samples_leaf': [1, 5, 20],
+        'max_features': ['sqrt', 'log2'],
+    }
+
+    start = time.time()
+    grid_search = GridSearchCV(rf, param_grid, cv=cv, scoring='roc_auc')
+    grid_search.fit(X, y)
+    print(f"GridSearchCV: {time.time() - start:.2f}秒", grid_search.best_params_, grid_search.best_score_)
+
+    result = halving_search(rf, param_grid, X, y, cv, store_path)
+    print(f"逐次减半: {result.seconds:.2f}秒", result.best_params, result.best_score)
+
+    result = halving_search(rf, param_grid, X, y, cv, store_path, verbose=False)
+    print(f"再次运行（全部命中缓存）: {result.seconds:.2f}秒, 训练 {result.n_fits} 次")
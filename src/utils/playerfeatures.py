@@ -0,0 +1,198 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+N_PLAYERS = 10
+RADIANT, DIRE = slice(0, 5), slice(5, 10)
+
+# 日志列只保留日志条目数（即 '{' 的个数），其余日志列直接删除
+LOG_FEATURES = ['obs_left_log', 'sen_left_log']
+DROPPED_FEATURES = ['obs_log', 'sen_log', 'obs']
+XP_REASONS = [f'xp_reasons-{i}' for i in range(4)]
+
+_PLAYER_COLUMN = re.compile(r'players-(\d+)-(.+)')
+
+def compact_dtype(values):
+    """ 选择能无损保存 values 的最小数值类型：整数取 int16 / int32 / int64 中最小的一个，
+    其他取值（包括含空值、无穷大的列）能被 float32 精确表示时为 float32，否则为 float64
+
+    不使用 int8：np.log1p 等函数会将 int8 转换为精度很低的 float16。
+    """
+    if values.dtype == bool or values.size == 0:
+        return np.dtype('int16')
+    is_integer = np.issubdtype(values.dtype, np.integer)
+    if is_integer or (np.isfinite(values).all() and np.array_equal(values, np.round(values))):
+        low, high = values.min(), values.max()
+        for dtype in ('int16', 'int32', 'int64'):
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return np.dtype(dtype)
+        if is_integer:
+            return values.dtype
+    if np.array_equal(values.astype('float32'), values, equal_nan=True):
+        return np.dtype('float32')
+    return np.dtype('float64')
+
+def _count_log_entries(values):
+    """ 统计日志列每个单元格中的条目数：CSV 中读出的字符串统计 '{' 的个数，提取得到的列表取其长度，空值为 0 """
+    cells = pd.Series(values.ravel())
+    counts = cells.str.count(r'\{')
+    counts = counts.fillna(cells.where(counts.isna()).str.len())
+    return counts.fillna(0).to_numpy().reshape(values.shape)
+
+class PlayerFeatures:
+    """ 以 {特征名: (比赛数, 10) 数组} 的形式保存 players 宽表，所有变换同时作用于 10 名玩家
+
+    每个特征使用能无损保存其取值的最小数值类型，需要 (比赛数, 10, 特征数) 的三维数组时可以调用 block。
+    """
+
+    def __init__(self, data, index=None, other=None):
+        """
+        parameter:
+            1. data  : {特征名: (比赛数, 10) 数组}，按列顺序排列
+            2. index : 行索引
+            3. other : 宽表中不属于某名玩家的其他列，to_frame 时原样放在最前面
+        """
+        self.data    = dict(data)
+        self.derived = []  # add_kda 等新增的特征，在宽表中统一放在最后
+        self.index   = index
+        self.other   = other
+
+    @classmethod
+    def from_wide(cls, df):
+        """ 由 players-{i}-{特征名} 形式的宽表构造
+
+        同时完成清洗：删除 DROPPED_FEATURES，将 LOG_FEATURES 转换为条目数，空值填充为 0，布尔值转换为 0 / 1。
+        """
+        columns = {}
+        other = []
+        for col in df.columns:
+            found = _PLAYER_COLUMN.fullmatch(str(col))
+            if found is None:
+                other.append(col)
+            else:
+                columns.setdefault(found.group(2), {})[int(found.group(1))] = col
+
+        data = {}
+        for feature, player_cols in columns.items():
+            if feature in DROPPED_FEATURES:
+                continue
+            cols = [player_cols[i] for i in range(1, N_PLAYERS + 1)]
+            if feature in LOG_FEATURES:
+                values = _count_log_entries(df[cols].to_numpy(dtype=object))
+            else:
+                values = df[cols].to_numpy(dtype='float64', na_value=np.nan)
+            values = np.nan_to_num(values, nan=0.0)
+            data[feature] = values.astype(compact_dtype(values))
+
+        return cls(data, df.index, df[other] if other else None)
+
+    @property
+    def features(self):
+        return list(self.data)
+
+    def __len__(self):
+        return len(self.index) if self.index is not None else len(next(iter(self.data.values())))
+
+    def __getitem__(self, feature):
+        return self.data[feature]
+
+    def add(self, feature, values, derived=True):
+        """ 添加一个 (比赛数, 10) 的特征，derived 为 True 时在宽表中放在最后 """
+        self.data[feature] = values
+        if derived and feature not in self.derived:
+            self.derived.append(feature)
+
+    def drop(self, features):
+        for feature in features:
+            self.data.pop(feature, None)
+            if feature in self.derived:
+                self.derived.remove(feature)
+
+    def add_xp(self):
+        """ 将 xp_reasons-0 ~ xp_reasons-3 相加为 xp，并放在原来 xp_reasons-0 所在的位置 """
+        if not all(feature in self.data for feature in XP_REASONS):
+            return
+        xp = sum(self.data[feature].astype('int64') for feature in XP_REASONS)
+        data = {}
+        for feature, values in self.data.items():
+            if feature == XP_REASONS[0]:
+                data['xp'] = xp.astype(compact_dtype(xp))
+            elif feature not in XP_REASONS:
+                data[feature] = values
+        self.data = data
+
+    def add_kda(self):
+        """ KDA = (kills + assists) / deaths，deaths 为 0 时直接取 kills + assists """
+        kills_assists = self.data['kills'].astype('float32') + self.data['assists']
+        deaths = self.data['deaths']
+        self.add('KDA', np.where(deaths == 0, kills_assists, kills_assists / np.where(deaths == 0, 1, deaths)))
+
+    def team_sum(self, feature) -> np.ndarray:
+        """ 两支队伍中该特征的总和，返回 (比赛数, 2) 的数组，第 0 列为 Radiant，第 1 列为 Dire """
+        values = self.data[feature]
+        return np.stack([values[:, RADIANT].sum(axis=1), values[:, DIRE].sum(axis=1)], axis=1)
+
+    def zero_ratio(self) -> pd.Series:
+        """ 宽表中每一列值为 0 的比例 """
+        ratios = {feature: (values == 0).mean(axis=0) for feature, values in self.data.items()}
+        return pd.Series({col: ratios[feature][i] for col, feature, i in self._columns()})
+
+    def prune_zero(self, threshold=0.8) -> list:
+        """ 删除 10 名玩家中值为 0 的比例都超过 threshold 的特征，返回被删除的特征名 """
+        dropped = [feature for feature, values in self.data.items() if ((values == 0).mean(axis=0) > threshold).all()]
+        self.drop(dropped)
+        return dropped
+
+    def _ordered(self):
+        derived = [feature for feature in self.derived if feature in self.data]
+        return [feature for feature in self.data if feature not in derived] + derived
+
+    def _columns(self):
+        """ 按宽表的列顺序生成 (列名, 特征名, 玩家下标)：基础特征按玩家依次排列，新增的特征同样按玩家依次排列在其后 """
+        derived = [feature for feature in self.derived if feature in self.data]
+        base = [feature for feature in self.data if feature not in derived]
+        for group in (base, derived):
+            for i in range(N_PLAYERS):
+                for feature in group:
+                    yield f'players-{i + 1}-{feature}', feature, i
+
+    def block(self, features=None, dtype='float32') -> np.ndarray:
+        """ 返回 (比赛数, 10, 特征数) 的三维数组 """
+        features = self._ordered() if features is None else list(features)
+        result = np.empty((len(self), N_PLAYERS, len(features)), dtype=dtype)
+        for i, feature in enumerate(features):
+            result[:, :, i] = self.data[feature]
+        return result
+
+    def to_frame(self, team_sums=()) -> pd.DataFrame:
+        """ 转换回 players-{i}-{特征名} 形式的宽表
+
+        team_sums 中的特征最后以 Radiant-{特征名} / Dire-{特征名} 的形式追加两队的总和。
+        """
+        columns = {col: self.data[feature][:, i] for col, feature, i in self._columns()}
+        for feature in team_sums:
+            sums = self.team_sum(feature)
+            sums = sums.astype(compact_dtype(sums))
+            columns[f'Radiant-{feature}'] = sums[:, 0]
+            columns[f'Dire-{feature}'] = sums[:, 1]
+
+        result = pd.DataFrame(columns, index=self.index)
+        if self.other is not None:
+            result = pd.concat([self.other, result], axis=1)
+        return result
+
+def player_features(df, zero_threshold=None) -> pd.DataFrame:
+    """ datapreproc_p2 中 players 宽表的清洗和特征构造
+
+    删除 obs / obs_log / sen_log，日志列转换为条目数，空值填充为 0，布尔值转换为 0 / 1，
+    xp_reasons 相加为 xp，计算每名玩家的 KDA 以及两队的 kills 总和；
+    zero_threshold 不为 None 时删除值为 0 的比例超过该阈值的特征。
+    """
+    players = PlayerFeatures.from_wide(df)
+    players.add_xp()
+    players.add_kda()
+    if zero_threshold is not None:
+        players.prune_zero(zero_threshold)
+    return players.to_frame(team_sums=['kills'])
@@ -0,0 +1,137 @@
+import numpy as np
+import ujson as json
+
+# 比赛数据中取值为对象 / 数组的顶层字段。players / teamfights 中包含 ability_uses、item_uses、
+# damage_inflictor*、hero_hits 等大量用不到的字段，整体可达数十 KB。
+# 这些顶层字段不在请求路径中时，在解码之前直接从原始字节中剪掉；
+# 更深层的字段由 ujson 解码后再由 project 丢弃（在 Python 中逐个跳过这些小字段比 ujson 解码它们更慢）
+TOP_LEVEL_KEYS = frozenset(['chat', 'objectives', 'players', 'targets', 'teamfights'])
+
+def path_tree(paths):
+    """ 将 'players.kills' 这样的路径列表转换为嵌套字典：{'players': {'kills': {}}}
+
+    空字典表示保留该字段的完整取值。列表会被透明地穿过，
+    即 'teamfights.start' 表示每个 teamfight 中的 start 字段。
+    """
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split('.')
+        for i, key in enumerate(parts):
+            if key in node and not node[key]:
+                break  # 已经请求了完整的取值
+            if i == len(parts) - 1:
+                node[key] = {}
+            else:
+                node = node.setdefault(key, {})
+    return tree
+
+def project(data, tree):
+    """ 只保留 data 中 tree 所描述的部分，不存在的字段直接忽略 """
+    if not tree:
+        return data
+    if isinstance(data, dict):
+        return {key: project(data[key], sub) for key, sub in tree.items() if key in data}
+    if isinstance(data, list):
+        return [project(item, tree) for item in data]
+    return data
+
+class _BracketIndex:
+    """ 用 numpy 一次性求出一行中所有括号的位置、层级和配对位置
+
+    字符串内部的括号由其前面引号个数的奇偶性排除，因此要求该行不含转义字符。
+    """
+
+    def __init__(self, line):
+        buf = np.frombuffer(line, dtype=np.uint8)
+        # '[' / ']' 与 '{' / '}' 只相差 0x20，统一转换为 '{' / '}' 后比较
+        folded = buf | 0x20
+        special = np.flatnonzero((folded == ord('{')) | (folded == ord('}')) | (buf == ord('"')))
+        chars = buf[special]
+
+        is_quote = chars == ord('"')
+        bracket = ~is_quote & ((np.cumsum(is_quote) & 1) == 0)
+        self.positions = special[bracket]
+        self.openers = chars[bracket] | 0x20 == ord('{')
+
+        # 左括号取其之前的深度、右括号取其之后的深度作为层级（最外层对象本身为 0），
+        # 配对的两个括号层级相同，且在同一层级中相邻
+        step = np.where(self.openers, 1, -1)
+        self.levels = np.cumsum(step) - (step > 0)
+        order = np.argsort(self.levels, kind='stable')
+        self.partners = np.empty_like(self.positions)
+        self.partners[order[:-1]] = self.positions[order[1:]]
+
+    def top_level_values(self):
+        """ 返回顶层字段中每个对象 / 数组取值的 (起始位置, 结束位置)，结束位置不含 """
+        first = self.openers & (self.levels == 1)
+        return zip(self.positions[first].tolist(), (self.partners[first] + 1).tolist())
+
+class MatchProjector:
+    """ 只解码比赛数据中指定 JSON 路径的解码器，可以被 pickle 后传给工作进程 """
+
+    def __init__(self, paths):
+        """
+        parameter:
+            1. paths : 需要的 JSON 路径，如 ['match_id_hash', 'players.kills', 'teamfights.start']
+        """
+        self.paths  = sorted(paths)
+        self.tree   = path_tree(self.paths)
+        self.pruned = frozenset(key.encode() for key in TOP_LEVEL_KEYS - set(self.tree))
+
+    def prune(self, line):
+        """ 在字节层面将不需要的顶层对象 / 数组字段替换为 null，返回新的字节串 """
+        # 建立括号索引本身也有开销，而 players 占每行的绝大部分字节，需要 players 时剪掉其余字段得不偿失；
+        # 含转义字符的行很少见，也直接完整解码
+        if b'players' not in self.pruned or b'\\' in line:
+            return line
+
+        pieces = []
+        pos = 0
+        for start, end in _BracketIndex(line).top_level_values():
+            key_end = line.rfind(b'"', 0, start)
+            key = line[line.rfind(b'"', 0, key_end) + 1:key_end]
+            if key in self.pruned:
+                pieces.append(line[pos:start])
+                pieces.append(b'null')
+                pos = end
+        pieces.append(line[pos:])
+        return b''.join(pieces)
+
+    def __call__(self, line):
+        """ 解码一行比赛数据，只返回请求的路径 """
+        if isinstance(line, str):
+            line = line.encode()
+        return project(json.loads(self.prune(line)), self.tree)
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.projection [path/to/matches.jsonl]
+    import sys
+    import time
+    import tracemalloc
+
+    from .extractdata import TABLES, TABLE_PATHS, extract_tables
+    from .readjsonl import read_matches
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    cases = [('完整解码', None)] + [(f'{name} 表', TABLE_PATHS[name]) for name in TABLES] + \
+            [('全部表', sorted(set().union(*TABLE_PATHS.values())))]
+    for name, paths in cases:
+        start = time.time()
+        for _ in read_matches(matches_file, paths=paths):
+            pass
+        elapsed = time.time() - start
+
+        # 保留全部解码结果，统计 Python 对象占用的内存峰值
+        tracemalloc.start()
+        matches = list(read_matches(matches_file, paths=paths))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del matches
+        print(f"{name}: 执行时间 {elapsed:.2f}秒, 内存峰值 {peak / 2 ** 20:.1f}MB")
+
+    full = extract_tables(matches_file, projected=False)
+    projected = extract_tables(matches_file)
+    for name in TABLES:
+        assert full[name].equals(projected[name]), name
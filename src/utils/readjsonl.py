@@ -1,18 +1,199 @@
 import os
+import multiprocessing
+import time
+from collections import deque
+from functools import partial
+
 import ujson as json
-from tqdm import tqdm
 
-def read_matches(matches_file):
-    """ 生成器函数，用于读取比赛数据 """
+from . import instrument
+from .compressed import compression, line_batches, open_matches
+from .projection import MatchProjector
+
+def _effective_n_jobs(n_jobs):
+    """ 将 n_jobs 转换为实际使用的进程数（-1 表示使用全部 CPU） """
+    if n_jobs is None or n_jobs < 0:
+        return os.cpu_count() or 1
+    return max(1, n_jobs)
+
+def _decoder(paths):
+    return json.loads if paths is None else MatchProjector(paths)
+
+def _byte_range(matches_file, byte_range):
+    """ 将 byte_range 转换为 (start, end)，为 None 时为整个文件 """
+    if byte_range is None:
+        return 0, os.path.getsize(matches_file)
+    return byte_range
+
+def _check_compressed(matches_file, byte_range):
+    """ 文件是否为压缩文件；压缩文件无法按字节定位，不支持 byte_range """
+    compressed = compression(matches_file) is not None
+    if compressed and byte_range is not None:
+        raise ValueError(f"{matches_file} 是压缩文件，不支持按字节区间读取")
+    return compressed
+
+def read_matches(matches_file, n_jobs=1, paths=None, byte_range=None):
+    """ 生成器函数，用于读取比赛数据
+
+    n_jobs 不为 1 时按字节分片，在进程池中并行解析，结果仍按文件顺序返回。
+    paths 不为 None 时只返回其中列出的 JSON 路径（如 'players.kills'），
+    不需要的顶层大字段在解码之前就被跳过，其余字段解码后立即丢弃，见 utils.projection。
+    byte_range 为 (start, end) 时只读取从 start 开始、起始位置在 end 之前的行（start 需位于行首）。
+    gzip / bz2 / xz 压缩的文件按魔数自动识别，在后台线程中解压，与解析同时进行，见 utils.compressed。
+    在 utils.instrument.Instrument 中调用时分别记录读取（read）和解码（decode）的时间，进度按字节数显示。
+    """
+    if n_jobs != 1:
+        yield from map_matches(_identity, matches_file, n_jobs=n_jobs, paths=paths, byte_range=byte_range)
+        return
+
+    decode = instrument.timed('decode', _decoder(paths))
+    if _check_compressed(matches_file, byte_range):
+        # read 阶段记录的是主线程等待后台解压的时间
+        with open_matches(matches_file) as fin:
+            for line in instrument.read_lines(fin):
+                yield decode(line)
+        return
+
+    start, end = _byte_range(matches_file, byte_range)
+    with open(matches_file, 'rb') as fin:
+        fin.seek(start)
+        for line in instrument.read_lines(fin, total_bytes=end - start):
+            if start >= end:
+                break
+            start += len(line)
+            yield decode(line)
+
+def split_shards(matches_file, n_shards, byte_range=None):
+    """ 将文件（或其中的字节区间 byte_range）按字节切分为至多 n_shards 个分片，每个分片的边界都对齐到行首
+
+    returned value:
+        [(start, end), ...]，每个分片覆盖字节区间 [start, end)
+    """
+    first, size = _byte_range(matches_file, byte_range)
+    bounds = [first]
+    with open(matches_file, 'rb') as fin:
+        for i in range(1, n_shards):
+            pos = first + (size - first) * i // n_shards
+            if pos <= bounds[-1]:
+                continue
+            # 从前一个字节开始找换行符，这样 pos 恰好位于行首时不会跳过该行
+            fin.seek(pos - 1)
+            fin.readline()
+            pos = fin.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+def read_shard(matches_file, start, end, paths=None):
+    """ 生成器函数，读取字节区间 [start, end) 内的比赛数据 """
+    decode = _decoder(paths)
+    with open(matches_file, 'rb') as fin:
+        fin.seek(start)
+        pos = start
+        for line in fin:
+            if pos >= end:
+                break
+            pos += len(line)
+            yield decode(line)
+
+def _identity(match):
+    return match
+
+def _run_shard(shard_func, matches_file, paths, shard):
+    """ 处理一个分片，同时返回分片的字节数和处理时间，供主进程中的 Instrument 记录 """
+    start, end = shard
+    begin = time.perf_counter()
+    result = shard_func(read_shard(matches_file, start, end, paths))
+    return end - start, time.perf_counter() - begin, result
+
+def _run_batch(shard_func, paths, lines):
+    """ 处理压缩文件中的一批行，返回值与 _run_shard 相同 """
+    begin = time.perf_counter()
+    result = shard_func(map(_decoder(paths), lines))
+    return sum(map(len, lines)), time.perf_counter() - begin, result
+
+def _bounded_imap(pool, func, items, window):
+    """ 按顺序返回 pool 中 func(item) 的结果，同时最多有 window 个任务在排队，
+    避免像 Pool.imap 那样提前读入全部输入 """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def _apply_each(func, matches):
+    return [func(match) for match in matches]
+
+def map_shards(shard_func, matches_file, n_jobs=-1, n_shards=None, ordered=True, paths=None, byte_range=None):
+    """ 在进程池中对每个分片调用 shard_func，逐个返回各分片的结果
+
+    parameter:
+        1. shard_func  : 接收一个比赛数据迭代器并返回该分片结果的函数（需可被 pickle）
+        2. matches_file: JSONL 文件路径
+        3. n_jobs      : 进程数，-1 表示使用全部 CPU，1 表示在当前进程中顺序执行
+        4. n_shards    : 分片数，默认为进程数的 4 倍，便于负载均衡
+        5. ordered     : 为 True 时按文件顺序返回，否则按完成顺序返回
+        6. paths       : 只解码的 JSON 路径，为 None 时完整解码，见 read_matches
+        7. byte_range  : 只处理的字节区间 (start, end)，为 None 时处理整个文件
+
+    Tips:
+        1. 在 Instrument 中调用时，每个分片的字节数和在工作进程中的处理时间累加到 shards 阶段
+        2. 压缩文件无法按字节切分，由主进程的后台线程解压，每 BATCH_LINES 行作为一个分片发送给工作进程，
+           总是按文件顺序返回，n_shards 不起作用
+    """
+    n_jobs = _effective_n_jobs(n_jobs)
+    if _check_compressed(matches_file, byte_range):
+        run = partial(_run_batch, shard_func, paths)
+        instrument.start('shards', None)
+        batches = line_batches(matches_file)
+        if n_jobs == 1:
+            results = map(run, batches)
+        else:
+            pool = multiprocessing.Pool(n_jobs)
+            results = _bounded_imap(pool, run, batches, n_jobs * 2)
+        try:
+            for n_bytes, seconds, result in results:
+                instrument.add('shards', seconds, n_bytes=n_bytes, progress=True)
+                yield result
+        finally:
+            batches.close()
+            if n_jobs != 1:
+                pool.terminate()
+                pool.join()
+        return
+
+    shards = split_shards(matches_file, n_shards or n_jobs * 4, byte_range)
+    run = partial(_run_shard, shard_func, matches_file, paths)
+    start, end = _byte_range(matches_file, byte_range)
+    instrument.start('shards', end - start)
+
+    if n_jobs == 1:
+        for n_bytes, seconds, result in map(run, shards):
+            instrument.add('shards', seconds, n_bytes=n_bytes, progress=True)
+            yield result
+        return
 
-    MATCHES_COUNT = {
-        'test_matches.jsonl': 10000,
-        'train_matches.jsonl': 39675
-    }
+    with multiprocessing.Pool(min(n_jobs, len(shards)) or 1) as pool:
+        # 按顺序返回时最多同时提交 2 * n_jobs 个分片，主进程处理得慢时工作进程会等待，不会积压所有分片的结果
+        results = _bounded_imap(pool, run, shards, n_jobs * 2) if ordered else pool.imap_unordered(run, shards)
+        for n_bytes, seconds, result in results:
+            instrument.add('shards', seconds, n_bytes=n_bytes, progress=True)
+            yield result
 
-    _, filename = os.path.split(matches_file)
-    total_matches = MATCHES_COUNT.get(filename)
+def map_matches(func, matches_file, n_jobs=-1, n_shards=None, ordered=True, paths=None, byte_range=None):
+    """ 生成器函数，在进程池中对每局比赛调用 func 并返回结果
 
-    with open(matches_file) as fin:
-        for line in tqdm(fin, total=total_matches):
-            yield json.loads(line)
+    ordered 为 False 时分片之间按完成顺序返回（同一分片内部仍保持文件顺序）。
+    func 只需返回所需的少量数据，可以避免将完整的比赛字典在进程间传递。
+    """
+    results = map_shards(partial(_apply_each, func), matches_file,
+                         n_jobs=n_jobs, n_shards=n_shards, ordered=ordered, paths=paths, byte_range=byte_range)
+    for shard_results in results:
+        instrument.add('matches', calls=len(shard_results))
+        yield from shard_results
@@ -0,0 +1,418 @@
+import pickle
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import ujson as json
+
+from .extractdata import MAIN_COLUMNS, PLAYER_KEYS, TABLE_PATHS, _main_row
+from .objectives import COUNT_COLUMNS, objective_stats_row
+from .playerfeatures import DROPPED_FEATURES, LOG_FEATURES, N_PLAYERS
+from .teamfights import NOTEBOOK_MAX_FIGHTS, TEAMFIGHT_FEATURES, teamfight_row
+
+# 与 PlayerFeatures.from_wide + add_xp 之后的特征顺序相同：xp_reasons-0 ~ 3 相加为 xp
+PLAYER_FEATURES = ['xp' if key == 'xp_reasons' else key for key in PLAYER_KEYS if key not in DROPPED_FEATURES]
+MAIN_FEATURES = [col for col in MAIN_COLUMNS if col != 'match_id_hash']
+
+# 特征向量的全部列，与 datapreproc_p2 中合并后的大表（main + players + objective 次数 + teamfight 统计）列名相同；
+# 大表中 teamfight 统计之后重复的 game_time（读入后为 game_time.1）在 train_lightGBM 中被删除，这里不包括
+RAW_COLUMNS = MAIN_FEATURES + \
+              [f'players-{i}-{feature}' for i in range(1, N_PLAYERS + 1) for feature in PLAYER_FEATURES] + \
+              [f'players-{i}-KDA' for i in range(1, N_PLAYERS + 1)] + \
+              ['Radiant-kills', 'Dire-kills'] + COUNT_COLUMNS + TEAMFIGHT_FEATURES
+
+# 打分只需要解码的 JSON 路径
+SCORING_PATHS = sorted(set(TABLE_PATHS['main'] + TABLE_PATHS['players'] + TABLE_PATHS['objective_stats'] +
+                           TABLE_PATHS['teamfights']))
+
+# datapreproc_p2 中 players 宽表的变换：先取对数，再按四分位距截断，最后归一化 / 标准化
+LOG_TRANSFORM_FEATURES = ['deaths', 'denies', 'kills', 'max_health', 'max_hero_hit', 'max_mana',
+                          'rune_pickups', 'nearby_creep_death_count']
+CLIP_FEATURES = ['deaths', 'denies']
+# datapreproc_p2 中 teamfight_participation 被拼写为 teamflight_participation，实际上没有被归一化
+NORMALIZE_FEATURES = ['deaths', 'denies', 'kills', 'rune_pickups', 'creeps_stacked', 'gold',
+                      'health', 'level', 'obs_left_log', 'observers_placed', 'sen_left_log',
+                      'sen_placed', 'towers_killed', 'xp', 'lh', 'assists', 'camps_stacked', 'KDA']
+STANDARDIZE_FEATURES = ['max_health', 'max_hero_hit', 'max_mana', 'nearby_creep_death_count', 'stuns']
+
+_KILLS, _DEATHS, _ASSISTS = (PLAYER_FEATURES.index(key) for key in ('kills', 'deaths', 'assists'))
+
+def _player_values(player):
+    """ 一名玩家清洗后的基础特征：日志列取条目数，空值为 0，布尔值为 0 / 1 """
+    values = []
+    for key in PLAYER_FEATURES:
+        if key == 'xp':
+            reasons = player.get('xp_reasons') or {}
+            value = sum(reasons.get(sub_key) or 0 for sub_key in ('0', '1', '2', '3'))
+        elif key == 'max_hero_hit':
+            value = (player.get(key) or {}).get('value')
+        elif key in LOG_FEATURES:
+            value = len(player.get(key) or ())
+        else:
+            value = player.get(key)
+        values.append(0 if value is None else value)
+    return values
+
+def _player_transform(column):
+    """ 返回 players-{i}-{特征名} 列在 datapreproc_p2 中的变换 (取对数, 截断, 缩放方式)，其他列返回 None """
+    parts = column.split('-', 2)
+    if len(parts) != 3 or parts[0] != 'players':
+        return None
+    feature = parts[2]
+    scaling = 'minmax' if feature in NORMALIZE_FEATURES else 'standard' if feature in STANDARDIZE_FEATURES else None
+    return feature in LOG_TRANSFORM_FEATURES, feature in CLIP_FEATURES, scaling
+
+def _teamfight_scaling(column):
+    """ teamfight 统计列在 datapreproc_p2 中的缩放方式：damage / xp_delta 及 gold_delta_max 归一化，
+    gold_delta_min / avg 标准化，团战时间和占比保持原样 """
+    if 'gold_delta' in column:
+        return 'minmax' if column.endswith('_max') else 'standard'
+    if 'damage' in column or 'xp' in column:
+        return 'minmax'
+    return None
+
+class MatchFeaturizer:
+    """ 将一局比赛的 dict 直接转换为特征向量，结果与 extract_* + datapreproc_p2 得到的大表中对应的行相同
+
+    每次请求只使用 Python 列表和 numpy，不构造 DataFrame。对数、截断和缩放的参数由 fit 在训练数据上求出，
+    之后逐列表示为 log1p 掩码、截断上下界和 (x - shift) * scale。
+    """
+
+    def __init__(self, columns=None):
+        """
+        parameter:
+            1. columns : 模型使用的特征列（即训练时 X 的列名），默认为 RAW_COLUMNS 中的全部列
+        """
+        self.columns = list(RAW_COLUMNS if columns is None else columns)
+        position = {col: i for i, col in enumerate(RAW_COLUMNS)}
+        unknown = [col for col in self.columns if col not in position]
+        if unknown:
+            raise ValueError(f"无法由比赛数据直接计算的特征列: {unknown}")
+        self.select = np.array([position[col] for col in self.columns], dtype=np.intp)
+
+        n = len(self.columns)
+        self.log   = np.zeros(n, dtype=bool)
+        self.low   = np.full(n, -np.inf)
+        self.high  = np.full(n, np.inf)
+        self.shift = np.zeros(n)
+        self.scale = np.ones(n)
+
+    def raw(self, match) -> np.ndarray:
+        """ 一局比赛清洗后、变换前的全部特征（RAW_COLUMNS 顺序） """
+        main = _main_row(match)
+        del main[MAIN_COLUMNS.index('match_id_hash')]
+
+        players = np.array([_player_values(player) for player in match['players']], dtype='float64')
+        kills_assists = players[:, _KILLS] + players[:, _ASSISTS]
+        deaths = players[:, _DEATHS]
+        kda = np.where(deaths == 0, kills_assists, kills_assists / np.where(deaths == 0, 1, deaths))
+        team_kills = [players[:5, _KILLS].sum(), players[5:, _KILLS].sum()]
+
+        objectives = objective_stats_row(match)[:len(COUNT_COLUMNS)]
+        teamfights = teamfight_row(match, NOTEBOOK_MAX_FIGHTS)
+        return np.concatenate([main, players.ravel(), kda, team_kills, objectives, teamfights])
+
+    def transform(self, raw) -> np.ndarray:
+        """ 对 raw 的结果（一维或二维）选出 columns 并依次取对数、截断、缩放 """
+        x = np.asarray(raw, dtype='float64')[..., self.select]
+        x[..., self.log] = np.log1p(x[..., self.log])
+        np.clip(x, self.low, self.high, out=x)
+        x -= self.shift
+        x *= self.scale
+        return x
+
+    def __call__(self, match) -> np.ndarray:
+        return self.transform(self.raw(match))
+
+    def batch(self, matches) -> np.ndarray:
+        """ 多局比赛的特征矩阵 """
+        return self.transform(np.stack([self.raw(match) for match in matches]))
+
+    def fit(self, matches):
+        """ 在训练数据上求出 datapreproc_p2 中各列的变换参数
+
+        parameter:
+            1. matches : 训练集的比赛数据，如 read_matches(path, paths=SCORING_PATHS)
+
+        Tips:
+            players 列按 LOG_TRANSFORM_FEATURES / CLIP_FEATURES / NORMALIZE_FEATURES / STANDARDIZE_FEATURES 逐列处理，
+            objective 次数列与 datapreproc_p2 一样做最小最大归一化，teamfight 统计列见 _teamfight_scaling，
+            teamfight_time_ratio 截断到不大于 1，main 表的列保持原样。
+            与 sklearn 的 MinMaxScaler / StandardScaler 相同，求缩放参数时忽略空值（没有团战的比赛）
+        """
+        x = np.stack([self.raw(match) for match in matches])[:, self.select]
+        for j, col in enumerate(self.columns):
+            transform = _player_transform(col)
+            if transform is None:
+                if col in COUNT_COLUMNS:
+                    transform = (False, False, 'minmax')
+                else:
+                    transform = (False, False, _teamfight_scaling(col) if col in TEAMFIGHT_FEATURES else None)
+            log, clip, scaling = transform
+
+            values = x[:, j]
+            if log:
+                self.log[j] = True
+                values = np.log1p(values)
+            if clip:
+                q1, q3 = np.quantile(values, [0.25, 0.75])
+                self.low[j], self.high[j] = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+                values = np.clip(values, self.low[j], self.high[j])
+            if col == 'teamfight_time_ratio':
+                # game_time 为 0 时占比为无穷大，datapreproc_p2 中将大于 1 的占比置为 1
+                self.high[j] = 1.0
+            if scaling == 'minmax':
+                low, high = np.nanmin(values), np.nanmax(values)
+                self.shift[j], self.scale[j] = low, 1.0 / (high - low) if high > low else 1.0
+            elif scaling == 'standard':
+                std = np.nanstd(values)
+                self.shift[j], self.scale[j] = np.nanmean(values), 1.0 / std if std > 0 else 1.0
+        return self
+
+    def save(self, path):
+        np.savez(path, columns=np.array(self.columns), log=self.log, low=self.low, high=self.high,
+                 shift=self.shift, scale=self.scale)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            featurizer = cls(data['columns'].tolist())
+            for name in ('log', 'low', 'high', 'shift', 'scale'):
+                setattr(featurizer, name, data[name])
+        return featurizer
+
+def load_model(path):
+    """ 加载训练好的模型：.txt 为 LightGBM 保存的模型文件，其余按 pickle 加载（如 sklearn 模型） """
+    if str(path).endswith('.txt'):
+        import lightgbm
+        return lightgbm.Booster(model_file=str(path))
+    with open(path, 'rb') as fin:
+        return pickle.load(fin)
+
+def _predictor(model):
+    """ 返回由特征矩阵求 Radiant 获胜概率的函数 """
+    if hasattr(model, 'predict_proba'):
+        return lambda x: model.predict_proba(x)[:, 1]
+    return model.predict
+
+class LatencyStats:
+    """ 记录最近 window 次请求的延迟（秒），可以在多个线程中同时记录 """
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.count     = 0
+        self.lock      = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def summary(self) -> dict:
+        """ 请求总数以及最近 window 次请求延迟的 p50 / p99（毫秒） """
+        with self.lock:
+            latencies = np.array(self.latencies)
+            count = self.count
+        if not len(latencies):
+            return {'count': count, 'p50_ms': None, 'p99_ms': None}
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        return {'count': count, 'p50_ms': round(float(p50), 3), 'p99_ms': round(float(p99), 3)}
+
+class BatchScorer:
+    """ 常驻的打分器：模型和特征变换参数只加载一次，并发的请求由后台线程合并为小批量后一次性预测
+
+    特征在提交请求的线程中计算，后台线程取出第一条请求后最多再等待 max_wait 秒、凑满 max_batch 条，
+    然后对整批特征矩阵调用一次模型。单条请求时只增加很少的等待，并发时模型调用的次数大幅减少。
+    """
+
+    def __init__(self, model, featurizer, max_batch=64, max_wait=0.002):
+        """
+        parameter:
+            1. model      : 带有 predict_proba（sklearn）或 predict（LightGBM Booster）的模型
+            2. featurizer : 已经 fit / load 的 MatchFeaturizer
+            3. max_batch  : 每批最多的请求数
+            4. max_wait   : 凑批时最多等待的秒数
+        """
+        self.predict    = _predictor(model)
+        self.featurizer = featurizer
+        self.max_batch  = max_batch
+        self.max_wait   = max_wait
+        self.stats      = LatencyStats()
+        self.queue      = queue.Queue()
+        self.worker     = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, match) -> Future:
+        """ 提交一局比赛（dict 或 JSON 字符串），返回 Radiant 获胜概率的 Future """
+        start = time.perf_counter()
+        future = Future()
+        try:
+            if isinstance(match, (str, bytes)):
+                match = json.loads(match)
+            features = self.featurizer(match)
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        self.queue.put((features, future, start))
+        return future
+
+    def score(self, match) -> float:
+        return self.submit(match).result()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)  # 处理完这一批之后再退出
+                    break
+                batch.append(item)
+
+            try:
+                probs = self.predict(np.stack([features for features, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            end = time.perf_counter()
+            for (_, future, start), prob in zip(batch, probs):
+                future.set_result(float(prob))
+                self.stats.record(end - start)
+
+    def close(self):
+        self.queue.put(None)
+        self.worker.join()
+
+def serve_stdin(scorer, fin=sys.stdin, fout=sys.stdout):
+    """ 从 fin 逐行读取比赛数据，按输入顺序向 fout 逐行输出 {"match_id_hash": ..., "radiant_win_prob": ...}
+
+    读取和输出分别在两个线程中进行，输入较快时多行请求会被合并为一批。
+    """
+    pending = queue.Queue()
+
+    def write():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            match_id, future = item
+            try:
+                result = {'match_id_hash': match_id, 'radiant_win_prob': future.result()}
+            except Exception as e:
+                result = {'match_id_hash': match_id, 'error': repr(e)}
+            fout.write(json.dumps(result) + '\n')
+            fout.flush()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    for line in fin:
+        if not line.strip():
+            continue
+        try:
+            match = json.loads(line)
+        except ValueError as e:
+            future = Future()
+            future.set_exception(e)
+            pending.put((None, future))
+            continue
+        pending.put((match.get('match_id_hash'), scorer.submit(match)))
+    pending.put(None)
+    writer.join()
+
+def serve_http(scorer, host='127.0.0.1', port=8000):
+    """ 在本地提供 HTTP 接口：POST /score 的请求体为一局比赛的 JSON，GET /stats 返回请求数和 p50 / p99 延迟 """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._reply(200, scorer.stats.summary())
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/score':
+                self._reply(404, {'error': 'not found'})
+                return
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                match = json.loads(body)
+                prob = scorer.score(match)
+            except Exception as e:
+                self._reply(400, {'error': repr(e)})
+                return
+            self._reply(200, {'match_id_hash': match.get('match_id_hash'), 'radiant_win_prob': prob})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：
+    #   python -m utils.scoring model.pkl featurizer.npz            从标准输入逐行读取比赛数据并输出获胜概率
+    #   python -m utils.scoring model.pkl featurizer.npz --http 8000
+    #   python -m utils.scoring --bench [path/to/matches.jsonl]      用随机森林在前一半比赛上训练，对后一半比赛压测
+    from .readjsonl import read_matches
+
+    args = sys.argv[1:]
+    if args[:1] != ['--bench']:
+        scorer = BatchScorer(load_model(args[0]), MatchFeaturizer.load(args[1]))
+        if '--http' in args:
+            server = serve_http(scorer, port=int(args[args.index('--http') + 1]))
+            print(f"listening on http://127.0.0.1:{server.server_port}", file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        else:
+            serve_stdin(scorer)
+        print(scorer.stats.summary(), file=sys.stderr)
+        sys.exit(0)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    from sklearn.ensemble import RandomForestClassifier
+
+    matches_file = args[1] if len(args) > 1 else '../data/train_matches.jsonl'
+    matches = list(read_matches(matches_file, paths=SCORING_PATHS + ['targets.radiant_win']))
+    train, test = matches[:len(matches) // 2], matches[len(matches) // 2:]
+
+    featurizer = MatchFeaturizer().fit(train)
+    model = RandomForestClassifier(n_estimators=100, n_jobs=1, random_state=17)
+    model.fit(featurizer.batch(train), [match['targets']['radiant_win'] for match in train])
+    lines = [json.dumps(match) for match in test]
+
+    for max_batch, concurrency in [(1, 1), (1, 8), (64, 8), (64, 32)]:
+        scorer = BatchScorer(model, featurizer, max_batch=max_batch)
+        start = time.time()
+        with ThreadPoolExecutor(concurrency) as pool:
+            probs = list(pool.map(scorer.score, lines))
+        elapsed = time.time() - start
+        scorer.close()
+        print(f"max_batch={max_batch}, 并发数={concurrency}: {len(lines) / elapsed:.0f} 局/秒, {scorer.stats.summary()}")
@@ -0,0 +1,170 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+
+from .readjsonl import _effective_n_jobs
+
+# 按规则将样本分为若干段，每段训练一个模型，例如 train_RF_teamfight.ipynb 中按 teamfights_number 是否为 0
+# 分别训练两个随机森林：
+#     model = SegmentedModel(RandomForestClassifier(n_estimators=2000, ...), ColumnRule('teamfights_number', [1]))
+#     model.fit(df_train.drop(columns='radiant_win'), df_train['radiant_win'])
+#     model.predict_proba(df_test)
+# 各段的模型在线程中同时训练，按样本数分配 n_jobs 个 CPU（随机森林的训练和预测在 joblib 线程中释放 GIL），
+# 因此分段训练的总时间与用全部 CPU 训练一个同样大小的模型相当。
+
+class ColumnRule:
+    """ 按某一列的取值分段：段号为 np.digitize(列, bins)，如 bins=[1] 时 0 为第 0 段，大于等于 1 为第 1 段 """
+
+    def __init__(self, column, bins):
+        """
+        parameter:
+            1. column : DataFrame 的列名，或 numpy 数组的列号
+            2. bins   : 递增的分段边界
+        """
+        self.column = column
+        self.bins   = np.asarray(bins)
+
+    def __call__(self, X) -> np.ndarray:
+        values = X[self.column] if hasattr(X, 'columns') else np.asarray(X)[:, self.column]
+        return np.digitize(np.asarray(values, dtype='float64'), self.bins)
+
+def _take(X, index):
+    return X.iloc[index] if hasattr(X, 'iloc') else X[index]
+
+def _split_budget(costs, budget):
+    """ 按各段的代价分配 budget 个 CPU：每段至少 1 个，其余的依次分给 代价 / CPU 数 最大的段 """
+    n_jobs = [1] * len(costs)
+    for _ in range(budget - len(costs)):
+        i = max(range(len(costs)), key=lambda k: costs[k] / n_jobs[k])
+        n_jobs[i] += 1
+    return n_jobs
+
+def _partition(labels):
+    """ 将样本按段号稳定排序，返回 (段号, 该段样本的下标) 的列表 """
+    order = np.argsort(labels, kind='stable')
+    segments, starts = np.unique(labels[order], return_index=True)
+    bounds = np.append(starts, len(order))
+    return [(segment, order[bounds[i]:bounds[i + 1]]) for i, segment in enumerate(segments)]
+
+class SegmentedModel(ClassifierMixin, BaseEstimator):
+    """ 分段模型：由 rule 将样本分段，每段使用单独的分类器
+
+    实现了 sklearn 分类器的接口，可以直接用于 cross_val_score、utils.optimize 以及 utils.scoring.BatchScorer。
+    """
+
+    def __init__(self, estimator, rule, n_jobs=-1):
+        """
+        parameter:
+            1. estimator : 各段共用的分类器（每段训练一个副本），或 {段号: 分类器}
+            2. rule      : 接收特征矩阵（DataFrame 或 numpy 数组）并返回每个样本段号的函数，如 ColumnRule
+            3. n_jobs    : 所有段共用的 CPU 数，-1 表示全部 CPU；训练时按样本数分给各段，预测时各段依次使用全部 CPU
+        """
+        self.estimator = estimator
+        self.rule      = rule
+        self.n_jobs    = n_jobs
+
+    def _estimator(self, segment):
+        if isinstance(self.estimator, dict):
+            if segment not in self.estimator:
+                raise ValueError(f"没有为第 {segment} 段指定模型")
+            return clone(self.estimator[segment])
+        return clone(self.estimator)
+
+    @staticmethod
+    def _set_n_jobs(model, n_jobs):
+        if 'n_jobs' in model.get_params(deep=False):
+            model.set_params(n_jobs=n_jobs)
+
+    def fit(self, X, y):
+        """ 同时训练各段的模型，返回 self
+
+        训练后的属性：
+            classes_       : 所有样本中的类别
+            models_        : {段号: 训练好的模型}
+            segment_sizes_ : {段号: 样本数}
+            fit_seconds_   : {段号: 训练时间（秒）}
+        """
+        y = np.asarray(y)
+        self.classes_ = np.unique(y)
+        partition = _partition(np.asarray(self.rule(X)))
+        budget = _effective_n_jobs(self.n_jobs)
+        shares = _split_budget([len(index) for _, index in partition], budget)
+
+        def fit_segment(segment, index, n_jobs):
+            model = self._estimator(segment)
+            self._set_n_jobs(model, n_jobs)
+            start = time.perf_counter()
+            model.fit(_take(X, index), y[index])
+            return model, time.perf_counter() - start
+
+        # CPU 数少于段数时每段使用 1 个 CPU，同时最多训练 budget 段
+        with ThreadPoolExecutor(max_workers=min(budget, len(partition)) or 1) as executor:
+            futures = [executor.submit(fit_segment, segment, index, n_jobs)
+                       for (segment, index), n_jobs in zip(partition, shares)]
+            results = [future.result() for future in futures]
+
+        self.models_, self.segment_sizes_, self.fit_seconds_ = {}, {}, {}
+        for (segment, index), (model, seconds) in zip(partition, results):
+            self._set_n_jobs(model, budget)
+            self.models_[segment] = model
+            self.segment_sizes_[segment] = len(index)
+            self.fit_seconds_[segment] = seconds
+        return self
+
+    def predict_proba(self, X) -> np.ndarray:
+        """ 按段号将样本一次性分组，各段的模型分别预测后按原来的顺序写回
+
+        某一段的训练样本中只有部分类别时，其余类别的概率为 0；训练时没有出现过的段会报错。
+        """
+        result = np.zeros((len(X), len(self.classes_)))
+        for segment, index in _partition(np.asarray(self.rule(X))):
+            model = self.models_.get(segment)
+            if model is None:
+                raise ValueError(f"第 {segment} 段在训练数据中没有样本")
+            columns = np.searchsorted(self.classes_, model.classes_)
+            result[index[:, None], columns] = model.predict_proba(_take(X, index))
+        return result
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.segmented
+    import pandas as pd
+    from sklearn.datasets import make_classification
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import roc_auc_score
+
+    X, y = make_classification(n_samples=20000, n_features=40, n_informative=10, random_state=17)
+    df = pd.DataFrame(X, columns=[f'f{i}' for i in range(X.shape[1])])
+    # 模拟 teamfights_number：约四分之一的比赛为 0
+    df['teamfights_number'] = np.random.default_rng(17).poisson(1.4, len(df))
+    train, test = df.iloc[:15000], df.iloc[15000:]
+    y_train, y_test = y[:15000], y[15000:]
+    rf = RandomForestClassifier(n_estimators=300, min_samples_leaf=8, max_features='log2', random_state=17)
+    rule = ColumnRule('teamfights_number', [1])
+
+    # notebook 中的做法：依次用全部 CPU 训练两个模型，再手动合并预测结果
+    start = time.time()
+    zero = (train['teamfights_number'] == 0).to_numpy()
+    manual = {segment: clone(rf).set_params(n_jobs=-1).fit(train[mask], y_train[mask])
+              for segment, mask in [(0, zero), (1, ~zero)]}
+    print(f"依次训练: {time.time() - start:.2f}秒")
+
+    start = time.time()
+    model = SegmentedModel(rf, rule).fit(train, y_train)
+    print(f"同时训练: {time.time() - start:.2f}秒", model.segment_sizes_)
+
+    start = time.time()
+    test_zero = (test['teamfights_number'] == 0).to_numpy()
+    expected = np.empty(len(test))
+    expected[test_zero] = manual[0].predict_proba(test[test_zero])[:, 1]
+    expected[~test_zero] = manual[1].predict_proba(test[~test_zero])[:, 1]
+    print(f"手动合并预测: {time.time() - start:.2f}秒")
+
+    start = time.time()
+    proba = model.predict_proba(test)[:, 1]
+    print(f"分段预测: {time.time() - start:.2f}秒, ROC AUC {roc_auc_score(y_test, proba):.5f}")
+    assert np.allclose(proba, expected)
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import ujson as json
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'small_train_matches.json')
+
+# 玩家中保持不变的标量字段（身份 / 位置编号），其余的数值字段按比例扰动
+_FIXED_PLAYER_KEYS = frozenset(['player_slot', 'hero_id', 'account_id_hash', 'hero_name', 'randomed', 'pred_vict'])
+N_HEROES = 129
+
+def load_templates(path=DEFAULT_TEMPLATE):
+    """ 读取模板比赛：支持 small_train_matches.json 这样的 JSON 数组，也支持每行一局比赛的 JSONL 文件 """
+    with open(path, 'rb') as fin:
+        head = fin.read(64).lstrip()
+        fin.seek(0)
+        if head.startswith(b'['):
+            return json.load(fin)
+        return [json.loads(line) for line in fin if line.strip()]
+
+def _subsample(items, rng):
+    """ 按随机比例保留列表中的一部分元素，保持原来的顺序（事件按时间排列） """
+    if not items:
+        return items
+    keep = rng.random(len(items)) < rng.uniform(0.6, 1.0)
+    return [item for item, kept in zip(items, keep) if kept]
+
+def _scale(value, factor):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return int(round(value * factor)) if isinstance(value, int) else round(value * factor, 3)
+
+def synthetic_match(templates, seed, i):
+    """ 由模板确定性地生成第 i 局合成比赛：同样的 (seed, i) 总是得到同样的比赛
+
+    随机选取一局模板，重新生成 match_id_hash / 英雄 / 胜负，玩家的数值字段按比例扰动，
+    teamfights / objectives / chat 随机保留一部分。玩家中的日志、时间序列等嵌套字段直接引用模板，不复制。
+    """
+    rng = np.random.default_rng([seed, i])
+    template = templates[rng.integers(len(templates))]
+
+    match = dict(template)
+    match['match_id_hash'] = rng.bytes(16).hex()
+    for key in ('teamfights', 'objectives', 'chat'):
+        match[key] = _subsample(template.get(key, []), rng)
+
+    heroes = rng.choice(N_HEROES, size=len(template['players']), replace=False) + 1
+    factors = rng.uniform(0.7, 1.3, size=len(template['players']))
+    players = []
+    for player, hero, factor in zip(template['players'], heroes.tolist(), factors.tolist()):
+        player = {key: value if key in _FIXED_PLAYER_KEYS else _scale(value, factor) for key, value in player.items()}
+        player['hero_id'] = hero
+        player['account_id_hash'] = rng.bytes(16).hex()
+        players.append(player)
+    match['players'] = players
+
+    if 'targets' in template:
+        match['targets'] = dict(template['targets'], radiant_win=bool(rng.random() < 0.5))
+    return match
+
+def generate_matches(n, seed=0, templates=None):
+    """ 生成器函数，依次返回 n 局合成比赛（dict） """
+    templates = load_templates() if templates is None else templates
+    for i in range(n):
+        yield synthetic_match(templates, seed, i)
+
+def write_matches(path, n, seed=0, templates=None):
+    """ 将 n 局合成比赛写为 JSONL 文件（与 train_matches.jsonl 格式相同），已经存在时直接返回
+
+    生成结果只取决于 n、seed 和模板，因此文件可以按参数缓存、在多次基准测试之间复用。
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fout:
+        for match in generate_matches(n, seed, templates):
+            fout.write(json.dumps(match))
+            fout.write('\n')
+    os.replace(tmp_path, path)
+    return path
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.synthetic 10000 [path/to/output.jsonl] [seed]
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    output = sys.argv[2] if len(sys.argv) > 2 else f'../data/synthetic/synthetic_{n}.jsonl'
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    start = time.time()
+    write_matches(output, n, seed)
+    print(f"生成 {n} 局比赛: {time.time() - start:.2f}秒, {os.path.getsize(output) / 2 ** 20:.1f}MB")
@@ -0,0 +1,182 @@
+import os
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+import ujson as json
+
+from .extractdata import EXTRACTOR_VERSION, TABLES, extract_tables
+
+# 缓存目录结构：
+#   cache_dir/<文件名>-<内容哈希>-v<提取器版本>/<表名>/meta.json
+#                                                  /<列号>.values.npy   列数据
+#                                                  /<列号>.mask.npy     空值掩码（仅在存在空值时保存）
+#                                                  /<列号>.offsets.npy  字符串列中每个值在 values 中的字节偏移
+# 每一列单独保存为 .npy 文件，因此可以只加载需要的列，并且数值列可以直接内存映射。
+# meta.json 中记录每一列的 dtype，加载缓存得到的表与直接调用 extract_tables 得到的表完全相同。
+
+def file_digest(path, chunk_size=1 << 20):
+    """ 计算文件内容的 blake2b 哈希值 """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _cached_digest(path, cache_dir):
+    """ 按 (路径, 大小, 修改时间) 记住文件哈希，避免每次加载缓存都重新读取整个原始文件 """
+    memo_path = os.path.join(cache_dir, 'digests.json')
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as fin:
+            memo = json.load(fin)
+
+    stat = os.stat(path)
+    key = f'{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    if key not in memo:
+        memo[key] = file_digest(path)
+        with open(memo_path, 'w') as fout:
+            json.dump(memo, fout)
+    return memo[key]
+
+_MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+def _is_str_column(series):
+    """ pandas 的字符串类型，或只包含 str / None 的 object 列 """
+    if isinstance(series.dtype, pd.StringDtype):
+        return True
+    return series.dtype == object and all(val is None or isinstance(val, str) for val in series)
+
+def _column_kind(series):
+    """ 列的存储方式，加载时按保存的 dtype 还原，与保存前的列完全相同：
+        array  : numpy 数值 / 布尔列，原样保存，可以内存映射
+        masked : pandas 的可空类型（Int16 / boolean 等），保存数据和空值掩码
+        str    : 字符串列，保存 UTF-8 字节和偏移
+        object : 其他 object 列（如 obs_log 这类列表），用 pickle 保存
+    """
+    if isinstance(series.dtype, np.dtype) and series.dtype != object:
+        return 'array'
+    if isinstance(series.array, _MASKED_ARRAYS):
+        return 'masked'
+    if _is_str_column(series):
+        return 'str'
+    return 'object'
+
+def _save_column(series, kind, prefix):
+    mask = series.isna().to_numpy()
+    if kind == 'array':
+        values = series.to_numpy()
+    elif kind == 'masked':
+        values = series.array.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+    elif kind == 'str':
+        encoded = [b'' if isna else val.encode() for val, isna in zip(series, mask)]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        np.cumsum([len(val) for val in encoded], out=offsets[1:])
+        values = np.frombuffer(b''.join(encoded), dtype='uint8')
+        np.save(f'{prefix}.offsets.npy', offsets)
+    else:
+        # 缓存只在本地读写，pickle 可以原样还原列表、字典、None 和 NaN
+        np.save(f'{prefix}.values.npy', series.to_numpy(dtype=object), allow_pickle=True)
+        return
+    np.save(f'{prefix}.values.npy', values)
+    if kind != 'array' and mask.any():
+        np.save(f'{prefix}.mask.npy', mask)
+
+def save_table(df, table_dir):
+    """ 将 DataFrame 按列保存为带类型的二进制文件 """
+    tmp_dir = table_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    kinds, dtypes = [], []
+    for i, col in enumerate(df.columns):
+        kind = _column_kind(df[col])
+        _save_column(df[col], kind, os.path.join(tmp_dir, str(i)))
+        kinds.append(kind)
+        dtypes.append(str(df[col].dtype))
+
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as fout:
+        json.dump({'columns': list(df.columns), 'kinds': kinds, 'dtypes': dtypes, 'n_rows': len(df)}, fout)
+
+    # 写完后再替换，避免中断时留下不完整的缓存
+    if os.path.exists(table_dir):
+        shutil.rmtree(table_dir)
+    os.rename(tmp_dir, table_dir)
+
+def _load_column(prefix, kind, dtype, mmap_mode):
+    if kind == 'object':
+        # 显式指定 object，避免 pandas 将只含字符串的 object 列推断为 str 类型
+        return pd.Series(np.load(f'{prefix}.values.npy', allow_pickle=True), dtype=object, copy=False)
+    values = np.load(f'{prefix}.values.npy', mmap_mode=mmap_mode)
+    if kind == 'array':
+        # 以 ndarray 的视图返回，数据仍然是内存映射的
+        return values.view(np.ndarray)
+
+    dtype = pd.api.types.pandas_dtype(dtype)
+    if kind == 'masked':
+        mask = _load_mask(prefix, len(values))
+        return dtype.construct_array_type()(np.asarray(values), mask)
+
+    offsets = np.load(f'{prefix}.offsets.npy')
+    buf = values.tobytes()
+    result = np.array([buf[start:end].decode() for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+    result[_load_mask(prefix, len(result))] = None
+    return pd.Series(result, dtype=dtype, copy=False)
+
+def _load_mask(prefix, n_rows):
+    if os.path.exists(f'{prefix}.mask.npy'):
+        return np.load(f'{prefix}.mask.npy')
+    return np.zeros(n_rows, dtype='bool')
+
+def load_table(table_dir, columns=None, mmap_mode='r'):
+    """ 加载 save_table 保存的表
+
+    parameter:
+        1. table_dir : 表所在目录
+        2. columns   : 需要加载的列名，默认加载全部列；只会读取这些列对应的文件
+        3. mmap_mode : 数值列的内存映射模式，为 None 时将数据完整读入内存
+    """
+    with open(os.path.join(table_dir, 'meta.json')) as fin:
+        meta = json.load(fin)
+
+    index = {col: i for i, col in enumerate(meta['columns'])}
+    columns = meta['columns'] if columns is None else list(columns)
+
+    data = {}
+    for col in columns:
+        i = index[col]
+        data[col] = _load_column(os.path.join(table_dir, str(i)), meta['kinds'][i], meta['dtypes'][i], mmap_mode)
+
+    return pd.DataFrame(data, index=pd.RangeIndex(meta['n_rows']), columns=columns, copy=False)
+
+def cache_key(matches_file, cache_dir):
+    """ 缓存目录名：由原始文件名、文件内容哈希和提取器版本组成 """
+    _, filename = os.path.split(matches_file)
+    digest = _cached_digest(matches_file, cache_dir)
+    return f'{filename}-{digest}-v{EXTRACTOR_VERSION}'
+
+def cached_extract(matches_file, tables=tuple(TABLES), cache_dir='./data/cache', columns=None, n_jobs=1):
+    """ 带缓存的 extract_tables
+
+    缓存未命中的表会通过一次 extract_tables 统一提取并保存，之后直接从缓存中加载。
+
+    parameter:
+        1. matches_file : 原始 JSONL 文件路径
+        2. tables       : 需要的表名
+        3. cache_dir    : 缓存目录
+        4. columns      : {表名: 列名列表}，只加载指定的列
+        5. n_jobs       : 提取时使用的进程数
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key_dir = os.path.join(cache_dir, cache_key(matches_file, cache_dir))
+    columns = columns or {}
+
+    missing = [name for name in tables if not os.path.exists(os.path.join(key_dir, name, 'meta.json'))]
+    if missing:
+        os.makedirs(key_dir, exist_ok=True)
+        for name, df in extract_tables(matches_file, missing, n_jobs=n_jobs).items():
+            save_table(df, os.path.join(key_dir, name))
+
+    return {name: load_table(os.path.join(key_dir, name), columns.get(name)) for name in tables}
@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+TEAMS = ['Radiant', 'Dire']
+METRICS = ['damage', 'gold_delta', 'xp_delta']
+STATS = ['max', 'min', 'avg']
+
+METRIC_COLUMNS = [f'{team}_{metric}_{stat}' for metric in METRICS for team in TEAMS for stat in STATS]
+BUYBACK_COLUMNS = [f'{team}_buybacks' for team in TEAMS]
+# datapreproc_p2 中 teamfights_statistics.csv 的列（不含最后重复的 game_time）
+TEAMFIGHT_FEATURES = ['total_teamfight_time', 'teamfight_time_ratio'] + METRIC_COLUMNS
+# datapreproc_p2 只统计每局比赛的前 16 次团战
+NOTEBOOK_MAX_FIGHTS = 16
+
+def _fights(long_df):
+    """ 长格式表中每一行所属团战的编号，以及每次团战的第一行（长格式表按比赛、团战的顺序排列） """
+    match = long_df['match'].to_numpy()
+    teamfight = long_df['teamfight'].to_numpy()
+    first = np.ones(len(long_df), dtype=bool)
+    first[1:] = (match[1:] != match[:-1]) | (teamfight[1:] != teamfight[:-1])
+    return np.cumsum(first) - 1, first
+
+def _reduce_at(ufunc, groups, values, n_groups):
+    """ 按 groups 分组对 values 求 fmax / fmin（忽略空值），全为空值的组结果为空值 """
+    result = np.full(n_groups, np.nan)
+    ufunc.at(result, groups, values)
+    return result
+
+def _mean_at(groups, values, n_groups):
+    """ 按 groups 分组求均值（忽略空值），全为空值的组结果为空值 """
+    valid = ~np.isnan(values)
+    sums = np.bincount(groups[valid], weights=values[valid], minlength=n_groups)
+    counts = np.bincount(groups[valid], minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def teamfight_rollups(long_df, n_matches=None, game_time=None) -> pd.DataFrame:
+    """ 由 extract_teamfights_long 生成的长格式表向量化地计算每局比赛的团战统计
+
+    parameter:
+        1. long_df   : 长格式的 teamfights 表
+        2. n_matches : 比赛局数，默认为长格式表中最大的比赛序号加一（最后几局没有团战时需要给出），
+                       不能小于该默认值
+        3. game_time : 每局比赛的 game_time，给出时追加团战总时间的占比 teamfight_time_ratio
+
+    returned value:
+        每局比赛一行的 DataFrame：
+            teamfights_number    : 团战次数（包括没有玩家数据的团战，与 len(match['teamfights']) 相同），
+                                   为 0 的比赛可以直接用它划分
+            total_teamfight_time : 所有团战 end - start 之和
+            {队伍}_{指标}_{max/min/avg} : 先求每次团战中该队 5 名玩家的最大值 / 最小值 / 均值，
+                                          再求整局比赛中的最大值 / 最小值 / 均值，没有团战时为空值
+            {队伍}_buybacks      : 该队在团战中的买活次数
+    """
+    min_matches = int(long_df['match'].max()) + 1 if len(long_df) else 0
+    if n_matches is None:
+        n_matches = min_matches
+    elif n_matches < min_matches:
+        raise ValueError(f"n_matches = {n_matches}，但长格式表中的比赛序号最大为 {min_matches - 1}")
+
+    fight, first = _fights(long_df)
+    n_fights = int(fight[-1]) + 1 if len(fight) else 0
+    fight_match = long_df['match'].to_numpy()[first].astype('int64')
+    # 没有玩家数据的团战（player 为 -1）的玩家字段都是空值，计入 Radiant 不影响各项统计
+    team = (long_df['player'].to_numpy() >= 5).astype('int64')
+
+    result = {'teamfights_number': np.bincount(fight_match, minlength=n_matches)}
+
+    duration = (long_df['end'].to_numpy('float64') - long_df['start'].to_numpy('float64'))[first]
+    result['total_teamfight_time'] = np.bincount(fight_match, weights=np.nan_to_num(duration), minlength=n_matches)
+    if game_time is not None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = result['total_teamfight_time'] / np.asarray(game_time, dtype='float64')
+        result['teamfight_time_ratio'] = np.where(np.isnan(ratio), 0.0, ratio)
+
+    # (团战, 队伍) 和 (比赛, 队伍) 两级分组
+    fight_team = fight * 2 + team
+    match_team = np.repeat(fight_match, 2) * 2 + np.tile([0, 1], n_fights)
+    for metric in METRICS:
+        values = long_df[metric].to_numpy('float64')
+        per_fight = {
+            'max': _reduce_at(np.fmax, fight_team, values, n_fights * 2),
+            'min': _reduce_at(np.fmin, fight_team, values, n_fights * 2),
+            'avg': _mean_at(fight_team, values, n_fights * 2),
+        }
+        per_match = {
+            'max': _reduce_at(np.fmax, match_team, per_fight['max'], n_matches * 2),
+            'min': _reduce_at(np.fmin, match_team, per_fight['min'], n_matches * 2),
+            'avg': _mean_at(match_team, per_fight['avg'], n_matches * 2),
+        }
+        for t, team_name in enumerate(TEAMS):
+            for stat in STATS:
+                result[f'{team_name}_{metric}_{stat}'] = per_match[stat][t::2]
+
+    match_player_team = long_df['match'].to_numpy().astype('int64') * 2 + team
+    buybacks = np.nan_to_num(long_df['buybacks'].to_numpy('float64'))
+    buybacks = np.bincount(match_player_team, weights=buybacks, minlength=n_matches * 2)
+    for t, col in enumerate(BUYBACK_COLUMNS):
+        result[col] = buybacks[t::2]
+
+    return pd.DataFrame(result)
+
+def teamfight_row(match, max_fights=None) -> list:
+    """ 与 teamfight_rollups 相同的统计，直接由一局比赛的 dict 计算，返回 TEAMFIGHT_FEATURES 各列的值
+
+    parameter:
+        1. match      : 一局比赛，至少包含 game_time 以及 teamfights 的 start / end / players
+        2. max_fights : 只统计前 max_fights 次团战，None 表示全部团战；与 datapreproc_p2 一致时为 NOTEBOOK_MAX_FIGHTS
+    """
+    total_time = 0.0
+    per_fight = {(metric, t): [] for metric in METRICS for t in range(len(TEAMS))}
+    for teamfight in match['teamfights'][:max_fights]:
+        if teamfight.get('end') is not None and teamfight.get('start') is not None:
+            total_time += teamfight['end'] - teamfight['start']
+        players = (teamfight.get('players') or [])[:10]
+        for metric in METRICS:
+            for t in range(len(TEAMS)):
+                values = [player[metric] for player in players[t * 5:(t + 1) * 5] if player.get(metric) is not None]
+                if values:
+                    per_fight[metric, t].append((max(values), min(values), sum(values) / len(values)))
+
+    # 与 teamfight_rollups 相同：game_time 为 0 时占比为空值（记为 0）或无穷大
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = np.float64(total_time) / np.float64(match['game_time'])
+    row = [total_time, 0.0 if np.isnan(ratio) else float(ratio)]
+    for metric in METRICS:
+        for t in range(len(TEAMS)):
+            stats = per_fight[metric, t]
+            if stats:
+                highs, lows, means = zip(*stats)
+                row += [max(highs), min(lows), sum(means) / len(means)]
+            else:
+                row += [np.nan] * len(STATS)
+    return row
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.teamfights [path/to/matches.jsonl]
+    import sys
+    import time
+
+    from .extractdata import extract_tables
+
+    matches_file = sys.argv[1] if len(sys.argv) > 1 else '../data/train_matches.jsonl'
+
+    start = time.time()
+    tables = extract_tables(matches_file, ['main', 'teamfights', 'teamfights_long'])
+    print(f"提取执行时间: {time.time() - start:.2f}秒")
+
+    for name in ('teamfights', 'teamfights_long'):
+        print(f"{name}: {tables[name].shape}, {tables[name].memory_usage(deep=True).sum() / 2 ** 20:.1f}MB")
+
+    start = time.time()
+    rollups = teamfight_rollups(tables['teamfights_long'], len(tables['main']), tables['main']['game_time'])
+    print(f"团战统计执行时间: {time.time() - start:.2f}秒")
+    assert (rollups['teamfights_number'] == tables['main']['teamfights_number']).all()
+
+    # 逐局比赛计算的结果与向量化的结果相同
+    from .readjsonl import read_matches
+
+    rows = np.array([teamfight_row(match) for match in read_matches(matches_file)])
+    assert np.allclose(rows, rollups[TEAMFIGHT_FEATURES].to_numpy('float64'), equal_nan=True)
+
+    # n_matches 小于比赛序号时报错，而不是返回行数不一致的结果
+    try:
+        teamfight_rollups(tables['teamfights_long'], int(tables['teamfights_long']['match'].max()))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("n_matches 过小时应当报错")
+
+    # 没有玩家数据的团战同样计入团战次数和团战时间
+    import os
+    import tempfile
+
+    import ujson as json
+
+    matches = [match for match, _ in zip(read_matches(matches_file), range(50))]
+    for match in matches:
+        for teamfight in match['teamfights'][::2]:
+            teamfight['players'] = []
+    empty_file = os.path.join(tempfile.mkdtemp(), 'empty_players.jsonl')
+    with open(empty_file, 'w') as fout:
+        fout.writelines(json.dumps(match) + '\n' for match in matches)
+    long_df = extract_tables(empty_file, ['teamfights_long'])['teamfights_long']
+    rollups = teamfight_rollups(long_df, len(matches))
+    assert rollups['teamfights_number'].tolist() == [len(match['teamfights']) for match in matches]
+    assert np.allclose(rollups['total_teamfight_time'],
+                       [sum(fight['end'] - fight['start'] for fight in match['teamfights']) for match in matches])
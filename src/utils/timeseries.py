@@ -0,0 +1,301 @@
+import os
+
+import numpy as np
+import pandas as pd
+import ujson as json
+
+class PlayerSeries:
+    """ extract_player_series 生成的玩家时序数据（CSR 格式，内存映射加载） """
+
+    def __init__(self, series_dir, mmap_mode='r'):
+        """ 加载时序数据
+
+        parameter:
+            1. series_dir : extract_player_series 的输出目录
+            2. mmap_mode  : 内存映射模式，为 None 时将数据完整读入内存
+        """
+        with open(os.path.join(series_dir, 'meta.json')) as fin:
+            meta = json.load(fin)
+
+        self.names     = meta['series']
+        self.n_players = meta['players']
+        self.values    = np.load(os.path.join(series_dir, 'values.npy'), mmap_mode=mmap_mode)
+        self.offsets   = np.load(os.path.join(series_dir, 'offsets.npy'))
+        self.match_ids = np.load(os.path.join(series_dir, 'match_ids.npy'))
+
+    def __len__(self):
+        return len(self.match_ids)
+
+    def series(self, name) -> np.ndarray:
+        """ 返回所有比赛、所有玩家的某种时序数据首尾相接后的一维数组（不复制） """
+        return self.values[self.names.index(name)]
+
+    def lengths(self) -> np.ndarray:
+        """ 返回 (比赛数, 玩家数) 的数组，表示每名玩家时序数据的长度 """
+        return np.diff(self.offsets).reshape(-1, self.n_players)
+
+    def get(self, match, player, name=None) -> np.ndarray:
+        """ 返回第 match 局比赛第 player 名玩家（均从 0 开始）的时序数据
+
+        name 为 None 时返回 (时序种类数, 长度) 的数组，否则返回一维数组，均不复制数据。
+        """
+        row = match * self.n_players + player
+        start, end = self.offsets[row], self.offsets[row + 1]
+        if name is None:
+            return self.values[:, start:end]
+        return self.series(name)[start:end]
+
+    def to_padded(self, name, length=None, fill_value=0) -> np.ndarray:
+        """ 将某种时序数据转换为 (比赛数, 玩家数, length) 的定长数组，不足的部分用 fill_value 填充 """
+        lengths = np.diff(self.offsets)
+        if length is None:
+            length = int(lengths.max(initial=0))
+
+        steps = np.arange(length)
+        index = self.offsets[:-1, None] + steps
+        valid = steps < lengths[:, None]
+
+        result = np.full(index.shape, fill_value, dtype=self.values.dtype)
+        result[valid] = self.series(name)[index[valid]]
+        return result.reshape(len(self), self.n_players, length)
+
+TEAM_SERIES = ['gold_t', 'xp_t', 'lh_t']
+SIDES = ['radiant', 'dire', 'lead']
+RADIANT, DIRE = slice(0, 5), slice(5, 10)
+
+def _segmented_accumulate(ufunc, values, segment_ids):
+    """ 对首尾相接的多段数据分别做 ufunc.accumulate（maximum / minimum），不需要逐段循环
+
+    每段加上 段号 * span 的偏移后，后一段的所有值都比前一段大（求最小值时取负号后同理），
+    因此整体做一次累计极值，各段之间互不影响，最后再减去偏移。
+    """
+    span = int(values.max(initial=0)) - int(values.min(initial=0)) + 1
+    shift = segment_ids.astype('int64') * span
+    if ufunc is np.minimum:
+        return -np.maximum.accumulate(shift - values) + shift
+    return np.maximum.accumulate(values + shift) - shift
+
+class TeamSeries:
+    """ 每局比赛两队 gold_t / xp_t / lh_t 之和（以及 Radiant 减 Dire 的领先值）的时序数据
+
+    预先计算每条时序数据的前缀和与截至每个采样点的最大值 / 最小值，之后对任意
+    (比赛, 截止时刻 game_time, 窗口) 的批量查询都只需要几次向量化的下标运算，不需要重新读取原始的 JSONL。
+    各种数据都是所有比赛首尾相接的一维数组，第 i 局比赛位于 [offsets[i], offsets[i + 1])，与 PlayerSeries 相同。
+    """
+
+    _ARRAYS = ['times', 'offsets', 'values', 'prefix', 'running_max', 'running_min']
+
+    def __init__(self, names, match_ids, times, offsets, values, prefix, running_max, running_min):
+        self.names       = list(names)
+        self.match_ids   = match_ids
+        self.times       = times        # (总长度,) 每个采样点的 game_time（秒）
+        self.offsets     = offsets      # (比赛数 + 1,)
+        self.values      = values       # (时序种类数, 3, 总长度)，第二维依次为 SIDES
+        self.prefix      = prefix       # (时序种类数, 3, 总长度 + 1)，prefix[..., k] 为前 k 个值之和（跨比赛累加）
+        self.running_max = running_max  # (时序种类数, 3, 总长度)，本局比赛截至该采样点的最大值
+        self.running_min = running_min
+        self._keys       = None
+        self._index      = None
+
+    @classmethod
+    def from_player_series(cls, player_series, names=TEAM_SERIES):
+        """ 由 PlayerSeries 计算两队的时序数据
+
+        同一局比赛中各玩家的时序长度不同时（如中途断线），只使用所有玩家都有数据的前若干个采样点。
+        """
+        lengths = player_series.lengths().min(axis=1)
+        offsets = np.zeros(len(lengths) + 1, dtype='int64')
+        np.cumsum(lengths, out=offsets[1:])
+        segment_ids = np.repeat(np.arange(len(lengths)), lengths)
+        steps = np.arange(offsets[-1]) - offsets[segment_ids]
+        # rows[:, j] 为每个采样点对应的第 j 名玩家的数据在 PlayerSeries 中的位置
+        rows = player_series.offsets[segment_ids[:, None] * player_series.n_players + np.arange(10)] + steps[:, None]
+
+        times = player_series.series('times')[rows[:, 0]]
+        values = np.empty((len(names), len(SIDES), len(steps)), dtype='int64')
+        for i, name in enumerate(names):
+            series = player_series.series(name)
+            values[i, 0] = series[rows[:, RADIANT]].sum(axis=1, dtype='int64')
+            values[i, 1] = series[rows[:, DIRE]].sum(axis=1, dtype='int64')
+            values[i, 2] = values[i, 0] - values[i, 1]
+
+        prefix = np.zeros(values.shape[:2] + (len(steps) + 1,), dtype='int64')
+        np.cumsum(values, axis=2, out=prefix[..., 1:])
+        running_max = np.empty_like(values)
+        running_min = np.empty_like(values)
+        for i in range(len(names)):
+            for side in range(len(SIDES)):
+                running_max[i, side] = _segmented_accumulate(np.maximum, values[i, side], segment_ids)
+                running_min[i, side] = _segmented_accumulate(np.minimum, values[i, side], segment_ids)
+
+        return cls(names, np.asarray(player_series.match_ids), times, offsets, values, prefix, running_max, running_min)
+
+    def save(self, output_dir):
+        """ 保存到 output_dir 中，之后可以用 TeamSeries.load 内存映射加载 """
+        os.makedirs(output_dir, exist_ok=True)
+        for key in self._ARRAYS + ['match_ids']:
+            np.save(os.path.join(output_dir, f'{key}.npy'), getattr(self, key))
+        with open(os.path.join(output_dir, 'meta.json'), 'w') as fout:
+            json.dump({'series': self.names}, fout)
+
+    @classmethod
+    def load(cls, series_dir, mmap_mode='r'):
+        with open(os.path.join(series_dir, 'meta.json')) as fin:
+            meta = json.load(fin)
+        arrays = {key: np.load(os.path.join(series_dir, f'{key}.npy'), mmap_mode=mmap_mode) for key in cls._ARRAYS}
+        match_ids = np.load(os.path.join(series_dir, 'match_ids.npy'))
+        return cls(meta['series'], match_ids, **arrays)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def index(self, match_ids) -> np.ndarray:
+        """ 将 match_id_hash 转换为比赛序号，有不存在的比赛时抛出 KeyError """
+        if self._index is None:
+            self._index = {match_id: i for i, match_id in enumerate(self.match_ids.astype(str))}
+        match_ids = np.asarray(match_ids).astype(str)
+        missing = [match_id for match_id in match_ids if match_id not in self._index]
+        if missing:
+            raise KeyError(f"{len(missing)} 局比赛不在时序数据中，如 {missing[:3]}")
+        return np.array([self._index[match_id] for match_id in match_ids], dtype='int64')
+
+    def positions(self, matches, cutoffs) -> np.ndarray:
+        """ 第 matches[q] 局比赛在 game_time 为 cutoffs[q] 时最后一个采样点的全局位置
+
+        cutoffs 早于第一个采样点时取第一个采样点，晚于最后一个采样点时取最后一个。
+        比赛序号和时刻一起编码为一个 int64 的键，所有比赛的采样点按键有序，因此一次 searchsorted 即可完成所有查询。
+        """
+        if self._keys is None:
+            segment_ids = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+            self._keys = (segment_ids << 32) + (np.asarray(self.times, dtype='int64') + (1 << 31))
+        matches = np.asarray(matches, dtype='int64')
+        cutoffs = np.asarray(cutoffs, dtype='int64')
+        # 负数序号会被 numpy 当作从末尾开始的下标，静默地读到最后几局比赛
+        if matches.size and (matches.min() < 0 or matches.max() >= len(self)):
+            raise IndexError(f"比赛序号应在 [0, {len(self)}) 内")
+        if np.any(np.diff(self.offsets)[matches] == 0):
+            raise ValueError("查询的比赛中有没有采样点的比赛")
+        keys = (matches << 32) + (cutoffs + (1 << 31))
+        pos = np.searchsorted(self._keys, keys, side='right') - 1
+        return np.maximum(pos, self.offsets[matches])
+
+    def _row(self, name, side):
+        return self.names.index(name), SIDES.index(side)
+
+    def at(self, name, side, matches, cutoffs) -> np.ndarray:
+        """ 截止时刻的值，如 at('gold_t', 'lead', ...) 为 Radiant 的金钱领先 """
+        i, s = self._row(name, side)
+        return self.values[i, s][self.positions(matches, cutoffs)]
+
+    def _window_mean(self, i, s, offsets, pos, window):
+        # 窗口内（含截止时刻）最多 window 个采样点，不早于本局比赛的开始
+        start = np.maximum(pos - (window - 1), offsets)
+        prefix = self.prefix[i, s]
+        return (prefix[pos + 1] - prefix[start]) / (pos + 1 - start)
+
+    def _slope(self, i, s, offsets, pos, window):
+        start = np.maximum(pos - window, offsets)
+        values = self.values[i, s]
+        minutes = (np.asarray(self.times[pos], dtype='float64') - self.times[start]) / 60
+        change = (values[pos] - values[start]).astype('float64')
+        return np.divide(change, minutes, out=np.zeros_like(change), where=minutes > 0)
+
+    def window_mean(self, name, side, matches, cutoffs, window) -> np.ndarray:
+        """ 截止时刻之前最近 window 个采样点（每分钟一个）的平均值 """
+        matches = np.asarray(matches, dtype='int64')
+        pos = self.positions(matches, cutoffs)
+        return self._window_mean(*self._row(name, side), self.offsets[matches], pos, window)
+
+    def slope(self, name, side, matches, cutoffs, window) -> np.ndarray:
+        """ 最近 window 分钟内每分钟的平均变化量：(当前值 - window 个采样点之前的值) / 经过的分钟数
+
+        本局比赛在截止时刻之前没有更早的采样点时为 0。
+        """
+        matches = np.asarray(matches, dtype='int64')
+        pos = self.positions(matches, cutoffs)
+        return self._slope(*self._row(name, side), self.offsets[matches], pos, window)
+
+    def max_so_far(self, name, side, matches, cutoffs) -> np.ndarray:
+        """ 本局比赛截至截止时刻的最大值，如 max_so_far('gold_t', 'lead', ...) 为 Radiant 的最大金钱领先 """
+        i, s = self._row(name, side)
+        return self.running_max[i, s][self.positions(matches, cutoffs)]
+
+    def min_so_far(self, name, side, matches, cutoffs) -> np.ndarray:
+        """ 本局比赛截至截止时刻的最小值，对 lead 取负号即为 Radiant 的最大落后 """
+        i, s = self._row(name, side)
+        return self.running_min[i, s][self.positions(matches, cutoffs)]
+
+    def features(self, matches, cutoffs, windows=(5,)) -> pd.DataFrame:
+        """ 批量计算 (比赛, 截止时刻) 的时序特征，每个查询一行
+
+        parameter:
+            1. matches : 比赛序号的数组（可以由 index 从 match_id_hash 转换得到）
+            2. cutoffs : 与 matches 等长的 game_time（秒）数组
+            3. windows : 窗口大小（分钟）的列表，每个窗口计算一组均值和斜率特征
+
+        returned value:
+            DataFrame，对于每种时序数据（去掉 _t 后缀，如 gold）包括：
+                radiant_gold / dire_gold / gold_lead     : 截止时刻的值
+                gold_lead_max / gold_lead_min            : 截至截止时刻领先值的最大值 / 最小值
+                gold_lead_mean_{w} / gold_lead_slope_{w} : 最近 w 分钟领先值的均值 / 斜率
+                radiant_gold_slope_{w} / dire_gold_slope_{w}
+        """
+        matches = np.asarray(matches, dtype='int64')
+        pos = self.positions(matches, cutoffs)
+        offsets = self.offsets[matches]
+        columns = {}
+        for i, name in enumerate(self.names):
+            short = name[:-2] if name.endswith('_t') else name
+            side_columns = [f'radiant_{short}', f'dire_{short}', f'{short}_lead']
+            for s, column in enumerate(side_columns):
+                columns[column] = self.values[i, s][pos]
+            columns[f'{short}_lead_max'] = self.running_max[i, 2][pos]
+            columns[f'{short}_lead_min'] = self.running_min[i, 2][pos]
+            for window in windows:
+                columns[f'{short}_lead_mean_{window}'] = self._window_mean(i, 2, offsets, pos, window)
+                for s, column in enumerate(side_columns):
+                    columns[f'{column}_slope_{window}'] = self._slope(i, s, offsets, pos, window)
+        return pd.DataFrame(columns)
+
+    def sample_cutoffs(self, n_per_match, seed=17):
+        """ 为每局比赛在 [第一个采样点, 最后一个采样点] 内均匀随机地抽取 n_per_match 个截止时刻
+
+        returned value:
+            (matches, cutoffs)，可以直接传给 features 生成多个截止时刻的训练集
+        """
+        rng = np.random.default_rng(seed)
+        lengths = np.diff(self.offsets)
+        matches = np.repeat(np.flatnonzero(lengths > 0), n_per_match)
+        first = np.asarray(self.times[self.offsets[matches]], dtype='int64')
+        last = np.asarray(self.times[self.offsets[matches + 1] - 1], dtype='int64')
+        return matches, rng.integers(first, last + 1)
+
+if __name__ == "__main__":
+    # 在 src 目录下运行：python -m utils.timeseries path/to/player_series_dir
+    import sys
+    import time
+
+    player_series = PlayerSeries(sys.argv[1])
+
+    start = time.time()
+    team_series = TeamSeries.from_player_series(player_series)
+    print(f"预计算 {len(team_series)} 局比赛: {time.time() - start:.2f}秒")
+
+    matches, cutoffs = team_series.sample_cutoffs(100)
+    start = time.time()
+    features = team_series.features(matches, cutoffs, windows=(3, 5))
+    print(f"{len(features)} 个查询: {time.time() - start:.2f}秒")
+
+    # 与逐个查询的 Python 循环对比
+    start = time.time()
+    for match, cutoff, row in zip(matches[:2000], cutoffs[:2000], features.itertuples()):
+        gold = player_series.get(match, 0, 'times')
+        k = max(0, np.searchsorted(gold, cutoff, side='right') - 1)
+        lead = [player_series.get(match, j, 'gold_t')[:k + 1].astype('int64') for j in range(10)]
+        lead = sum(lead[:5]) - sum(lead[5:])
+        assert lead[k] == row.gold_lead and lead.max() == row.gold_lead_max and lead.min() == row.gold_lead_min
+        assert np.isclose(lead[max(0, k - 4):].mean(), row.gold_lead_mean_5)
+        ref = max(0, k - 5)
+        slope = (lead[k] - lead[ref]) / ((gold[k] - gold[ref]) / 60) if k > ref else 0.0
+        assert np.isclose(slope, row.gold_lead_slope_5)
+    print(f"Python 循环 2000 个查询: {time.time() - start:.2f}秒")
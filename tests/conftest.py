@@ -0,0 +1,24 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 与 notebook 一样从 src 目录导入 utils，RF_DT 中的模块按文件名导入
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.join(ROOT, 'note', 'RF_DT'))
+
+@pytest.fixture(scope='session')
+def matches():
+    """ data/small_train_matches.json 中的 20 局比赛 """
+    with open(os.path.join(ROOT, 'data', 'small_train_matches.json')) as fin:
+        return json.load(fin)
+
+@pytest.fixture(scope='session')
+def matches_file(matches, tmp_path_factory):
+    """ 同样的 20 局比赛，保存为 JSONL 文件 """
+    path = tmp_path_factory.mktemp('data') / 'matches.jsonl'
+    with open(path, 'w') as fout:
+        fout.writelines(json.dumps(match) + '\n' for match in matches)
+    return str(path)
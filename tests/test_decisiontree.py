@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from decisiontree import DecisionTreeRegressor
+
+def baseline_tree(x, y, depth, max_depth):
+    """ 最初的实现：逐个特征、逐个阈值计算均方误差，返回 (特征, 阈值, 左子树, 右子树) 或叶节点的值 """
+    if len(np.unique(y)) == 1:
+        return y[0]
+    if depth >= max_depth:
+        return np.average(y)
+    best = (np.inf, None, None)
+    for i in range(x.shape[1]):
+        xs = np.sort(x[:, i])
+        for threshold in [(a + b) / 2 for a, b in zip(xs[:-1], xs[1:]) if a != b]:
+            y_lt, y_gt = y[x[:, i] < threshold], y[x[:, i] > threshold]
+            mse = (len(y_lt) / len(y) * np.sum((y_lt - np.average(y_lt)) ** 2)
+                   + len(y_gt) / len(y) * np.sum((y_gt - np.average(y_gt)) ** 2))
+            if best[0] > mse:
+                best = (mse, i, threshold)
+    _, i, threshold = best
+    lt, gt = x[:, i] < threshold, x[:, i] > threshold
+    return (i, threshold, baseline_tree(x[lt], y[lt], depth + 1, max_depth),
+            baseline_tree(x[gt], y[gt], depth + 1, max_depth))
+
+def baseline_predict(tree, row):
+    while isinstance(tree, tuple):
+        i, threshold, left, right = tree
+        if row[i] == threshold:
+            return 0.0  # 等于阈值的样本不进入任何子树
+        tree = left if row[i] < threshold else right
+    return tree
+
+def assert_same_tree(node, expected):
+    if not isinstance(expected, tuple):
+        assert node.left_child is None and node.right_child is None
+        assert node.value == pytest.approx(expected, rel=1e-9, abs=1e-12)
+        return
+    i, threshold, left, right = expected
+    assert (node.feature_idx, node.value) == (i, threshold)
+    assert_same_tree(node.left_child, left)
+    assert_same_tree(node.right_child, right)
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    x = np.round(rng.random((200, 4)) * 50)  # 有重复取值
+    y = x[:, 0] * 0.3 - x[:, 2] + rng.normal(size=200)
+    return x, y
+
+def test_same_splits_and_predictions_as_baseline(data):
+    x, y = data
+    model = DecisionTreeRegressor(max_depth=4)
+    model.fit(x, y)
+    expected = baseline_tree(x, y, 0, 4)
+    assert_same_tree(model.root, expected)
+
+    # 阈值是两个整数的均值，整数或 x.5，测试数据中没有等于阈值的取值
+    x_test = np.random.default_rng(1).integers(-5, 56, (500, 4)) + 0.25
+    np.testing.assert_allclose(model.predict(x_test), [baseline_predict(expected, row) for row in x_test],
+                               rtol=1e-9)
+
+def test_value_equal_to_threshold_goes_right(data):
+    x, y = data
+    model = DecisionTreeRegressor(max_depth=1)
+    model.fit(x, y)
+    root = model.root
+    row = x[:1].copy()
+    row[0, root.feature_idx] = root.value
+    assert model.predict(row)[0] == root.right_child.value
+    assert baseline_predict(baseline_tree(x, y, 0, 1), row[0]) == 0.0
@@ -0,0 +1,20 @@
+import pytest
+
+from utils.getfeaturetree import discover_schema
+
+@pytest.mark.parametrize('sample', [None, 1, 7, 20])
+def test_sharded_schema_matches_serial(matches_file, sample):
+    full = discover_schema(matches_file, n_jobs=1)
+    sharded = discover_schema(matches_file, n_jobs=2, sample=sample)
+    if sample is None:
+        assert sharded == full
+    # 抽样时各分片取的比赛与顺序读取的前 sample 局不同，只能出现完整统计中的键路径
+    assert sharded.keys() <= full.keys()
+    # 每个分片按 sample // 分片数（前 sample % 分片数 个分片再加一）统计，合计不超过 sample
+    assert sum(sharded['match_id_hash'].values()) <= (sample or 20)
+
+@pytest.mark.parametrize('n_jobs, sample', [(1, None), (1, 5), (2, None), (2, 5)])
+def test_empty_file(tmp_path, n_jobs, sample):
+    path = tmp_path / 'empty.jsonl'
+    path.write_bytes(b'')
+    assert discover_schema(str(path), n_jobs=n_jobs, sample=sample) == {}
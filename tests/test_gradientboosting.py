@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from gradientboosting import GradientBoostingClassifier
+
+@pytest.mark.parametrize('n_estimators', [0, 5])
+def test_save_load(tmp_path, n_estimators):
+    rng = np.random.default_rng(0)
+    x = rng.random((300, 5))
+    y = (x[:, 0] + 0.2 * rng.random(300) > 0.6).astype(float)
+    model = GradientBoostingClassifier(n_estimators=n_estimators, random_state=0)
+    model.fit(x, y)
+    assert (model.forest is None) == (n_estimators == 0)
+
+    model.save(str(tmp_path / 'model'))
+    loaded = GradientBoostingClassifier.load(str(tmp_path / 'model'))
+    np.testing.assert_array_equal(loaded.predict_proba(x), model.predict_proba(x))
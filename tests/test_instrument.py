@@ -0,0 +1,35 @@
+import time
+
+import numpy as np
+import pytest
+
+from utils import instrument
+from utils.instrument import Instrument
+
+pytestmark = pytest.mark.skipif(instrument.rss_bytes() is None, reason='需要 /proc/self/status')
+
+def _allocate(n_mb, hold=0.0):
+    block = np.ones(n_mb * 2 ** 20 // 8)
+    time.sleep(hold)
+    del block
+
+def test_stage_keeps_run_peak():
+    with Instrument() as inst:
+        _allocate(200)
+        with inst.stage('empty'):
+            pass
+    assert inst.report()['peak_rss_mb'] >= 200
+
+def test_stage_peak_below_previous_high():
+    # 阶段中的峰值低于进程之前的最高值时，VmHWM 不变，由后台采样得到
+    _allocate(300)
+    with Instrument() as inst:
+        with inst.stage('alloc'):
+            _allocate(100, hold=0.1)
+    assert 90 <= inst.report()['stages']['alloc']['rss_peak_mb'] <= 150
+
+def test_stage_hook_without_instrument_has_no_effect():
+    before = instrument.peak_rss_bytes()
+    with instrument.stage('noop') as record:
+        assert record is None
+    assert instrument.peak_rss_bytes() >= before
@@ -0,0 +1,18 @@
+import pytest
+
+from utils.matchindex import MatchIndex
+
+def test_read_by_id(matches, matches_file, tmp_path):
+    index = MatchIndex(matches_file, str(tmp_path / 'matches.idx.npz'))
+    match_ids = [match['match_id_hash'] for match in matches][::-3]
+    assert [match['match_id_hash'] for match in index.read_by_id(match_ids)] == match_ids
+    assert index.positions([]).tolist() == []
+
+@pytest.mark.parametrize('suffix', ['0', 'extra', 'é'])
+def test_longer_id_is_not_truncated(matches, matches_file, tmp_path, suffix):
+    index = MatchIndex(matches_file, str(tmp_path / 'matches.idx.npz'))
+    match_id = matches[3]['match_id_hash']
+    with pytest.raises(KeyError):
+        index.positions([match_id + suffix])
+    with pytest.raises(KeyError):
+        index.positions([match_id[:-1]])
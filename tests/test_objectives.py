@@ -0,0 +1,82 @@
+import copy
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.extractdata import extract_tables
+from utils.objectives import COUNT_COLUMNS, EVENT_TYPES, FIRST_TIME_COLUMNS, aggregate_objectives
+
+def notebook_counts(objective_data):
+    """ datapreproc_p2 中原来的 iterrows 循环（只统计次数） """
+    n_objectives = sum(col.endswith('-type') for col in objective_data.columns)
+    rows = []
+    for _, row in objective_data.iterrows():
+        stats = {col: 0 for col in COUNT_COLUMNS}
+        for i in range(1, n_objectives + 1):
+            event_type = row[f'objective-{i}-type']
+            player_slot = row.get(f'objective-{i}-player_slot')
+            team = row.get(f'objective-{i}-team')
+            if event_type in EVENT_TYPES:
+                if player_slot is not None and not pd.isna(player_slot):
+                    if 0 <= player_slot <= 4:
+                        stats[f'radiant_{event_type}'] += 1
+                    elif 128 <= player_slot <= 132:
+                        stats[f'dire_{event_type}'] += 1
+                elif team is not None and not pd.isna(team):
+                    if team == 2:
+                        stats[f'radiant_{event_type}'] += 1
+                    elif team == 3:
+                        stats[f'dire_{event_type}'] += 1
+        rows.append(stats)
+    return pd.DataFrame(rows, columns=COUNT_COLUMNS)
+
+def loop_first_times(matches):
+    """ 逐个事件求每支队伍每种事件的首次发生时间 """
+    result = np.full((len(matches), len(FIRST_TIME_COLUMNS)), np.nan)
+    for m, match in enumerate(matches):
+        for objective in match['objectives']:
+            slot, team = objective.get('player_slot'), objective.get('team')
+            if slot is not None:
+                side = 0 if 0 <= slot <= 4 else 1 if 128 <= slot <= 132 else None
+            else:
+                side = {2: 0, 3: 1}.get(team)
+            if objective.get('type') not in EVENT_TYPES or side is None or objective.get('time') is None:
+                continue
+            j = side * len(EVENT_TYPES) + EVENT_TYPES.index(objective['type'])
+            if math.isnan(result[m, j]) or objective['time'] < result[m, j]:
+                result[m, j] = objective['time']
+    return result
+
+@pytest.fixture(scope='module')
+def edge_matches(matches):
+    match = copy.deepcopy(matches[0])
+    match['objectives'] = [
+        {'type': 'CHAT_MESSAGE_TOWER_KILL', 'team': 3, 'time': 900},
+        {'type': 'CHAT_MESSAGE_TOWER_KILL', 'team': 3, 'time': 600},
+        {'type': 'CHAT_MESSAGE_TOWER_KILL', 'player_slot': 5, 'team': 2, 'time': 300},  # player_slot 无效时不看 team
+        {'type': 'CHAT_MESSAGE_ROSHAN_KILL', 'team': 4, 'time': 100},
+        {'type': 'CHAT_MESSAGE_AEGIS', 'player_slot': 0},                              # 没有 time
+        {'type': 'CHAT_MESSAGE_UNKNOWN', 'player_slot': 130, 'time': 50},
+        {'type': 'CHAT_MESSAGE_BARRACKS_KILL', 'player_slot': 132, 'team': 2, 'time': 1200},
+    ]
+    empty = copy.deepcopy(matches[1])
+    empty['objectives'] = []
+    return matches + [match, empty]
+
+def test_vectorized_matches_loops(edge_matches, tmp_path):
+    path = tmp_path / 'matches.jsonl'
+    path.write_text(''.join(json.dumps(match) + '\n' for match in edge_matches))
+    tables = extract_tables(str(path), ['objectives', 'objective_stats'])
+
+    expected = notebook_counts(tables['objectives'])
+    vectorized = aggregate_objectives(tables['objectives'])
+    pd.testing.assert_frame_equal(vectorized[COUNT_COLUMNS], expected, check_dtype=False)
+    pd.testing.assert_frame_equal(tables['objective_stats'][COUNT_COLUMNS], expected, check_dtype=False)
+
+    first_times = loop_first_times(edge_matches)
+    np.testing.assert_array_equal(vectorized[FIRST_TIME_COLUMNS].to_numpy(), first_times)
+    np.testing.assert_array_equal(tables['objective_stats'][FIRST_TIME_COLUMNS].to_numpy(), first_times)
+    assert expected.loc[len(edge_matches) - 2, 'dire_CHAT_MESSAGE_TOWER_KILL'] == 2
@@ -0,0 +1,33 @@
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from utils.optimize import halving_search
+
+@pytest.fixture(scope='module')
+def problem():
+    X, y = make_classification(n_samples=200, n_features=8, random_state=17)
+    cv = StratifiedKFold(n_splits=3, shuffle=True, random_state=17)
+    return RandomForestClassifier(n_estimators=9, random_state=17), X, y, cv
+
+def test_resumed_search_is_cached(problem, tmp_path):
+    rf, X, y, cv = problem
+    store = str(tmp_path / 'search.sqlite')
+    grid = {'max_depth': [2, 4, None]}
+    first = halving_search(rf, grid, X, y, cv, store, min_resource=1, verbose=False)
+    assert sorted(first.results['budget'].unique()) == [1, 3, 9]
+    again = halving_search(rf, grid, X, y, cv, store, min_resource=1, verbose=False)
+    assert again.n_fits == 0 and again.best_params == first.best_params
+
+@pytest.mark.parametrize('kwargs', [
+    {'min_resource': 10, 'max_resource': 9},
+    {'min_resource': 0},
+    {'factor': 1},
+    {'param_grid': []},
+])
+def test_invalid_arguments(problem, tmp_path, kwargs):
+    rf, X, y, cv = problem
+    kwargs = {'param_grid': {'max_depth': [2, 4]}, **kwargs}
+    with pytest.raises(ValueError):
+        halving_search(rf, X=X, y=y, cv=cv, store=str(tmp_path / 'search.sqlite'), verbose=False, **kwargs)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from utils.extractdata import _long_column
+from utils.playerfeatures import compact_dtype
+
+@pytest.mark.parametrize('values, expected', [
+    ([1, 2, 300], 'int16'),
+    ([1.0, 70000.0], 'int32'),
+    ([0.0, 2.0 ** 40], 'int64'),
+    ([0.0, 2.0 ** 70], 'float32'),
+    ([0.0, 1e30], 'float64'),
+    ([1.0, np.inf], 'float32'),
+    ([1.0, np.nan], 'float32'),
+    ([0.5, np.nan], 'float32'),
+    ([0.1, np.nan], 'float64'),
+    ([2.0 ** 24 + 1, np.nan], 'float64'),
+])
+def test_compact_dtype(values, expected):
+    values = np.array(values)
+    dtype = compact_dtype(values)
+    assert dtype == np.dtype(expected)
+    np.testing.assert_array_equal(values.astype(dtype), values)
+
+def test_long_column_is_lossless():
+    column = np.array([0.1, np.nan, 3.0, 2.0 ** 30 + 1])
+    np.testing.assert_array_equal(_long_column(column), column)
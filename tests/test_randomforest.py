@@ -0,0 +1,31 @@
+import numpy as np
+
+from randomforest import PREDICT_CHUNK_SIZE, RandomForestRegressor
+
+def test_max_features_none_uses_all_features():
+    # 只有最后一个特征有用：使用全部特征时每棵树的根节点都按它划分，取 sqrt(9) = 3 个特征时则不一定
+    rng = np.random.default_rng(0)
+    x = rng.random((500, 9))
+    y = (x[:, 8] > 0.5).astype(float)
+    model = RandomForestRegressor(n_estimators=8, max_depth=2, n_jobs=1, random_state=0)
+    model.fit(x, y)
+    assert (model.forest.feature[model.forest.roots] == 8).all()
+
+def test_parallel_predict_reuses_pool():
+    rng = np.random.default_rng(1)
+    x = rng.random((300, 4))
+    y = x @ [1.0, -2.0, 0.5, 0.0]
+    model = RandomForestRegressor(n_estimators=4, max_depth=4, n_bins=16, n_jobs=2, random_state=1)
+    model.fit(x, y)
+
+    x_test = rng.random((2 * PREDICT_CHUNK_SIZE + 1, 4))
+    expected = model.forest.predict(x_test)
+    np.testing.assert_array_equal(model.predict(x_test), expected)
+    pool = model._pool[1]
+    np.testing.assert_array_equal(model.predict(x_test[::-1]), expected[::-1])
+    assert model._pool[1] is pool
+
+    model.close()
+    assert model._pool is None
+    np.testing.assert_array_equal(model.predict(x_test[:10]), expected[:10])  # 样本较少时在当前进程中预测
+    assert model._pool is None
@@ -0,0 +1,40 @@
+import os
+
+import pandas as pd
+import pytest
+
+from utils.extractdata import TABLES, extract_tables
+from utils.readjsonl import map_matches, read_matches, split_shards
+
+def _match_id(match):
+    return match['match_id_hash']
+
+@pytest.mark.parametrize('n_shards', [1, 2, 3, 7, 19, 20, 50])
+def test_split_shards_cover_lines(matches_file, n_shards):
+    with open(matches_file, 'rb') as fin:
+        data = fin.read()
+    line_starts = {0} | {i + 1 for i, byte in enumerate(data) if byte == ord('\n')}
+    shards = split_shards(matches_file, n_shards)
+    assert shards[0][0] == 0 and shards[-1][1] == os.path.getsize(matches_file)
+    assert all(end == start for (_, end), (start, _) in zip(shards, shards[1:]))
+    assert all(start in line_starts for start, _ in shards)
+    assert len(shards) <= n_shards
+
+@pytest.mark.parametrize('paths', [None, ['match_id_hash', 'players.kills', 'teamfights.start']])
+def test_sharded_read_matches_serial(matches_file, paths):
+    serial = list(read_matches(matches_file, paths=paths))
+    assert list(read_matches(matches_file, n_jobs=2, paths=paths)) == serial
+
+    unordered = map_matches(_match_id, matches_file, n_jobs=2, n_shards=7, ordered=False)
+    assert sorted(unordered) == sorted(match['match_id_hash'] for match in serial)
+
+def test_sharded_extract_tables_matches_serial(matches_file):
+    serial = extract_tables(matches_file)
+    sharded = extract_tables(matches_file, n_jobs=2)
+    for name in TABLES:
+        pd.testing.assert_frame_equal(sharded[name], serial[name])
+
+def test_byte_range(matches_file):
+    shards = split_shards(matches_file, 3)
+    parts = [list(read_matches(matches_file, byte_range=shard)) for shard in shards]
+    assert sum(parts, []) == list(read_matches(matches_file))
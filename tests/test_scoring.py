@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from utils.extractdata import extract_tables
+from utils.objectives import COUNT_COLUMNS, aggregate_objectives
+from utils.playerfeatures import PlayerFeatures
+from utils.readjsonl import read_matches
+from utils.scoring import (LOG_TRANSFORM_FEATURES, CLIP_FEATURES, NORMALIZE_FEATURES, RAW_COLUMNS,
+                           SCORING_PATHS, STANDARDIZE_FEATURES, MatchFeaturizer)
+
+def notebook_players(players_wide):
+    """ datapreproc_p2 中 player 清洗的各个单元格 """
+    players = PlayerFeatures.from_wide(players_wide)
+    players.add_xp()
+    players.add_kda()
+    df = players.to_frame(team_sums=['kills'])
+    columns = lambda feature: [f'players-{i}-{feature}' for i in range(1, 11) if f'players-{i}-{feature}' in df.columns]
+    for feature in LOG_TRANSFORM_FEATURES:
+        for col in columns(feature):
+            df[col] = np.log1p(df[col])
+    for feature in CLIP_FEATURES:
+        for col in columns(feature):
+            q1, q3 = df[col].quantile(0.25), df[col].quantile(0.75)
+            df[col] = df[col].clip(lower=q1 - 1.5 * (q3 - q1), upper=q3 + 1.5 * (q3 - q1))
+    for feature in NORMALIZE_FEATURES:
+        for col in columns(feature):
+            df[[col]] = MinMaxScaler().fit_transform(df[[col]])
+    for feature in STANDARDIZE_FEATURES:
+        for col in columns(feature):
+            df[[col]] = StandardScaler().fit_transform(df[[col]])
+    return df
+
+def notebook_objectives(objectives_wide):
+    df = aggregate_objectives(objectives_wide)[COUNT_COLUMNS].astype('int64')
+    df[df.columns] = MinMaxScaler().fit_transform(df)
+    return df
+
+def notebook_teamfights(teamfights_wide, game_time):
+    """ datapreproc_p2 中 Teamfight 清洗的逐列循环（最多 16 次团战），以及之后的截断和缩放 """
+    result = pd.DataFrame()
+    durations = [teamfights_wide[f'teamfights-{i}-end'] - teamfights_wide[f'teamfights-{i}-start']
+                 for i in range(1, 17) if f'teamfights-{i}-start' in teamfights_wide.columns]
+    result['total_teamfight_time'] = pd.concat(durations, axis=1).sum(axis=1)
+    result['teamfight_time_ratio'] = (result['total_teamfight_time'] / game_time).fillna(0)
+    for metric in ['damage', 'gold_delta', 'xp_delta']:
+        for team, player_range in {'Radiant': range(1, 6), 'Dire': range(6, 11)}.items():
+            team_max, team_min, team_avg = [], [], []
+            for i in range(1, 17):
+                cols = [f'teamfights-{i}-player-{p}-{metric}' for p in player_range
+                        if f'teamfights-{i}-player-{p}-{metric}' in teamfights_wide.columns]
+                if cols:
+                    team_max.append(teamfights_wide[cols].max(axis=1))
+                    team_min.append(teamfights_wide[cols].min(axis=1))
+                    team_avg.append(teamfights_wide[cols].mean(axis=1))
+            result[f'{team}_{metric}_max'] = pd.concat(team_max, axis=1).max(axis=1)
+            result[f'{team}_{metric}_min'] = pd.concat(team_min, axis=1).min(axis=1)
+            result[f'{team}_{metric}_avg'] = pd.concat(team_avg, axis=1).mean(axis=1)
+
+    result['teamfight_time_ratio'] = result['teamfight_time_ratio'].apply(lambda x: 1 if x > 1 else x)
+    scaled = result.copy()
+    for col in result.columns:
+        if 'gold_delta' in col and ('min' in col or 'avg' in col):
+            scaled[col] = StandardScaler().fit_transform(result[[col]])
+        elif 'damage' in col or 'gold_delta' in col or 'xp' in col:
+            scaled[col] = MinMaxScaler().fit_transform(result[[col]])
+    return scaled
+
+def test_featurizer_matches_notebook(matches_file):
+    tables = extract_tables(matches_file, ['main', 'players', 'objectives', 'teamfights'])
+    main = tables['main'].drop(columns='match_id_hash')
+    expected = pd.concat([main, notebook_players(tables['players']), notebook_objectives(tables['objectives']),
+                          notebook_teamfights(tables['teamfights'], main['game_time'])], axis=1)
+    assert list(expected.columns) == RAW_COLUMNS
+
+    matches = list(read_matches(matches_file, paths=SCORING_PATHS))
+    featurizer = MatchFeaturizer().fit(matches)
+    actual = featurizer.batch(matches)
+    # notebook 中 PlayerFeatures 的 int16 列取对数后为 float32，因此只能在 float32 的精度内相等
+    np.testing.assert_allclose(actual, expected.to_numpy('float64'), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(featurizer(matches[3]), actual[3])
+
+def test_featurizer_save_load(matches_file, tmp_path):
+    matches = list(read_matches(matches_file, paths=SCORING_PATHS))
+    columns = RAW_COLUMNS[::7]
+    featurizer = MatchFeaturizer(columns).fit(matches)
+    featurizer.save(tmp_path / 'featurizer.npz')
+    loaded = MatchFeaturizer.load(tmp_path / 'featurizer.npz')
+    assert loaded.columns == columns
+    np.testing.assert_array_equal(loaded.batch(matches), featurizer.batch(matches))
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from utils.extractdata import TABLES, extract_tables
+from utils.tablecache import cached_extract, load_table, save_table
+
+def test_cached_extract_equals_extract_tables(matches_file, tmp_path):
+    expected = extract_tables(matches_file)
+    cache_dir = str(tmp_path / 'cache')
+    for _ in range(2):  # 第一次未命中（提取后保存再加载），第二次命中
+        cached = cached_extract(matches_file, cache_dir=cache_dir)
+        for name in TABLES:
+            pd.testing.assert_frame_equal(cached[name], expected[name])
+
+def test_column_kinds_round_trip(tmp_path):
+    df = pd.DataFrame({
+        'int16':    np.array([1, -2, 3], dtype='int16'),
+        'integral': np.array([1.0, 2.0, np.nan], dtype='float32'),
+        'float':    [0.1, np.nan, 2.5],
+        'bool':     [True, False, True],
+        'Int16':    pd.array([1, None, 3], dtype='Int16'),
+        'boolean':  pd.array([True, None, False], dtype='boolean'),
+        'str':      pd.array(['a', None, 'ß'], dtype='str'),
+        'object':   pd.Series(['a', None, 'c'], dtype=object),
+        'lists':    pd.Series([[{'x': 1}], [], None], dtype=object),
+        'mixed':    pd.Series([1, 'a', np.nan], dtype=object),
+        'none':     pd.Series([None, None, None], dtype=object),
+    })
+    save_table(df, str(tmp_path / 'table'))
+    for mmap_mode in ('r', None):
+        pd.testing.assert_frame_equal(load_table(str(tmp_path / 'table'), mmap_mode=mmap_mode), df)
+    pd.testing.assert_frame_equal(load_table(str(tmp_path / 'table'), ['lists', 'int16']), df[['lists', 'int16']])
@@ -0,0 +1,63 @@
+import copy
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.extractdata import extract_tables
+from utils.teamfights import BUYBACK_COLUMNS, METRICS, TEAMFIGHT_FEATURES, teamfight_rollups, teamfight_row
+
+def notebook_rollups(teamfights_wide, game_time):
+    """ datapreproc_p2 中由 teamfights 宽表逐列循环计算的团战统计（不限团战次数、不缩放） """
+    n_fights = sum(col.endswith('-start') for col in teamfights_wide.columns)
+    result = pd.DataFrame(index=teamfights_wide.index)
+    durations = [teamfights_wide[f'teamfights-{i}-end'] - teamfights_wide[f'teamfights-{i}-start']
+                 for i in range(1, n_fights + 1)]
+    result['total_teamfight_time'] = pd.concat(durations, axis=1).sum(axis=1) if durations else 0.0
+    result['teamfight_time_ratio'] = (result['total_teamfight_time'] / game_time).fillna(0)
+    for metric in METRICS:
+        for team, player_range in {'Radiant': range(1, 6), 'Dire': range(6, 11)}.items():
+            team_max, team_min, team_avg = [], [], []
+            for i in range(1, n_fights + 1):
+                cols = [f'teamfights-{i}-player-{p}-{metric}' for p in player_range]
+                team_max.append(teamfights_wide[cols].max(axis=1))
+                team_min.append(teamfights_wide[cols].min(axis=1))
+                team_avg.append(teamfights_wide[cols].mean(axis=1))
+            result[f'{team}_{metric}_max'] = pd.concat(team_max, axis=1).max(axis=1)
+            result[f'{team}_{metric}_min'] = pd.concat(team_min, axis=1).min(axis=1)
+            result[f'{team}_{metric}_avg'] = pd.concat(team_avg, axis=1).mean(axis=1)
+    for team, player_range in {'Radiant': range(1, 6), 'Dire': range(6, 11)}.items():
+        cols = [f'teamfights-{i}-player-{p}-buybacks' for i in range(1, n_fights + 1) for p in player_range]
+        result[f'{team}_buybacks'] = teamfights_wide[cols].sum(axis=1)
+    return result
+
+@pytest.fixture(scope='module')
+def edge_matches(matches):
+    fights = copy.deepcopy(next(match for match in matches if len(match['teamfights']) >= 3))
+    fights['teamfights'][0]['players'] = []                 # 没有玩家数据的团战
+    fights['teamfights'][1]['players'][2]['damage'] = None  # 玩家字段为空值
+    fights['teamfights'][2]['players'] = fights['teamfights'][2]['players'][:5]  # 只有 Radiant 的数据
+    no_fights = copy.deepcopy(matches[0])
+    no_fights['teamfights'] = []
+    # 最后两局没有团战，长格式表中没有它们的行
+    return matches + [fights, no_fights, no_fights]
+
+def test_rollups_match_notebook_loop(edge_matches, tmp_path):
+    path = tmp_path / 'matches.jsonl'
+    path.write_text(''.join(json.dumps(match) + '\n' for match in edge_matches))
+    tables = extract_tables(str(path), ['main', 'teamfights', 'teamfights_long'])
+    game_time = tables['main']['game_time']
+
+    rollups = teamfight_rollups(tables['teamfights_long'], len(edge_matches), game_time)
+    expected = notebook_rollups(tables['teamfights'], game_time)
+    pd.testing.assert_frame_equal(rollups[TEAMFIGHT_FEATURES + BUYBACK_COLUMNS], expected, check_dtype=False)
+    np.testing.assert_array_equal(rollups['teamfights_number'], tables['main']['teamfights_number'])
+
+    rows = np.array([teamfight_row(match) for match in edge_matches])
+    np.testing.assert_allclose(rows, rollups[TEAMFIGHT_FEATURES].to_numpy(), rtol=1e-12)
+
+def test_n_matches_too_small(matches_file):
+    long_df = extract_tables(matches_file, ['teamfights_long'])['teamfights_long']
+    with pytest.raises(ValueError):
+        teamfight_rollups(long_df, n_matches=int(long_df['match'].max()))
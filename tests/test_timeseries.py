@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from utils.extractdata import extract_player_series
+from utils.timeseries import PlayerSeries, TeamSeries
+
+@pytest.fixture(scope='module')
+def team_series(matches_file, tmp_path_factory):
+    series_dir = str(tmp_path_factory.mktemp('series'))
+    extract_player_series(matches_file, series_dir)
+    return TeamSeries.from_player_series(PlayerSeries(series_dir))
+
+def test_index_round_trip(team_series, matches):
+    match_ids = [match['match_id_hash'] for match in matches]
+    np.testing.assert_array_equal(team_series.index(match_ids[::-1]), np.arange(len(matches))[::-1])
+
+def test_unknown_match_id(team_series, matches):
+    with pytest.raises(KeyError):
+        team_series.index([matches[0]['match_id_hash'], 'not-a-match'])
+
+@pytest.mark.parametrize('match', [-1, 20])
+def test_out_of_range_match(team_series, match):
+    # -1 曾经被当作最后一局比赛
+    with pytest.raises(IndexError):
+        team_series.features([0, match], [600, 600])